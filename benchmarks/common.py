@@ -0,0 +1,74 @@
+"""Helpers shared by the benchmarks: latency statistics and JSON results.
+
+Benchmarks run in process against the database given by DATABASE_URI (a SQLite file or a local PostgreSQL). Use a
+scratch database, the fleet generator deletes every row.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SOURCE_DIRECTORY)
+
+# Background workers would compete with the measured requests, the benchmarks run recalibrations themselves
+os.environ.setdefault('RECALIBRATION_WORKER', '0')
+os.environ.setdefault('RETENTION_WORKER', '0')
+os.environ.setdefault('EVENT_SCHEDULER', '0')
+
+
+def percentile(values, fraction):
+    """Returns the fraction percentile of sorted values, interpolating between closest ranks"""
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Returns throughput and latency statistics, in milliseconds, of latencies in seconds measured over elapsed
+    seconds"""
+    values = sorted(latency * 1000 for latency in latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput': len(values) / elapsed if elapsed else None,
+        'mean': statistics.mean(values) if values else None,
+        'p50': percentile(values, 0.5),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'max': values[-1] if values else None,
+    }
+
+
+def get_revision():
+    """Returns git revision of the working tree, marked dirty if it has uncommitted changes, or None"""
+    try:
+        revision = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=SOURCE_DIRECTORY,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision or None
+
+
+def write_results(path, benchmark, parameters, results):
+    """Writes results of benchmark run with parameters to JSON file at path, along with the environment they were
+    measured in"""
+    from config import DATABASE_URI
+    document = {
+        'benchmark': benchmark,
+        'created': datetime.now().isoformat(),
+        'revision': get_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'database': DATABASE_URI.split(':', 1)[0],
+        'parameters': parameters,
+        'results': results,
+    }
+    with open(path, 'w') as file:
+        json.dump(document, file, indent=4)
@@ -0,0 +1,65 @@
+"""Compares two JSON results of the same benchmark and reports regressions.
+
+Latencies (p50, p95, p99 and marshal times) that grew by more than the threshold, or throughputs that fell by more
+than it, are regressions. Exits with status 1 if there is any.
+
+Usage: python benchmarks/compare.py baseline.json current.json [--threshold 0.1]
+"""
+import argparse
+import json
+import sys
+
+
+# Metric name and whether a higher value is better
+METRICS = {
+    'throughput': True,
+    'p50': False,
+    'p95': False,
+    'p99': False,
+    'microseconds': False,
+}
+
+
+def compare(baseline, current, threshold):
+    """Returns list of (case, metric, baseline value, current value, relative change, regressed) of cases of both
+    results"""
+    rows = []
+    for case, values in current['results'].items():
+        if case not in baseline['results']:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            before = baseline['results'][case].get(metric)
+            after = values.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            regressed = -change > threshold if higher_is_better else change > threshold
+            rows.append((case, metric, before, after, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change tolerated, default 10%%')
+    arguments = parser.parse_args()
+
+    with open(arguments.baseline) as file:
+        baseline = json.load(file)
+    with open(arguments.current) as file:
+        current = json.load(file)
+    if baseline['benchmark'] != current['benchmark']:
+        parser.error(f"can not compare {baseline['benchmark']} results with {current['benchmark']} results")
+    print(f"{baseline['revision']} -> {current['revision']}")
+    if baseline['database'] != current['database']:
+        print(f"Warning: results measured on {baseline['database']} and {current['database']}")
+    rows = compare(baseline, current, arguments.threshold)
+    for case, metric, before, after, change, regressed in rows:
+        print(f"{case} {metric}: {before:.3f} -> {after:.3f} ({change:+.1%}){' REGRESSION' if regressed else ''}")
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
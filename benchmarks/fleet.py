@@ -0,0 +1,108 @@
+"""Synthetic sensor fleet generator.
+
+Creates one process per sensor, with sensors of sequential mac addresses, a few calibrations each and a finished and
+an open SENSOR event per sensor, then imports readings of every sensor at a fixed interval, split between both events.
+Readings are stored through the historical importer, so densities and event summaries are computed as in production.
+Every existing row is deleted first: use a scratch database.
+
+Usage: DATABASE_URI=... python benchmarks/fleet.py [--sensors 20] [--measurements 2000]
+"""
+import argparse
+import math
+import random
+from datetime import datetime, timedelta
+
+import common  # noqa: F401
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from config import DATABASE_URI  # noqa: E402
+from models import db, Process, Sensor, DensityCalibration, Event, EventType  # noqa: E402
+from summary import new_summary  # noqa: E402
+from importer import import_readings  # noqa: E402
+import migrate  # noqa: E402
+
+
+FLEET_START = datetime(2020, 1, 1)
+FLEET_INTERVAL = timedelta(minutes=15)
+CALIBRATIONS = 3
+
+
+def mac_address(number):
+    """Returns mac address of sensor number"""
+    digits = f'{number:012x}'
+    return ':'.join(digits[index:index + 2] for index in range(0, 12, 2))
+
+
+def clear(session):
+    """Deletes every row of every model table"""
+    for table in reversed(db.metadata.sorted_tables):
+        session.execute(table.delete())
+    session.commit()
+
+
+def generate_readings(mac, measurements, interval, seed):
+    """Returns list of readings of a fermentation: inclination falls as sugar is consumed, temperature oscillates
+    around the setpoint"""
+    generator = random.Random(seed)
+    readings = []
+    for index in range(measurements):
+        progress = index / max(measurements - 1, 1)
+        readings.append({
+            'sensor_mac_address': mac,
+            'inclination': 60 - 25 * (1 - math.exp(-4 * progress)) + generator.gauss(0, 0.3),
+            'temperature': 19 + math.sin(index / 48) + generator.gauss(0, 0.1),
+            'battery': 4.1 - progress * 0.3,
+            'timestamp': FLEET_START + index * interval,
+        })
+    return readings
+
+
+def generate_fleet(session, sensors, measurements, interval=FLEET_INTERVAL):
+    """Creates fleet of sensors, each with measurements readings taken every interval. Returns dict of lists of created
+    ids by table name."""
+    clear(session)
+    duration = measurements * interval
+    half = FLEET_START + measurements // 2 * interval
+    created = {'process': [], 'sensor': [], 'event': []}
+    for number in range(1, sensors + 1):
+        process = Process(name=f'process {number}')
+        sensor = Sensor(mac_address=mac_address(number))
+        session.add_all([process, sensor])
+        for index in range(CALIBRATIONS):
+            session.add(DensityCalibration(
+                coefficient=0.0017 + index * 0.00001,
+                offset=0.9592 - index * 0.0001,
+                timestamp=FLEET_START + duration * index / CALIBRATIONS,
+                sensor=sensor,
+            ))
+        for name, start, finish in (('finished', FLEET_START, half), ('open', half, None)):
+            session.add(Event(name=f'{name} {number}', start=start, finish=finish, event_type=EventType.SENSOR,
+                              process=process, sensor=sensor, summary=new_summary()))
+        session.flush()
+        created['process'].append(process.id)
+        created['sensor'].append(sensor.id)
+        created['event'] += [event.id for event in sensor.events]
+    session.commit()
+    for number in range(1, sensors + 1):
+        import_readings(session, generate_readings(mac_address(number), measurements, interval, number))
+        session.commit()
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sensors', type=int, default=20)
+    parser.add_argument('--measurements', type=int, default=2000, help='measurements per sensor')
+    arguments = parser.parse_args()
+
+    from setup import create_app
+    migrate.migrate(create_engine(DATABASE_URI))
+    with create_app(workers=False).app_context():
+        created = generate_fleet(db.session, arguments.sensors, arguments.measurements)
+    print(f"Created {len(created['sensor'])} sensors, {len(created['event'])} events and "
+          f"{arguments.sensors * arguments.measurements} measurements")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Compares query plans and timings of the ingest and list access paths without and with the hot path indexes.
+
+Seeds a synthetic dataset into the PostgreSQL database given by DATABASE_URI, drops the indexes created by migration
+0002, runs every query with EXPLAIN ANALYZE, creates the indexes again and repeats. Use a scratch database: the schema
+is migrated and tables are truncated when seeding.
+
+Usage: DATABASE_URI=postgresql+psycopg2://... python benchmarks/index_plans.py [--sensors 50] [--measurements 20000]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+
+from config import DATABASE_URI  # noqa: E402
+import migrate  # noqa: E402
+
+
+INDEX_MIGRATION = '0002'
+
+QUERIES = {
+    'open_sensor_event': (
+        "SELECT * FROM event WHERE event_type = 'SENSOR' AND id_sensor = :id_sensor AND finish IS NULL"
+    ),
+    'latest_calibration': (
+        "SELECT * FROM density_calibration WHERE id_sensor = :id_sensor ORDER BY timestamp DESC LIMIT 1"
+    ),
+    'orphan_measurements': (
+        "SELECT * FROM measurement WHERE id_event IS NULL AND id_sensor = :id_sensor AND timestamp > :since"
+    ),
+    'sensor_measurements_range': (
+        "SELECT * FROM measurement WHERE id_sensor = :id_sensor AND timestamp >= :since AND timestamp < :until"
+    ),
+    'event_measurements': (
+        "SELECT * FROM measurement WHERE id_event = :id_event ORDER BY timestamp"
+    ),
+    'process_events': (
+        "SELECT * FROM event WHERE id_process = :id_process"
+    ),
+}
+
+
+def seed(connection, sensors, measurements):
+    """Fills tables with sensors, calibrations, finished and open SENSOR events and measurements, one every minute,
+    of which the last tenth are not attached to any event"""
+    connection.execute(text(
+        "TRUNCATE measurement, density_calibration, event, sensor, process RESTART IDENTITY CASCADE"
+    ))
+    connection.execute(text("INSERT INTO process (name) SELECT 'process ' || n FROM generate_series(1, :n) n"),
+                       {'n': sensors})
+    connection.execute(text(
+        "INSERT INTO sensor (mac_address) "
+        "SELECT lpad(to_hex(n), 12, '0') FROM generate_series(1, :n) n"
+    ), {'n': sensors})
+    connection.execute(text(
+        "INSERT INTO density_calibration (coefficient, \"offset\", timestamp, id_sensor) "
+        "SELECT 0.0017, 0.9592, timestamp '2020-01-01' + c * interval '30 days', s "
+        "FROM generate_series(1, :n) s, generate_series(0, 4) c"
+    ), {'n': sensors})
+    connection.execute(text(
+        "INSERT INTO event (name, start, finish, event_type, id_process, id_sensor) "
+        "SELECT 'finished ' || s, timestamp '2020-01-01', timestamp '2020-01-01' + :half * interval '1 minute', "
+        "'SENSOR', s, s FROM generate_series(1, :n) s"
+    ), {'n': sensors, 'half': measurements // 2})
+    connection.execute(text(
+        "INSERT INTO event (name, start, event_type, id_process, id_sensor) "
+        "SELECT 'open ' || s, timestamp '2020-01-01' + :half * interval '1 minute', 'SENSOR', s, s "
+        "FROM generate_series(1, :n) s"
+    ), {'n': sensors, 'half': measurements // 2})
+    connection.execute(text(
+        "INSERT INTO measurement (inclination, temperature, density, battery, timestamp, id_sensor, id_event) "
+        "SELECT 30 + random() * 40, 18 + random() * 4, 1.0 + random() * 0.06, 90, "
+        "timestamp '2020-01-01' + m * interval '1 minute', s, "
+        "CASE WHEN m < :half THEN s WHEN m < :attached THEN :sensors + s END "
+        "FROM generate_series(1, :n) s, generate_series(0, :m - 1) m"
+    ), {'n': sensors, 'm': measurements, 'sensors': sensors, 'half': measurements // 2,
+        'attached': measurements * 9 // 10})
+
+
+def explain(connection, sql, parameters, repeat):
+    """Returns plan of query and median execution time in milliseconds over repeat runs"""
+    times = []
+    plan = None
+    for _ in range(repeat):
+        result = connection.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"), parameters).scalar()
+        if isinstance(result, str):
+            result = json.loads(result)
+        plan = result[0]
+        times.append(plan['Execution Time'])
+    return plan['Plan'], statistics.median(times)
+
+
+def summarize_plan(plan):
+    """Returns short description of plan nodes, e.g. Limit > Index Scan Backward on ix_..."""
+    node = plan['Node Type']
+    if 'Index Name' in plan:
+        node += f" on {plan['Index Name']}"
+    elif 'Relation Name' in plan:
+        node += f" on {plan['Relation Name']}"
+    children = [summarize_plan(child) for child in plan.get('Plans', [])]
+    return node + (f" > {', '.join(children)}" if children else '')
+
+
+def run_queries(engine, parameters, repeat):
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+    results = {}
+    with engine.connect() as connection:
+        for name, sql in QUERIES.items():
+            plan, milliseconds = explain(connection, sql, parameters, repeat)
+            results[name] = {'plan': summarize_plan(plan), 'milliseconds': milliseconds}
+    return results
+
+
+def index_statements():
+    migration = next(migration for migration in migrate.get_migrations() if migration.version == INDEX_MIGRATION)
+    with open(migration.path) as file:
+        return migrate._split_statements(file.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sensors', type=int, default=50)
+    parser.add_argument('--measurements', type=int, default=20000, help='measurements per sensor')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='file to write JSON results to')
+    arguments = parser.parse_args()
+
+    engine = create_engine(DATABASE_URI)
+    if engine.dialect.name != 'postgresql':
+        parser.error('index benchmark requires PostgreSQL')
+    migrate.migrate(engine)
+    with engine.begin() as connection:
+        seed(connection, arguments.sensors, arguments.measurements)
+
+    id_sensor = arguments.sensors // 2 or 1
+    parameters = {
+        'id_sensor': id_sensor,
+        'id_event': arguments.sensors + id_sensor,
+        'id_process': id_sensor,
+        'since': datetime(2020, 1, 4),
+        'until': datetime(2020, 1, 5),
+    }
+    statements = index_statements()
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        for statement in statements:
+            index = statement.split('IF NOT EXISTS')[1].split()[0]
+            connection.execute(text(f"DROP INDEX IF EXISTS {index}"))
+    before = run_queries(engine, parameters, arguments.repeat)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        for statement in statements:
+            # Indexes of a partitioned table can not be created concurrently
+            connection.exec_driver_sql(statement.replace(' CONCURRENTLY', ''))
+    after = run_queries(engine, parameters, arguments.repeat)
+
+    results = {
+        'sensors': arguments.sensors,
+        'measurements_per_sensor': arguments.measurements,
+        'queries': {name: {'before': before[name], 'after': after[name]} for name in QUERIES},
+    }
+    for name, result in results['queries'].items():
+        print(f"{name}: {result['before']['milliseconds']:.3f} ms -> {result['after']['milliseconds']:.3f} ms")
+        print(f"    before: {result['before']['plan']}")
+        print(f"    after:  {result['after']['plan']}")
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Load driver of the ingest and read paths.
+
+Generates a synthetic fleet (see fleet.py), then runs each scenario with concurrent clients calling the app in process
+through the Flask test client, and reports throughput and latency percentiles. Calibration recomputes post a
+calibration and run the recalibration job it schedules, timing both. Set RESPONSE_CACHE_SIZE=0 to measure reads
+without the response cache.
+
+Usage: DATABASE_URI=... python benchmarks/load.py [--sensors 20] [--measurements 2000] [--requests 500]
+       [--concurrency 4] [--scenario measurement_post ...] [--output results.json]
+"""
+import argparse
+import random
+import threading
+import time
+from datetime import timedelta
+
+import common
+
+from sqlalchemy import create_engine, func  # noqa: E402
+
+from config import DATABASE_URI  # noqa: E402
+from models import db, Measurement, RecalibrationJob  # noqa: E402
+import recalibration  # noqa: E402
+import migrate  # noqa: E402
+from fleet import FLEET_START, FLEET_INTERVAL, generate_fleet, mac_address  # noqa: E402
+
+
+def measurement_post(client, fleet, generator):
+    return client.post('/measurements/', json={
+        'sensor_mac_address': mac_address(generator.randrange(len(fleet['sensor'])) + 1),
+        'inclination': generator.uniform(30, 60),
+        'temperature': generator.uniform(18, 22),
+        'battery': 4,
+    })
+
+
+def measurement_list(client, fleet, generator):
+    return client.get(f"/measurements/?id_sensor={generator.choice(fleet['sensor'])}&limit=100")
+
+
+def measurement_detail(client, fleet, generator):
+    return client.get(f"/measurements/{generator.randint(*fleet['measurement'])}")
+
+
+def event_list(client, fleet, generator):
+    return client.get(f"/events/?id_process={generator.choice(fleet['process'])}")
+
+
+def event_detail(client, fleet, generator):
+    return client.get(f"/events/{generator.choice(fleet['event'])}")
+
+
+def calibration_recompute(client, fleet, generator):
+    """Posts calibration in the measured history of a sensor and runs the recalibration job it schedules"""
+    response = client.post('/calibrations/', json={
+        'coefficient': generator.uniform(0.0016, 0.0018),
+        'offset': generator.uniform(0.958, 0.96),
+        'timestamp': (FLEET_START + timedelta(hours=generator.randrange(fleet['hours']))).isoformat(),
+        'id_sensor': generator.choice(fleet['sensor']),
+    })
+    if response.status_code == 201:
+        job = db.session.get(RecalibrationJob, int(response.headers['X-Recalibration-Job']))
+        recalibration.run_job(db.session, job)
+        db.session.remove()
+    return response
+
+
+SCENARIOS = {
+    'measurement_post': measurement_post,
+    'measurement_list': measurement_list,
+    'measurement_detail': measurement_detail,
+    'event_list': event_list,
+    'event_detail': event_detail,
+    'calibration_recompute': calibration_recompute,
+}
+
+
+def run_scenario(app, scenario, fleet, requests, concurrency, seed):
+    """Runs requests calls of scenario split between concurrency client threads. Returns summary of latencies."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client_thread(index, count):
+        generator = random.Random(seed + index)
+        client = app.test_client()
+        thread_latencies = []
+        thread_errors = 0
+        with app.app_context():
+            for _ in range(count):
+                started = time.perf_counter()
+                response = scenario(client, fleet, generator)
+                thread_latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    thread_errors += 1
+        with lock:
+            latencies.extend(thread_latencies)
+            errors.append(thread_errors)
+
+    threads = [
+        threading.Thread(target=client_thread, args=(index, requests // concurrency + (index < requests % concurrency)))
+        for index in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return common.summarize(latencies, time.perf_counter() - started, sum(errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sensors', type=int, default=20)
+    parser.add_argument('--measurements', type=int, default=2000, help='measurements per sensor')
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--recalibrations', type=int, default=20, help='calibration recomputes')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--scenario', action='append', choices=tuple(SCENARIOS), help='scenarios to run, default all')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='file to write JSON results to')
+    arguments = parser.parse_args()
+
+    from flask_restful import Api
+    from setup import create_app
+    from api import add_resources
+    migrate.migrate(create_engine(DATABASE_URI))
+    # Recalibration jobs are run by the timed scenario rather than a background worker
+    app = create_app(workers=False)
+    add_resources(Api(app))
+    with app.app_context():
+        fleet = generate_fleet(db.session, arguments.sensors, arguments.measurements)
+        fleet['measurement'] = db.session.query(func.min(Measurement.id), func.max(Measurement.id)).one()
+        fleet['hours'] = int(arguments.measurements * FLEET_INTERVAL / timedelta(hours=1))
+        db.session.remove()
+
+    results = {}
+    for name in arguments.scenario or SCENARIOS:
+        requests = arguments.recalibrations if name == 'calibration_recompute' else arguments.requests
+        concurrency = min(arguments.concurrency, requests)
+        results[name] = run_scenario(app, SCENARIOS[name], fleet, requests, concurrency, arguments.seed)
+        result = results[name]
+        print(f"{name}: {result['throughput']:.1f} req/s, p50 {result['p50']:.2f} ms, p95 {result['p95']:.2f} ms, "
+              f"p99 {result['p99']:.2f} ms, {result['errors']} errors")
+    if arguments.output:
+        parameters = {key: value for key, value in vars(arguments).items() if key != 'output'}
+        common.write_results(arguments.output, 'load', parameters, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Microbenchmarks of marshalling instances with the endpoint serializers.
+
+Builds transient model instances, without database, and times the compiled serializers used by the endpoints, and
+flask_restful marshal for reference, with the instance and detailed serializers of each endpoint, including lists of
+measurements and events nesting their measurements.
+
+Usage: python benchmarks/serializers.py [--measurements 1000] [--repeat 5] [--output results.json]
+"""
+import argparse
+import os
+import timeit
+from datetime import timedelta
+
+# Serializers do not touch the database, but config requires a database URI
+os.environ.setdefault('DATABASE_URI', 'sqlite://')
+
+import common  # noqa: E402
+
+from flask_restful import marshal  # noqa: E402
+
+from models import Process, Sensor, Measurement, DensityCalibration, Event, EventType  # noqa: E402
+from summary import new_summary  # noqa: E402
+from api import event_endpoint, event_summary_endpoint, measurement_endpoint, process_endpoint, sensor_endpoint, \
+    density_calibration_endpoint  # noqa: E402
+from api.serializers import get_serializer  # noqa: E402
+from fleet import FLEET_START, FLEET_INTERVAL, generate_readings, mac_address  # noqa: E402
+
+
+def build_instances(measurements):
+    """Returns dict of transient instances: a process with a SENSOR event of measurements measurements, its sensor
+    with calibrations and the event summary"""
+    sensor = Sensor(id=1, mac_address=mac_address(1))
+    for index in range(3):
+        sensor.calibrations.append(DensityCalibration(id=index + 1, coefficient=0.0017, offset=0.9592,
+                                                      timestamp=FLEET_START + index * timedelta(days=1), id_sensor=1))
+    process = Process(id=1, name='process 1', description='benchmark')
+    event = Event(id=1, name='event 1', start=FLEET_START, event_type=EventType.SENSOR, id_process=1, id_sensor=1,
+                  process=process, sensor=sensor)
+    for index, reading in enumerate(generate_readings(sensor.mac_address, measurements, FLEET_INTERVAL, 1)):
+        event.measurements.append(Measurement(
+            id=index + 1,
+            inclination=reading['inclination'],
+            temperature=reading['temperature'],
+            density=Measurement.calculate_density(reading['inclination'], 0.0017, 0.9592),
+            battery=round(reading['battery']),
+            timestamp=reading['timestamp'],
+            id_sensor=1,
+            id_event=1,
+        ))
+    summary = new_summary(event.measurements)
+    summary.id_event = 1
+    return {'process': process, 'sensor': sensor, 'event': event, 'summary': summary}
+
+
+def get_cases(instances):
+    """Returns dict of (object, serializer) to marshal by case name"""
+    event = instances['event']
+    return {
+        'measurement': (event.measurements[0], measurement_endpoint.instance_serializer),
+        'measurement_list': (event.measurements, measurement_endpoint.instance_serializer),
+        'event': (event, event_endpoint.instance_serializer),
+        'event_detailed': (event, event_endpoint.detailed_serializer),
+        'process': (instances['process'], process_endpoint.instance_serializer),
+        'process_detailed': (instances['process'], process_endpoint.detailed_serializer),
+        'sensor_detailed': (instances['sensor'], sensor_endpoint.detailed_serializer),
+        'calibration': (instances['sensor'].calibrations[0], density_calibration_endpoint.instance_serializer),
+        'event_summary': (instances['summary'], event_summary_endpoint.instance_serializer),
+    }
+
+
+def measure(function, repeat):
+    """Returns best time in seconds of a call of function over repeat rounds, each long enough to be timed reliably"""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--measurements', type=int, default=1000, help='measurements of the event')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='file to write JSON results to')
+    arguments = parser.parse_args()
+
+    results = {}
+    for name, (data, serializer) in get_cases(build_instances(arguments.measurements)).items():
+        compiled = get_serializer(serializer)
+        seconds = measure(lambda: compiled(data), arguments.repeat)
+        marshal_seconds = measure(lambda: marshal(data, serializer), arguments.repeat)
+        results[name] = {
+            'microseconds': seconds * 1e6,
+            'per_second': 1 / seconds,
+            'marshal_microseconds': marshal_seconds * 1e6,
+        }
+        print(f"{name}: {seconds * 1e6:.1f} us, marshal {marshal_seconds * 1e6:.1f} us")
+    if arguments.output:
+        parameters = {key: value for key, value in vars(arguments).items() if key != 'output'}
+        common.write_results(arguments.output, 'serializers', parameters, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,60 @@ from .event_endpoint import EventEndpoint
 from .measurement_endpoint import MeasurementEndpoint
 from .process_endpoint import ProcessEndpoint
 from .sensor_endpoint import SensorEndpoint
+from .sensor_cache_endpoint import SensorCacheEndpoint
 from .measurement_endpoint import MeasurementEndpoint
+from .measurement_batch_endpoint import MeasurementBatchEndpoint
+from .measurement_import_endpoint import MeasurementImportEndpoint
+from .series_endpoint import EventSeriesEndpoint, SensorSeriesEndpoint
+from .export_endpoint import EventExportEndpoint, SensorExportEndpoint
+from .recalibration_job_endpoint import RecalibrationJobEndpoint, SensorRecalibrationEndpoint
+from .event_summary_endpoint import EventSummaryEndpoint, ProcessSummaryEndpoint
+from .metrics_endpoint import MetricsEndpoint
+from .live_endpoint import EventStreamEndpoint, SensorStreamEndpoint
+
+
+def add_resources(api):
+    """Adds every endpoint to flask_restful api at its route"""
+    api.add_resource(ProcessEndpoint, '/processes/', '/processes/<int:instance_id>')
+    api.add_resource(ProcessSummaryEndpoint, '/processes/<int:instance_id>/summaries')
+    api.add_resource(SensorEndpoint, '/sensors/', '/sensors/<int:instance_id>')
+    api.add_resource(SensorCacheEndpoint, '/sensors/cache')
+    api.add_resource(SensorSeriesEndpoint, '/sensors/<int:instance_id>/series')
+    api.add_resource(SensorExportEndpoint, '/sensors/<int:instance_id>/export')
+    api.add_resource(SensorRecalibrationEndpoint, '/sensors/<int:instance_id>/recalibrate')
+    api.add_resource(SensorStreamEndpoint, '/sensors/<int:instance_id>/stream')
+    api.add_resource(MeasurementEndpoint, '/measurements/', '/measurements/<int:instance_id>')
+    api.add_resource(MeasurementBatchEndpoint, '/measurements/batch')
+    api.add_resource(MeasurementImportEndpoint, '/measurements/import')
+    api.add_resource(EventEndpoint, '/events/', '/events/<int:instance_id>')
+    api.add_resource(EventSeriesEndpoint, '/events/<int:instance_id>/series')
+    api.add_resource(EventExportEndpoint, '/events/<int:instance_id>/export')
+    api.add_resource(EventSummaryEndpoint, '/events/<int:instance_id>/summary')
+    api.add_resource(EventStreamEndpoint, '/events/<int:instance_id>/stream')
+    api.add_resource(DensityCalibrationEndpoint, '/calibrations/', '/calibrations/<int:instance_id>')
+    api.add_resource(RecalibrationJobEndpoint, '/calibrations/jobs/', '/calibrations/jobs/<int:instance_id>')
+    api.add_resource(MetricsEndpoint, '/metrics')
 
 
 __all__ = [
     'DensityCalibrationEndpoint',
     'EventEndpoint',
+    'EventExportEndpoint',
+    'EventSeriesEndpoint',
+    'EventStreamEndpoint',
+    'EventSummaryEndpoint',
+    'MeasurementBatchEndpoint',
     'MeasurementEndpoint',
+    'MeasurementImportEndpoint',
+    'MetricsEndpoint',
     'ProcessEndpoint',
+    'ProcessSummaryEndpoint',
+    'RecalibrationJobEndpoint',
+    'SensorCacheEndpoint',
     'SensorEndpoint',
+    'SensorExportEndpoint',
+    'SensorRecalibrationEndpoint',
+    'SensorSeriesEndpoint',
+    'SensorStreamEndpoint',
+    'add_resources',
 ]
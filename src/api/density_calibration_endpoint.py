@@ -1,8 +1,12 @@
 from datetime import datetime
+from functools import partial
 
-from flask_restful import reqparse, fields, inputs
+from flask_restful import reqparse, fields
 
-from models import DensityCalibration, Measurement
+from models import DensityCalibration
+from timestamps import local_datetime
+from ingest import invalidate_sensor_context
+import recalibration
 from .endpoint_mixins import BaseEndpoint, GetMixin, CreateMixin
 
 
@@ -26,7 +30,7 @@ class DensityCalibrationEndpoint(CreateMixin, GetMixin, BaseEndpoint):
         parser = reqparse.RequestParser()
         parser.add_argument('coefficient', type=float, required=True)
         parser.add_argument('offset', type=float, required=True)
-        parser.add_argument('timestamp', type=inputs.datetime_from_iso8601)
+        parser.add_argument('timestamp', type=local_datetime)
         parser.add_argument('id_sensor', type=int, required=True)
         return parser
 
@@ -34,14 +38,19 @@ class DensityCalibrationEndpoint(CreateMixin, GetMixin, BaseEndpoint):
         if 'timestamp' not in kwargs:
             kwargs['timestamp'] = datetime.now()
         instance = self.entity(**kwargs)
-        self._update_sensor_measurements(instance)
+        self._job = self._schedule_recalibration(instance)
+        self._on_commit(partial(invalidate_sensor_context, instance.id_sensor))
+        self._on_commit(recalibration.notify)
         return instance
 
-    @classmethod
-    def _update_sensor_measurements(cls, calibration):
-        """Updates density values for all measurements from same sensor with timestamp after calibration's timestamp"""
-        Measurement.query.filter(Measurement.id_sensor == calibration.id_sensor)\
-            .filter(Measurement.timestamp > calibration.timestamp)\
-            .update({'density': (
-                Measurement.calculate_density(Measurement.inclination, calibration.coefficient, calibration.offset)
-            )})
+    def _get_create_headers(self, instance):
+        return {'X-Recalibration-Job': str(self._job.id)}
+
+    def _schedule_recalibration(self, calibration):
+        """Schedules recalibration of measurements from same sensor with timestamp from calibration's timestamp up to
+        the next calibration's timestamp"""
+        next_calibration = self.entity.query.filter(self.entity.id_sensor == calibration.id_sensor)\
+            .filter(self.entity.timestamp > calibration.timestamp)\
+            .order_by(self.entity.timestamp).first()
+        window_end = next_calibration.timestamp if next_calibration else None
+        return recalibration.schedule(self._session, calibration.id_sensor, calibration.timestamp, window_end)
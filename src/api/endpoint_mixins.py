@@ -1,27 +1,72 @@
 import abc
+import base64
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
 
+from flask import request, Response
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload
 from sqlalchemy.exc import SQLAlchemyError
-from flask_restful import abort, Resource, marshal
+from flask_restful import abort, Resource, reqparse
+from werkzeug.http import http_date
 
+from config import LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT
 from models import db
+from timestamps import local_datetime
+from cache import response_cache
+from versions import SCOPES, get_versions
+from metrics import phase
+from replica import get_read_session
+from .streaming import STREAM_FORMATS, stream_list
+from .serializers import get_serializer, serialize
+
+
+def comma_separated(value):
+    """Parses comma separated list of names"""
+    return [name.strip() for name in value.split(',') if name.strip()]
 
 
 class DatabaseMixin:
     """Mixin for database related methods of endpoints"""
     def __init__(self):
         self._session = db.session
+        self._commit_callbacks = []
+
+    def _get_query(self):
+        """Returns base query of entity class in the session of the endpoint"""
+        return self._session.query(self.entity)
+
+    def _get_instance(self, instance_id, include=()):
+        """Get instance of entity class by instance_id, eagerly loading relationships in include"""
+        options = [selectinload(getattr(self.entity, relationship)) for relationship in include]
+        return self._get_query().options(*options).get_or_404(instance_id)
 
-    def _get_instance(self, instance_id):
-        """Get instance of entity class by instance_id"""
-        return self.entity.query.get_or_404(instance_id)
+    def _on_commit(self, callback):
+        """Registers callback to be called after the next successful commit"""
+        self._commit_callbacks.append(callback)
+
+    def _session_flush(self):
+        """Flushes pending changes, so that new instances get their ids before the commit"""
+        try:
+            self._session.flush()
+        except SQLAlchemyError as error:
+            self._session.rollback()
+            self._commit_callbacks.clear()
+            abort(400, message=f"Unable to complete. Error: {error}")
 
     def _session_commit(self):
         try:
-            self._session.commit()
+            with phase('commit'):
+                self._session.commit()
         except SQLAlchemyError as error:
             self._session.flush()
             self._session.rollback()
+            self._commit_callbacks.clear()
             abort(400, message=f"Unable to complete. Error: {error}")
+        callbacks, self._commit_callbacks = self._commit_callbacks, []
+        for callback in callbacks:
+            callback()
 
 
 class BaseEndpoint(DatabaseMixin):
@@ -31,6 +76,12 @@ class BaseEndpoint(DatabaseMixin):
         self.instance_serializer = instance_serializer
         self.detailed_serializer = self.instance_serializer
     
+    @classmethod
+    def _marshal(cls, data, serializer):
+        """Returns data marshalled with compiled serializer, timed as the marshal phase of the request"""
+        with phase('marshal'):
+            return serialize(data, serializer)
+
     def _parse_attributes(self, parser):
         """Returns dict of arguments and values of the request, parsed with given parser. None values are considered as
         absent attributes and ignored."""
@@ -42,21 +93,237 @@ class ResourceABCMeta(abc.ABCMeta, type(Resource)):
 
 
 class GetMixin(Resource):
-    """Mixin to get resources"""
+    """Mixin to get resources. Responses carry ETag and Last-Modified validators derived from the versions of the
+    tables they are read from, and conditional requests get 304 while nothing changed."""
+    filter_attributes = ('id_sensor', 'id_event', 'id_process')
+    timestamp_attribute = 'timestamp'
+
     def get(self, instance_id=None):
-        """HTTP GET method"""
+        """HTTP GET method. Reads from the read replica, when there is one current enough and the request did not
+        write."""
+        self._session = get_read_session(self._session)
         if not instance_id:
             return self.list()
         return self.retrieve(instance_id)
 
     def retrieve(self, instance_id):
-        """Get single instance by instance_id"""
-        instance = self._get_instance(instance_id)
-        return marshal(instance, self.detailed_serializer)
+        """Get single instance by instance_id. Arguments fields and include select the attributes and the nested
+        relationships to return, every relationship is included by default."""
+        arguments = self._parse_attributes(self._get_retrieve_parser())
+        include = self._get_include(arguments)
+        serializer = self._get_serializer(arguments.get('fields'), include)
+        return self._conditional(
+            self._get_resources(include, instance_id),
+            lambda: (self._marshal(self._get_instance(instance_id, include), serializer), {})
+        )
 
     def list(self):
-        """Get list of instances from entity class"""
-        return marshal(self.entity.query.all(), self.instance_serializer)
+        """Get page of instances from entity class, filtered and ordered by query string arguments. Header
+        X-Next-Cursor holds the cursor of the next page when there is one. With stream argument, every matching
+        instance is streamed in chunks instead, limited only if limit is given."""
+        arguments = self._parse_attributes(self._get_list_parser())
+        stream_format = arguments.get('stream')
+        limit = arguments.get('limit', None if stream_format else LIST_DEFAULT_LIMIT)
+        if limit is not None and limit < 1:
+            abort(400, message="limit must be positive")
+        if not stream_format and limit > LIST_MAX_LIMIT:
+            abort(400, message=f"limit must not exceed {LIST_MAX_LIMIT}")
+        order_columns = self._get_order_columns(arguments.get('order_by', 'id'))
+        query = self._filter_query(self._get_query(), arguments)
+        if 'cursor' in arguments:
+            query = query.filter(self._after_cursor(order_columns, arguments['cursor']))
+        query = query.order_by(*order_columns)
+        serializer = self._get_serializer(arguments.get('fields'))
+        query = self._select_columns(query, serializer, order_columns)
+        if stream_format:
+            return stream_list(query.limit(limit), serializer, stream_format)
+        return self._conditional(
+            self._get_list_resources(arguments),
+            lambda: self._get_page(query, limit, order_columns, serializer)
+        )
+
+    def _select_columns(self, query, serializer, order_columns):
+        """Returns query reading only the columns used by serializer and ordering as rows, instead of instances, when
+        every serialized field is a column of entity"""
+        compiled = get_serializer(serializer)
+        column_names = self.entity.__mapper__.column_attrs.keys()
+        if not compiled.is_flat or not set(compiled.attributes) <= set(column_names):
+            return query
+        names = list(dict.fromkeys(compiled.attributes + [column.key for column in order_columns]))
+        return query.with_entities(*[getattr(self.entity, name) for name in names])
+
+    def _get_page(self, query, limit, order_columns, serializer):
+        """Returns marshalled page of up to limit instances of query and its headers"""
+        instances = query.limit(limit + 1).all()
+        headers = {}
+        if len(instances) > limit:
+            instances = instances[:limit]
+            headers['X-Next-Cursor'] = self._encode_cursor(instances[-1], order_columns)
+        return self._marshal(instances, serializer), headers
+
+    def _get_resources(self, include=(), instance_id=None):
+        """Returns resources read by a response including given relationships: names of the tables, or the version
+        scopes of the rows related to instance_id of scoped tables"""
+        resources = [self.entity.__table__.name]
+        for relationship in include:
+            relationship = getattr(self.entity, relationship).property
+            table = relationship.mapper.local_table.name
+            columns = [remote.name for local, remote in relationship.local_remote_pairs if local.primary_key]
+            if instance_id is not None and len(columns) == 1 and columns[0] in SCOPES.get(table, ()):
+                resources.append((table, columns[0], instance_id))
+            else:
+                resources.append(table)
+        return resources
+
+    def _get_list_resources(self, arguments):
+        """Returns resources read by a list response, the version scope of a filtered column when there is one"""
+        table = self.entity.__table__.name
+        for column in SCOPES.get(table, ()):
+            if column in self.filter_attributes and arguments.get(column) is not None:
+                return [(table, column, arguments[column])]
+        return self._get_resources()
+
+    def _conditional(self, resources, build):
+        """Returns response of build, a function returning data and headers, with validators derived from the versions
+        of given tables. Returns 304 if the client's representation is current. Built responses are cached by entity
+        tag, so repeated requests are served without querying until a table changes."""
+        # Versions are read before the data, so that a response is never tagged with a version newer than its data
+        versions = get_versions(self._session, resources)
+        key = ' '.join([request.full_path] + [f'{resource}:{version}' for resource, (version, _) in
+                                              sorted(versions.items(), key=lambda item: str(item[0]))])
+        etag = hashlib.sha1(key.encode()).hexdigest()
+        validators = {'ETag': f'"{etag}"'}
+        modified = max((modified for _, modified in versions.values() if modified is not None), default=None)
+        # Last-Modified has a resolution of seconds, so it is only sent once the second of the last change is over
+        if modified is not None and datetime.utcnow() - modified >= timedelta(seconds=1):
+            validators['Last-Modified'] = http_date(modified)
+        else:
+            modified = None
+        if self._is_not_modified(etag, modified):
+            return Response(status=304, headers=validators)
+        cached = response_cache.get(etag)
+        if cached is None:
+            cached = build()
+            response_cache.put(etag, cached)
+        data, headers = cached
+        return data, 200, {**headers, **validators}
+
+    @classmethod
+    def _is_not_modified(cls, etag, modified):
+        """Returns whether request validators match the current entity tag or modification time"""
+        if request.if_none_match:
+            return request.if_none_match.contains(etag)
+        if request.if_modified_since and modified is not None:
+            since = request.if_modified_since
+            if since.tzinfo is not None:
+                since = since.astimezone(timezone.utc).replace(tzinfo=None)
+            return modified.replace(microsecond=0) <= since
+        return False
+
+    def _get_relationships(self):
+        """Returns names of nested relationships of detailed serializer"""
+        return [name for name in self.detailed_serializer if name not in self.instance_serializer]
+
+    def _get_include(self, arguments):
+        """Returns relationships to include given parsed arguments. Aborts on unknown relationships."""
+        relationships = self._get_relationships()
+        include = arguments.get('include', relationships)
+        for relationship in include:
+            if relationship not in relationships:
+                abort(400, message=f"Unable to include {relationship}. Options: {', '.join(relationships)}")
+        return include
+
+    def _get_serializer(self, fields=None, include=()):
+        """Returns instance serializer restricted to fields, if given, extended with included relationships"""
+        if fields is None:
+            serializer = dict(self.instance_serializer)
+        else:
+            for field in fields:
+                if field not in self.instance_serializer:
+                    abort(400, message=f"Unknown field {field}")
+            serializer = {name: value for name, value in self.instance_serializer.items() if name in fields}
+        for relationship in include:
+            serializer[relationship] = self.detailed_serializer[relationship]
+        return serializer
+
+    def _get_retrieve_parser(self):
+        """Returns parser for retrieve request"""
+        parser = reqparse.RequestParser()
+        parser.add_argument('fields', type=comma_separated, location='args')
+        parser.add_argument('include', type=comma_separated, location='args')
+        return parser
+
+    def _get_list_parser(self):
+        """Returns parser for list request"""
+        parser = reqparse.RequestParser()
+        parser.add_argument('fields', type=comma_separated, location='args')
+        parser.add_argument('stream', choices=STREAM_FORMATS, location='args')
+        parser.add_argument('limit', type=int, location='args')
+        parser.add_argument('cursor', type=str, location='args')
+        parser.add_argument('order_by', choices=('id', 'timestamp'), location='args')
+        for attribute in self.filter_attributes:
+            parser.add_argument(attribute, type=int, location='args')
+        parser.add_argument('from', type=local_datetime, location='args')
+        parser.add_argument('to', type=local_datetime, location='args')
+        return parser
+
+    def _get_timestamp_column(self):
+        """Returns timestamp column of entity class. Aborts if entity has no timestamp."""
+        column = getattr(self.entity, self.timestamp_attribute or '', None)
+        if column is None:
+            abort(400, message=f"{self.entity.__tablename__} has no timestamp")
+        return column
+
+    def _get_order_columns(self, order_by):
+        """Returns columns used to order and paginate list"""
+        if order_by == 'timestamp':
+            return self._get_timestamp_column(), self.entity.id
+        return self.entity.id,
+
+    def _filter_query(self, query, arguments):
+        """Applies filters from list arguments to query"""
+        for attribute in self.filter_attributes:
+            if attribute in arguments:
+                query = self._filter_by_attribute(query, attribute, arguments[attribute])
+        if 'from' in arguments:
+            query = query.filter(self._get_timestamp_column() >= arguments['from'])
+        if 'to' in arguments:
+            query = query.filter(self._get_timestamp_column() < arguments['to'])
+        return query
+
+    def _filter_by_attribute(self, query, attribute, value):
+        """Filters query by entity attribute equal to value. Aborts if entity has no such attribute."""
+        column = getattr(self.entity, attribute, None)
+        if column is None:
+            abort(400, message=f"{self.entity.__tablename__} can not be filtered by {attribute}")
+        return query.filter(column == value)
+
+    @classmethod
+    def _encode_cursor(cls, instance, order_columns):
+        """Returns opaque cursor token pointing after instance in given ordering"""
+        values = [getattr(instance, column.key) for column in order_columns]
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    @classmethod
+    def _after_cursor(cls, order_columns, cursor):
+        """Returns filter clause selecting rows after cursor in given ordering"""
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(order_columns):
+                raise ValueError('cursor does not match order_by')
+            *timestamp, last_id = values
+            last_id = int(last_id)
+            timestamp = [datetime.fromisoformat(value) for value in timestamp]
+        except (ValueError, TypeError) as error:
+            abort(400, message=f"Invalid cursor. Error: {error}")
+        if not timestamp:
+            return order_columns[0] > last_id
+        timestamp_column, id_column = order_columns
+        return or_(
+            timestamp_column > timestamp[0],
+            and_(timestamp_column == timestamp[0], id_column > last_id)
+        )
 
 
 class CreateMixin(abc.ABC, metaclass=ResourceABCMeta):
@@ -70,12 +337,16 @@ class CreateMixin(abc.ABC, metaclass=ResourceABCMeta):
             self._session_commit()
         except AttributeError as error:
             abort(400, message=f"Unable to create instance. Error: {error}")
-        return marshal(instance, self.instance_serializer), 201
+        return self._marshal(instance, self.instance_serializer), 201, self._get_create_headers(instance)
 
     def _create_instance(self, **kwargs):
         """Create instance of entity class given the keyword arguments"""
         return self.entity(**kwargs)
 
+    def _get_create_headers(self, instance):
+        """Returns dict of extra headers of create response"""
+        return {}
+
     @abc.abstractmethod
     def _get_create_parser(self):
         """Returns parser for create request"""
@@ -90,7 +361,7 @@ class UpdateMixin(abc.ABC, metaclass=ResourceABCMeta):
         self._update_instance(instance, attributes)
         self._session.add(instance)
         self._session_commit()
-        return marshal(instance, self.instance_serializer), 201
+        return self._marshal(instance, self.instance_serializer), 201
 
     def _update_instance(self, instance, attributes):
         """Updates instance object using dict of attributes"""
@@ -1,10 +1,17 @@
 from datetime import datetime
+from functools import partial
 
-from flask_restful import reqparse, fields, inputs
+from flask_restful import reqparse, fields
 
 from models import Event, EventType, Measurement, Sensor
+from timestamps import local_datetime
+from ingest import invalidate_sensor_context
+from lifecycle import attach_measurements, finish_event
+from summary import new_summary
+from versions import touch
 from .endpoint_mixins import BaseEndpoint, GetMixin, UpdateMixin, DeleteMixin, CreateMixin
 from .measurement_endpoint import instance_serializer as measurement_serializer
+from .streaming import STREAM_FORMATS, stream_detail
 
 
 instance_serializer = {
@@ -27,31 +34,64 @@ detailed_serializer = {
 class EventEndpoint(GetMixin, UpdateMixin, DeleteMixin, CreateMixin, BaseEndpoint):
     """Process model endpoint class"""
     entity = Event
+    timestamp_attribute = 'start'
 
     def __init__(self):
         super().__init__(instance_serializer)
         self.detailed_serializer = detailed_serializer
 
+    def retrieve(self, instance_id):
+        """Get single instance by instance_id. With stream argument, measurements are streamed in chunks. Only raw
+        measurements are listed, those compacted into roll-ups are read from the event series, export and summary."""
+        arguments = self._parse_attributes(self._get_retrieve_parser())
+        if 'stream' not in arguments:
+            return super().retrieve(instance_id)
+        instance = self._get_instance(instance_id)
+        measurements = self._session.query(Measurement).filter(Measurement.id_event == instance.id)\
+            .order_by(Measurement.timestamp, Measurement.id)
+        return stream_detail(
+            self._marshal(instance, self._get_serializer(arguments.get('fields'))),
+            'measurements',
+            measurements,
+            measurement_serializer,
+            arguments['stream']
+        )
+
+    def _get_retrieve_parser(self):
+        parser = super()._get_retrieve_parser()
+        parser.add_argument('stream', choices=STREAM_FORMATS, location='args')
+        return parser
+
     def _get_update_parser(self):
         parser = reqparse.RequestParser()
         parser.add_argument('name', type=str)
-        parser.add_argument('finish', type=inputs.datetime_from_iso8601)
+        parser.add_argument('finish', type=local_datetime)
         return parser
 
     def _get_create_parser(self):
         parser = reqparse.RequestParser()
         parser.add_argument('name', type=str, required=True)
-        parser.add_argument('start', type=inputs.datetime_from_iso8601)
+        parser.add_argument('start', type=local_datetime)
         parser.add_argument('event_type', type=EventType, required=True)
         parser.add_argument('id_process', type=int, required=True)
-        parser.add_argument('finish', type=inputs.datetime_from_iso8601)
+        parser.add_argument('finish', type=local_datetime)
         parser.add_argument('duration', type=int)
         parser.add_argument('id_sensor', type=int)
         return parser
 
     def _update_instance(self, instance, attributes):
         """Updates instance object using dict of attributes"""
+        finish = attributes.pop('finish', None)
         self._set_instance_attributes(instance, attributes)
+        if finish is not None:
+            finish_event(self._session, instance, finish)
+            if instance.id_sensor:
+                self._on_commit(partial(invalidate_sensor_context, instance.id_sensor))
+
+    def _delete_instance(self, instance):
+        if instance.id_sensor:
+            self._on_commit(partial(invalidate_sensor_context, instance.id_sensor))
+        return super()._delete_instance(instance)
 
     def _create_instance(self, **kwargs):
         """Create instance of entity class given the keyword arguments"""
@@ -60,29 +100,23 @@ class EventEndpoint(GetMixin, UpdateMixin, DeleteMixin, CreateMixin, BaseEndpoin
         if 'start' not in kwargs:
             kwargs['start'] = datetime.now()
         instance = self.entity(**kwargs)
+        instance.summary = new_summary()
         if instance.id_sensor:
             self._clear_measurements_before_start(instance)
-            self._update_existing_measurements(instance)
+            self._session.add(instance)
+            self._session_flush()
+            attach_measurements(self._session, instance)
+            self._on_commit(partial(invalidate_sensor_context, instance.id_sensor))
         return instance
 
-    @classmethod
-    def _clear_measurements_before_start(cls, instance):
+    def _clear_measurements_before_start(self, instance):
         """Deletes measurements which belong to event's sensor which are not registered to other events and have
         timestamp before event's start"""
         Measurement.query.filter(Measurement.id_event.is_(None))\
             .filter(Measurement.id_sensor == instance.id_sensor)\
             .filter(Measurement.timestamp < instance.start)\
             .delete()
-
-    @classmethod
-    def _update_existing_measurements(cls, instance):
-        """Updates measurements' event for measurements which belong to event's sensor which and have timestamp after
-        event's start"""
-        measurements = Measurement.query.filter(Measurement.id_event.is_(None))\
-            .filter(Measurement.id_sensor == instance.id_sensor)\
-            .filter(Measurement.timestamp > instance.start)\
-            .all()
-        instance.measurements = measurements
+        touch(self._session, (Measurement.__tablename__, 'id_sensor', instance.id_sensor))
 
     @classmethod
     def _validate_event_type_arguments(cls, event_type, arguments):
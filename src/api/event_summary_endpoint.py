@@ -0,0 +1,71 @@
+from flask_restful import fields, Resource
+from sqlalchemy.exc import IntegrityError
+
+from models import Event, EventSummary, Process
+from summary import rebuild_summary
+from .endpoint_mixins import DatabaseMixin
+from .serializers import serialize
+
+
+instance_serializer = {
+    'id_event': fields.Integer,
+    'measurement_count': fields.Integer,
+    'first_timestamp': fields.DateTime(dt_format='iso8601'),
+    'last_timestamp': fields.DateTime(dt_format='iso8601'),
+    'original_gravity': fields.Float(attribute='first_density'),
+    'current_gravity': fields.Float(attribute='last_density'),
+    'min_density': fields.Float,
+    'max_density': fields.Float,
+    'avg_density': fields.Float,
+    'apparent_attenuation': fields.Float,
+    'abv': fields.Float,
+    'density_slope': fields.Float,
+    'temperature': fields.Float(attribute='last_temperature'),
+    'first_temperature': fields.Float,
+    'min_temperature': fields.Float,
+    'max_temperature': fields.Float,
+    'avg_temperature': fields.Float,
+}
+
+
+class SummaryMixin(DatabaseMixin):
+    """Mixin to rebuild missing event summaries, such as those deleted by migrations merging measurements"""
+    def _rebuild_summaries(self, event_ids):
+        """Rebuilds and saves summaries of given events from their stored roll-ups and measurements"""
+        for id_event in event_ids:
+            rebuild_summary(self._session, id_event)
+        try:
+            self._session.commit()
+        except IntegrityError:
+            # Built meanwhile by another request or along with new measurements
+            self._session.rollback()
+
+
+class EventSummaryEndpoint(Resource, SummaryMixin):
+    """Event measurement summary endpoint class"""
+    entity = Event
+
+    def get(self, instance_id):
+        """HTTP GET method"""
+        instance = self._get_instance(instance_id)
+        if instance.summary is None:
+            self._rebuild_summaries([instance.id])
+        return serialize(instance.summary, instance_serializer)
+
+
+class ProcessSummaryEndpoint(Resource, SummaryMixin):
+    """Measurement summaries of every event of a process endpoint class"""
+    entity = Process
+
+    def get(self, instance_id):
+        """HTTP GET method"""
+        self._get_instance(instance_id)
+        missing = self._session.query(Event.id).outerjoin(EventSummary, EventSummary.id_event == Event.id)\
+            .filter(Event.id_process == instance_id, EventSummary.id_event.is_(None))\
+            .order_by(Event.id).all()
+        if missing:
+            self._rebuild_summaries([id_event for id_event, in missing])
+        summaries = EventSummary.query.join(Event, EventSummary.id_event == Event.id)\
+            .filter(Event.id_process == instance_id)\
+            .order_by(Event.start, Event.id).all()
+        return serialize(summaries, instance_serializer)
@@ -0,0 +1,242 @@
+import csv
+import io
+import queue
+import threading
+
+from flask import Response, stream_with_context
+from flask_restful import abort, reqparse, Resource
+from sqlalchemy import cast, func, null, select, union_all
+
+from config import STREAM_CHUNK_SIZE
+from models import db, Event, Sensor, Measurement, MeasurementRollup
+from timestamps import local_datetime
+from .endpoint_mixins import DatabaseMixin
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+EXPORT_COLUMNS = ('id', 'timestamp', 'inclination', 'temperature', 'density', 'battery', 'id_sensor', 'id_event')
+
+_mimetypes = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class _QueueWriter:
+    """File-like object passing written data to a bounded queue, so that a blocking writer running in another thread
+    can be consumed by a generator"""
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=16)
+        self.cancelled = False
+
+    def write(self, data):
+        self.put(data)
+        return len(data)
+
+    def put(self, item):
+        """Puts item in queue, waiting for free space unless reading was cancelled"""
+        while True:
+            if self.cancelled:
+                raise IOError('export cancelled')
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only stream keeping written data until drained, while reporting the total position to the writer"""
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class MeasurementExportMixin(Resource):
+    """Mixin to export every measurement of an instance as CSV or Parquet, bypassing ORM objects and marshal. Roll-ups
+    of compacted measurements are exported as measurements without id holding the bucket averages."""
+    def get(self, instance_id):
+        """HTTP GET method"""
+        self._get_instance(instance_id)
+        arguments = self._get_export_parser().parse_args(strict=True)
+        export_format = arguments['format']
+        if export_format == 'parquet' and pyarrow is None:
+            abort(501, message="Parquet export requires pyarrow")
+        conditions = {self.measurement_attribute: instance_id, 'from': arguments['from'], 'to': arguments['to']}
+        if export_format == 'parquet':
+            generator = self._export_parquet(conditions)
+        elif self._session.bind.dialect.name == 'postgresql':
+            generator = self._export_copy(conditions)
+        else:
+            generator = self._export_csv(conditions)
+        filename = f"{self.entity.__tablename__}-{instance_id}.{export_format}"
+        return Response(
+            stream_with_context(generator),
+            mimetype=_mimetypes[export_format],
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+
+    @classmethod
+    def _get_export_parser(cls):
+        parser = reqparse.RequestParser()
+        parser.add_argument('format', choices=tuple(_mimetypes), default='csv', location='args')
+        parser.add_argument('from', type=local_datetime, location='args')
+        parser.add_argument('to', type=local_datetime, location='args')
+        return parser
+
+    @classmethod
+    def _select(cls, conditions):
+        """Returns Core select of export columns of measurements and roll-ups matching conditions, ordered by
+        timestamp"""
+        table = Measurement.__table__
+        rollup = MeasurementRollup.__table__
+        statement = union_all(
+            cls._filter(select(*[table.c[column] for column in EXPORT_COLUMNS]), table, conditions),
+            cls._filter(select(
+                cast(null(), db.Integer).label('id'),
+                rollup.c.timestamp,
+                rollup.c.avg_inclination,
+                rollup.c.avg_temperature,
+                rollup.c.avg_density,
+                cast(func.round(rollup.c.avg_battery), db.Integer),
+                rollup.c.id_sensor,
+                rollup.c.id_event
+            ), rollup, conditions)
+        )
+        return statement.order_by(statement.selected_columns.timestamp, statement.selected_columns.id)
+
+    @classmethod
+    def _filter(cls, statement, table, conditions):
+        """Returns statement restricted to rows of table matching conditions"""
+        for column, value in conditions.items():
+            if value is None:
+                continue
+            if column == 'from':
+                statement = statement.where(table.c.timestamp >= value)
+            elif column == 'to':
+                statement = statement.where(table.c.timestamp < value)
+            else:
+                statement = statement.where(table.c[column] == value)
+        return statement
+
+    def _stream_rows(self, conditions):
+        """Yields lists of up to STREAM_CHUNK_SIZE rows, read with a server-side cursor where supported"""
+        connection = self._session.connection().execution_options(stream_results=True)
+        result = connection.execute(self._select(conditions))
+        try:
+            while True:
+                rows = result.fetchmany(STREAM_CHUNK_SIZE)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            result.close()
+
+    def _export_copy(self, conditions):
+        """Yields CSV produced by PostgreSQL COPY TO STDOUT. COPY runs in a thread on its own connection, writing into
+        a bounded queue."""
+        connection = db.engine.raw_connection()
+        cursor = connection.cursor()
+        # Exports of long fermentations may exceed DATABASE_STATEMENT_TIMEOUT
+        cursor.execute("SET LOCAL statement_timeout = 0")
+        statement = self._select(conditions).compile(dialect=db.engine.dialect)
+        sql = cursor.mogrify(str(statement), statement.params).decode()
+        writer = _QueueWriter()
+        finished = object()
+
+        def copy():
+            try:
+                cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", writer)
+                writer.put(finished)
+            except Exception as error:
+                if not writer.cancelled:
+                    writer.put(error)
+
+        thread = threading.Thread(target=copy, name='export-copy', daemon=True)
+        thread.start()
+        try:
+            while True:
+                data = writer.queue.get()
+                if data is finished:
+                    return
+                if isinstance(data, Exception):
+                    raise data
+                yield data
+        finally:
+            writer.cancelled = True
+            if thread.is_alive():
+                # The client went away, COPY is stopped on the server rather than left running to completion
+                connection.connection.cancel()
+            thread.join()
+            connection.rollback()
+            connection.close()
+
+    def _export_csv(self, conditions):
+        """Yields CSV written from streamed rows, used on databases without COPY"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in self._stream_rows(conditions):
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    def _export_parquet(self, conditions):
+        """Yields Parquet file written one row group per chunk of streamed rows"""
+        schema = pyarrow.schema([
+            ('id', pyarrow.int32()),
+            ('timestamp', pyarrow.timestamp('us')),
+            ('inclination', pyarrow.float64()),
+            ('temperature', pyarrow.float64()),
+            ('density', pyarrow.float64()),
+            ('battery', pyarrow.int32()),
+            ('id_sensor', pyarrow.int32()),
+            ('id_event', pyarrow.int32()),
+        ])
+        sink = _ChunkSink()
+        writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode='w'), schema)
+        for rows in self._stream_rows(conditions):
+            columns = list(zip(*rows))
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+
+
+class EventExportEndpoint(MeasurementExportMixin, DatabaseMixin):
+    """Event measurements export endpoint class"""
+    entity = Event
+    measurement_attribute = 'id_event'
+
+
+class SensorExportEndpoint(MeasurementExportMixin, DatabaseMixin):
+    """Sensor measurements export endpoint class"""
+    entity = Sensor
+    measurement_attribute = 'id_sensor'
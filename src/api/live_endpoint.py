@@ -0,0 +1,134 @@
+import json
+from collections import deque
+
+from flask import request, Response, stream_with_context
+from flask_restful import abort, reqparse, Resource
+from sqlalchemy import func, select
+
+from config import STREAM_CHUNK_SIZE, STREAM_HEARTBEAT, STREAM_QUEUE_SIZE
+from models import Event, Sensor, Measurement
+from timestamps import local_datetime
+import live
+from .endpoint_mixins import DatabaseMixin
+from .serializers import get_serializer
+from .measurement_endpoint import instance_serializer as measurement_serializer
+from .recalibration_job_endpoint import instance_serializer as recalibration_serializer
+
+
+# Milliseconds clients wait before reconnecting
+RECONNECT_DELAY = 3000
+
+
+def _format_message(kind, data, message_id=None):
+    lines = [] if message_id is None else [f'id: {message_id}']
+    lines += [f'event: {kind}', f'data: {json.dumps(data)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+class MeasurementStreamMixin(Resource):
+    """Mixin streaming measurements of an instance as Server-Sent Events as they are committed. Finished
+    recalibrations changing their densities are sent as recalibration events, after which clients should reload the
+    job's window.
+
+    Streams start from new measurements, or replay those after the Last-Event-ID header or the measurement id of
+    last_event_id, or with timestamp from since on. Requests beyond STREAM_MAX_CONNECTIONS open streams get 503."""
+    def get(self, instance_id):
+        """HTTP GET method"""
+        self._get_instance(instance_id)
+        arguments = self._get_stream_parser().parse_args(strict=True)
+        last_event_id = request.headers.get('Last-Event-ID', arguments['last_event_id'])
+        if last_event_id is not None:
+            try:
+                last_event_id = int(last_event_id)
+            except ValueError:
+                abort(400, message="Last-Event-ID must be a measurement id")
+        if not live.streams.acquire(blocking=False):
+            return {'message': "Too many open streams"}, 503, {'Retry-After': str(RECONNECT_DELAY // 1000)}
+        response = Response(
+            stream_with_context(self._stream(instance_id, last_event_id, arguments['since'])),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        # Also called when the stream never started
+        response.call_on_close(live.streams.release)
+        return response
+
+    @classmethod
+    def _get_stream_parser(cls):
+        parser = reqparse.RequestParser()
+        parser.add_argument('since', type=local_datetime, location='args')
+        parser.add_argument('last_event_id', location='args')
+        return parser
+
+    def _replay(self, instance_id, last_event_id, since):
+        """Yields measurement rows after last_event_id ordered by id, or from since ordered by timestamp"""
+        table = Measurement.__table__
+        statement = select(table).where(table.c[self.measurement_attribute] == instance_id)
+        if last_event_id is not None:
+            statement = statement.where(table.c.id > last_event_id).order_by(table.c.id)
+        elif since is not None:
+            statement = statement.where(table.c.timestamp >= since).order_by(table.c.timestamp, table.c.id)
+        else:
+            return
+        connection = self._session.connection().execution_options(stream_results=True)
+        result = connection.execute(statement)
+        try:
+            while True:
+                rows = result.fetchmany(STREAM_CHUNK_SIZE)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            result.close()
+
+    def _stream(self, instance_id, last_event_id, since):
+        serialize_measurement = get_serializer(measurement_serializer)
+        serialize_recalibration = get_serializer(recalibration_serializer)
+        # Measurements committed after last_id are published to the subscription, subscribing before the replay query
+        # so that those committed meanwhile are sent once
+        last_id = self._session.query(func.max(Measurement.id)).scalar() or 0
+        # Replay reads from a new transaction, SQLite would keep the snapshot of the one reading last_id
+        self._session.rollback()
+        subscription = live.broker.subscribe((self.topic, instance_id), last_id)
+        try:
+            yield f'retry: {RECONNECT_DELAY}\n\n'
+            # Ids of the latest replayed rows, which may also be queued in the subscription
+            replayed = deque(maxlen=STREAM_QUEUE_SIZE)
+            for row in self._replay(instance_id, last_event_id, since):
+                replayed.append(row.id)
+                yield _format_message('measurement', serialize_measurement(row), row.id)
+            replayed = set(replayed)
+            # Idle streams must not hold a pooled connection
+            self._session.close()
+            while True:
+                messages = subscription.get(STREAM_HEARTBEAT)
+                if not messages:
+                    yield ': heartbeat\n\n'
+                    continue
+                chunk = []
+                for kind, row in messages:
+                    if kind == 'measurement':
+                        if row.id not in replayed:
+                            chunk.append(_format_message(kind, serialize_measurement(row), row.id))
+                    else:
+                        chunk.append(_format_message(kind, serialize_recalibration(row)))
+                yield ''.join(chunk)
+                if subscription.overflowed:
+                    # Client fell behind and resumes from its last received measurement when reconnecting
+                    return
+        finally:
+            live.broker.unsubscribe(subscription)
+
+
+class EventStreamEndpoint(MeasurementStreamMixin, DatabaseMixin):
+    """Event live measurements endpoint class"""
+    entity = Event
+    measurement_attribute = 'id_event'
+    topic = 'event'
+
+
+class SensorStreamEndpoint(MeasurementStreamMixin, DatabaseMixin):
+    """Sensor live measurements endpoint class"""
+    entity = Sensor
+    measurement_attribute = 'id_sensor'
+    topic = 'sensor'
@@ -0,0 +1,53 @@
+import json
+
+from flask import request
+from flask_restful import abort, Resource
+
+from config import MEASUREMENT_BATCH_LIMIT
+from models import Measurement
+from ingest import ReadingError, parse_reading, store_measurements
+from .endpoint_mixins import BaseEndpoint
+from .measurement_endpoint import instance_serializer
+
+
+class MeasurementBatchEndpoint(Resource, BaseEndpoint):
+    """Measurement batch ingestion endpoint class"""
+    entity = Measurement
+
+    def __init__(self):
+        super().__init__(instance_serializer)
+
+    def post(self):
+        """HTTP POST method. Accepts a JSON array or NDJSON body of readings and stores every valid reading in a single
+        transaction. Readings of a sensor and timestamp already stored are counted as duplicates."""
+        readings = self._get_readings()
+        valid_readings = []
+        errors = []
+        for index, reading in enumerate(readings):
+            try:
+                valid_readings.append(parse_reading(reading))
+            except ReadingError as error:
+                errors.append({'index': index, 'message': str(error)})
+        if not valid_readings:
+            return {'created': 0, 'errors': errors}, 400
+        measurements = store_measurements(self._session, valid_readings)
+        self._session_commit()
+        duplicates = len(valid_readings) - len(measurements)
+        return {'created': len(measurements), 'duplicates': duplicates, 'errors': errors}, 201
+
+    @classmethod
+    def _get_readings(cls):
+        """Returns list of readings from request body, either a JSON array or newline delimited JSON"""
+        try:
+            if request.mimetype == 'application/x-ndjson':
+                lines = request.get_data(as_text=True).splitlines()
+                readings = [json.loads(line) for line in lines if line.strip()]
+            else:
+                readings = request.get_json(force=True)
+        except ValueError as error:
+            abort(400, message=f"Unable to parse readings. Error: {error}")
+        if not isinstance(readings, list):
+            abort(400, message="Readings must be a list")
+        if len(readings) > MEASUREMENT_BATCH_LIMIT:
+            abort(413, message=f"Batch is limited to {MEASUREMENT_BATCH_LIMIT} readings")
+        return readings
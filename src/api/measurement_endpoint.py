@@ -1,8 +1,12 @@
 from datetime import datetime
 
-from flask_restful import reqparse, fields, inputs
+from flask_restful import reqparse, fields
 
-from models import Measurement, Sensor, Event, EventType, DensityCalibration
+from models import Measurement, Sensor, Event
+from timestamps import local_datetime
+from ingest import finite_float, get_sensor_context, store_measurements
+from summary import rebuild_summary
+import ingest_queue
 from .endpoint_mixins import BaseEndpoint, GetMixin, DeleteMixin, CreateMixin
 
 
@@ -25,52 +29,44 @@ class MeasurementEndpoint(GetMixin, DeleteMixin, CreateMixin, BaseEndpoint):
     def __init__(self):
         super().__init__(instance_serializer)
 
+    def post(self):
+        """HTTP POST method. A retried reading, of a sensor and timestamp already stored, is not stored again and the
+        stored measurement is returned. In async ingest mode the reading is validated and queued, to be stored in a
+        group commit."""
+        attributes = self._parse_attributes(self._get_create_parser())
+        if ingest_queue.is_enabled():
+            attributes.setdefault('timestamp', datetime.now())
+            try:
+                ingest_queue.enqueue(attributes)
+            except ingest_queue.QueueFull:
+                return {'message': "Ingest queue is full"}, 503, {'Retry-After': '1'}
+            return {'message': "Queued"}, 202
+        measurements = store_measurements(self._session, [attributes])
+        self._session_commit()
+        if measurements:
+            return self._marshal(measurements[0], self.instance_serializer), 201
+        context = get_sensor_context(self._session, attributes['sensor_mac_address'])
+        instance = Measurement.query.filter_by(id_sensor=context.id_sensor, timestamp=attributes['timestamp']).one()
+        return self._marshal(instance, self.instance_serializer), 200
+
     def _get_create_parser(self):
         parser = reqparse.RequestParser()
         parser.add_argument('sensor_mac_address', type=Sensor.valid_mac_address, required=True)
-        parser.add_argument('inclination', type=float, required=True)
-        parser.add_argument('temperature', type=float, required=True)
-        parser.add_argument('battery', type=float, required=True)
-        parser.add_argument('timestamp', type=inputs.datetime_from_iso8601)
+        parser.add_argument('inclination', type=finite_float, required=True)
+        parser.add_argument('temperature', type=finite_float, required=True)
+        parser.add_argument('battery', type=finite_float, required=True)
+        parser.add_argument('timestamp', type=local_datetime)
         return parser
 
-    def _create_instance(self, **kwargs):
-        mac = kwargs.pop('sensor_mac_address')
-        sensor = self._get_sensor(mac)
-        kwargs["sensor"] = sensor
-        if 'timestamp' not in kwargs:
-            kwargs['timestamp'] = datetime.now()
-        kwargs['event'] = self._get_event(sensor)
-        calibration = self._get_calibration(sensor)
-        kwargs['density'] = Measurement.calculate_density(
-            kwargs['inclination'],
-            calibration.coefficient,
-            calibration.offset
-        )
-        return self.entity(**kwargs)
+    def _filter_by_attribute(self, query, attribute, value):
+        """Filters query by entity attribute equal to value. Measurements are filtered by process through their
+        event."""
+        if attribute == 'id_process':
+            return query.join(Event, Measurement.id_event == Event.id).filter(Event.id_process == value)
+        return super()._filter_by_attribute(query, attribute, value)
 
-    def _get_sensor(self, mac_address):
-        """Gets sensor by mac_address. Creates new sensor if not found."""
-        sensor = Sensor.query.filter_by(mac_address=mac_address).one_or_none()
-        if not sensor:
-            sensor = Sensor(mac_address=mac_address)
-            self._session.add(sensor)
+    def _delete_instance(self, instance):
+        super()._delete_instance(instance)
+        if instance.id_event is not None:
             self._session.flush()
-        return sensor
-
-    @classmethod
-    def _get_calibration(cls, sensor):
-        """Gets latest calibration from sensor"""
-        calibration = DensityCalibration.query.filter(DensityCalibration.id_sensor == sensor.id)\
-            .order_by(DensityCalibration.timestamp.desc()).first()
-        if not calibration:
-            calibration = DensityCalibration(coefficient=0.0017, offset=0.9592)
-        return calibration
-
-    @classmethod
-    def _get_event(cls, sensor):
-        """Gets event by sensor"""
-        return Event.query.filter(Event.event_type == EventType.SENSOR)\
-            .filter(Event.id_sensor == sensor.id)\
-            .filter(Event.finish.is_(None))\
-            .one_or_none()
+            rebuild_summary(self._session, instance.id_event)
@@ -0,0 +1,32 @@
+import io
+
+from flask import request
+from flask_restful import abort, Resource
+
+from models import Measurement
+from importer import read_readings, import_readings
+from .endpoint_mixins import DatabaseMixin
+
+
+class MeasurementImportEndpoint(Resource, DatabaseMixin):
+    """Historical measurement CSV import endpoint class"""
+    entity = Measurement
+
+    def post(self):
+        """HTTP POST method. Accepts a CSV file, either as request body or as multipart file field named file. Readings
+        already stored are counted as duplicates."""
+        if 'file' in request.files:
+            file = io.TextIOWrapper(request.files['file'].stream, encoding='utf-8', newline='')
+        elif request.content_length:
+            file = io.StringIO(request.get_data(as_text=True), newline='')
+        else:
+            abort(400, message="CSV file is required")
+        try:
+            readings, errors = read_readings(file)
+        except (UnicodeDecodeError, ValueError) as error:
+            abort(400, message=f"Unable to read CSV file. Error: {error}")
+        if not readings:
+            return {'created': 0, 'errors': errors}, 400
+        created = import_readings(self._session, readings)
+        self._session_commit()
+        return {'created': created, 'duplicates': len(readings) - created, 'errors': errors}, 201
@@ -0,0 +1,11 @@
+from flask import Response
+from flask_restful import Resource
+
+import metrics
+
+
+class MetricsEndpoint(Resource):
+    """Prometheus metrics endpoint class"""
+    def get(self):
+        """HTTP GET method"""
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -1,6 +1,7 @@
 from flask_restful import reqparse, fields
 
 from models import Process
+from ingest import invalidate_sensor_context
 from .endpoint_mixins import BaseEndpoint, GetMixin, UpdateMixin, DeleteMixin, CreateMixin
 from .event_endpoint import instance_serializer as event_serializer
 
@@ -21,6 +22,7 @@ detailed_serializer = {
 class ProcessEndpoint(UpdateMixin, DeleteMixin, CreateMixin, GetMixin, BaseEndpoint):
     """Process model endpoint class"""
     entity = Process
+    timestamp_attribute = None
 
     def __init__(self):
         super().__init__(instance_serializer)
@@ -37,3 +39,8 @@ class ProcessEndpoint(UpdateMixin, DeleteMixin, CreateMixin, GetMixin, BaseEndpo
         parser.add_argument('name', type=str, required=True)
         parser.add_argument('description', type=str)
         return parser
+
+    def _delete_instance(self, instance):
+        # Deleting a process cascades to its events, which may be open SENSOR events of any sensor
+        self._on_commit(invalidate_sensor_context)
+        return super()._delete_instance(instance)
@@ -0,0 +1,42 @@
+from flask_restful import fields, Resource
+
+from models import RecalibrationJob, Sensor
+import recalibration
+from .endpoint_mixins import BaseEndpoint, DatabaseMixin, GetMixin
+from .serializers import serialize
+
+
+instance_serializer = {
+    'id': fields.Integer,
+    'id_sensor': fields.Integer(default=None),
+    'window_start': fields.DateTime(dt_format='iso8601'),
+    'window_end': fields.DateTime(dt_format='iso8601'),
+    'status': fields.String,
+    'updated_rows': fields.Integer,
+    'error': fields.String,
+    'created': fields.DateTime(dt_format='iso8601'),
+    'started': fields.DateTime(dt_format='iso8601'),
+    'finished': fields.DateTime(dt_format='iso8601'),
+}
+
+
+class RecalibrationJobEndpoint(GetMixin, BaseEndpoint):
+    """Recalibration job model endpoint class"""
+    entity = RecalibrationJob
+    timestamp_attribute = 'created'
+
+    def __init__(self):
+        super().__init__(instance_serializer)
+
+
+class SensorRecalibrationEndpoint(Resource, DatabaseMixin):
+    """Endpoint class to recalibrate the whole measurement history of a sensor"""
+    entity = Sensor
+
+    def post(self, instance_id):
+        """HTTP POST method"""
+        sensor = self._get_instance(instance_id)
+        job = recalibration.schedule(self._session, sensor.id)
+        self._on_commit(recalibration.notify)
+        self._session_commit()
+        return serialize(job, instance_serializer), 202
@@ -0,0 +1,10 @@
+from flask_restful import Resource
+
+from cache import sensor_context_cache
+
+
+class SensorCacheEndpoint(Resource):
+    """Sensor context cache statistics endpoint class"""
+    def get(self):
+        """HTTP GET method"""
+        return sensor_context_cache.stats()
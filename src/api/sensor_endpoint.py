@@ -1,6 +1,9 @@
+from functools import partial
+
 from flask_restful import reqparse, fields
 
 from models import Sensor
+from ingest import invalidate_sensor_context
 from .endpoint_mixins import BaseEndpoint, GetMixin, UpdateMixin, DeleteMixin, CreateMixin
 from .density_calibration_endpoint import instance_serializer as calibration_serializer
 
@@ -20,6 +23,7 @@ detailed_serializer = {
 class SensorEndpoint(GetMixin, UpdateMixin, DeleteMixin, CreateMixin, BaseEndpoint):
     """Sensor model endpoint class"""
     entity = Sensor
+    timestamp_attribute = None
 
     def __init__(self):
         super().__init__(instance_serializer)
@@ -34,3 +38,12 @@ class SensorEndpoint(GetMixin, UpdateMixin, DeleteMixin, CreateMixin, BaseEndpoi
         parser = reqparse.RequestParser()
         parser.add_argument('mac_address', type=Sensor.valid_mac_address)
         return parser
+
+    def _update_instance(self, instance, attributes):
+        """Updates instance object using dict of attributes"""
+        self._set_instance_attributes(instance, attributes)
+        self._on_commit(partial(invalidate_sensor_context, instance.id))
+
+    def _delete_instance(self, instance):
+        self._on_commit(partial(invalidate_sensor_context, instance.id))
+        return super()._delete_instance(instance)
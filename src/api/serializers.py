@@ -0,0 +1,157 @@
+"""Serializer dicts compiled into functions producing the same output as flask_restful marshal.
+
+marshal walks the field dict for every object, instantiates field classes and calls their output method. A compiled
+Serializer resolves all of that once: each field becomes a plain attribute name and a formatting function, with the
+default value and ISO 8601 formatting of the field. Fields whose output can not be reproduced, such as custom field
+classes, fall back to the field's own output method, so results are always equal to marshal's, as plain dicts.
+"""
+import threading
+
+from flask_restful import fields
+from flask_restful.fields import is_indexable_but_not_string, get_value
+from sqlalchemy.engine import Row
+
+
+_COMPILED_CACHE_SIZE = 1024
+
+
+def _get_item(instance, key, default):
+    """Same lookup as marshal for indexable objects, such as dicts"""
+    try:
+        return instance[key]
+    except (IndexError, TypeError, KeyError):
+        return getattr(instance, key, default)
+
+
+def _get_formatter(field):
+    """Returns function formatting a value read for field as Raw.output does, or None if field formats values
+    differently"""
+    if type(field).output is not fields.Raw.output:
+        return None
+    default = field.default
+    field_type = type(field)
+    if field_type is fields.Integer:
+        return lambda value: default if value is None else int(value)
+    if field_type is fields.Float:
+        return lambda value: default if value is None else float(value)
+    if field_type is fields.String:
+        return lambda value: default if value is None else str(value)
+    if field_type is fields.DateTime and field.dt_format == 'iso8601':
+        return lambda value: default if value is None else value.isoformat()
+    if field_type is fields.Raw:
+        return lambda value: default if value is None else value
+    format_value = field.format
+    return lambda value: default if value is None else format_value(value)
+
+
+def _get_nested_formatter(field):
+    """Returns function formatting a value read for a Nested field"""
+    nested = get_serializer(field.nested)
+    allow_null, default = field.allow_null, field.default
+
+    def format_nested(value):
+        if value is None:
+            if allow_null:
+                return None
+            if default is not None:
+                return default
+        return nested(value)
+    return format_nested
+
+
+def _get_list_formatter(field):
+    """Returns function formatting a value read for a List of Nested field, or None for other lists"""
+    container = field.container
+    if type(container) is not fields.Nested or container.attribute is not None:
+        return None
+    format_item = _get_nested_formatter(container)
+    nested = get_serializer(container.nested)
+    default = field.default
+
+    def format_list(value):
+        if is_indexable_but_not_string(value) and not isinstance(value, dict):
+            return [format_item(item) for item in value]
+        if value is None:
+            return default
+        return [nested(value)]
+    return format_list
+
+
+class Serializer:
+    """Serializer dict compiled into a function of the data to serialize. Calling it is equivalent to marshal."""
+    def __init__(self, serializer):
+        self.serializer = serializer
+        # (key, attribute name or None, function of the value of attribute, or of the object without attribute)
+        self._outputs = []
+        for key, field in serializer.items():
+            self._outputs.append(self._compile(key, field))
+        self.attributes = [attribute for _, attribute, _ in self._outputs]
+
+    @classmethod
+    def _compile(cls, key, field):
+        if isinstance(field, dict):
+            return key, None, get_serializer(field)
+        if isinstance(field, type):
+            field = field()
+        if type(field) is fields.Nested:
+            formatter = _get_nested_formatter(field)
+        elif type(field) is fields.List:
+            formatter = _get_list_formatter(field)
+        else:
+            formatter = _get_formatter(field)
+        if formatter is None:
+            return key, None, lambda instance: field.output(key, instance)
+        attribute = key if field.attribute is None else field.attribute
+        if not isinstance(attribute, str) or '.' in attribute:
+            return key, None, lambda instance: formatter(get_value(attribute, instance))
+        return key, attribute, formatter
+
+    @property
+    def is_flat(self):
+        """Whether every field reads a single attribute of the object and formats it without nesting"""
+        return all(
+            attribute is not None and not isinstance(self.serializer[key], (fields.Nested, fields.List))
+            for key, attribute, _ in self._outputs
+        )
+
+    def __call__(self, data):
+        if isinstance(data, (list, tuple)):
+            return [self._serialize(instance) for instance in data]
+        return self._serialize(data)
+
+    def _serialize(self, instance):
+        # Rows of column queries are read by attribute like model instances, other indexable objects by key
+        if is_indexable_but_not_string(instance) and not isinstance(instance, Row):
+            get = _get_item
+        else:
+            get = getattr
+        result = {}
+        for key, attribute, output in self._outputs:
+            if attribute is None:
+                result[key] = output(instance)
+            else:
+                result[key] = output(get(instance, attribute, None))
+        return result
+
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def get_serializer(serializer):
+    """Returns compiled serializer of serializer dict. Serializers are compiled once for each combination of field
+    objects, as endpoints build restricted serializer dicts for every request."""
+    key = tuple((name, id(field)) for name, field in serializer.items())
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = Serializer(serializer)
+        with _compiled_lock:
+            if len(_compiled) >= _COMPILED_CACHE_SIZE:
+                _compiled.clear()
+            _compiled[key] = compiled
+    return compiled
+
+
+def serialize(data, serializer):
+    """Returns data serialized with serializer dict, equal to marshal(data, serializer)"""
+    return get_serializer(serializer)(data)
@@ -0,0 +1,122 @@
+import re
+from datetime import datetime, timedelta
+
+from flask_restful import reqparse, Resource
+from sqlalchemy import func, cast, literal, select, union_all
+
+from models import db, Event, Sensor, Measurement, MeasurementRollup
+from timestamps import local_datetime
+from retention import epoch_bucket
+from .endpoint_mixins import DatabaseMixin
+
+
+SERIES_FIELDS = ('density', 'temperature', 'inclination', 'battery')
+
+_bucket_units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+_epoch = datetime(1970, 1, 1)
+
+
+def bucket_seconds(value):
+    """Parses bucket width such as 30s, 15m, 1h or 1d into seconds"""
+    match = re.fullmatch(r'(\d+)([smhd])', value)
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"{value} is not a valid bucket, use a positive number followed by s, m, h or d")
+    return int(match.group(1)) * _bucket_units[match.group(2)]
+
+
+def series_fields(value):
+    """Parses comma separated list of measurement fields"""
+    requested = [field.strip() for field in value.split(',') if field.strip()]
+    for field in requested:
+        if field not in SERIES_FIELDS:
+            raise ValueError(f"{field} is not a valid field, use {', '.join(SERIES_FIELDS)}")
+    return requested
+
+
+class MeasurementSeriesMixin(Resource):
+    """Mixin to get measurements of an instance aggregated in time buckets. Raw measurements and roll-ups of
+    compacted measurements are aggregated together."""
+    def get(self, instance_id):
+        """HTTP GET method"""
+        self._get_instance(instance_id)
+        arguments = self._get_series_parser().parse_args(strict=True)
+        seconds = arguments['bucket']
+        fields = arguments['fields'] or ['density', 'temperature']
+        source = self._get_source(instance_id, fields, arguments['from'], arguments['to'])
+        bucket = epoch_bucket(self._session.bind.dialect.name, source.c.timestamp, seconds).label('bucket')
+        count = func.sum(source.c.count)
+        columns = [bucket, count.label('count')]
+        for field in fields:
+            columns += [
+                cast(func.sum(source.c[f'sum_{field}']), db.Float) / count,
+                func.min(source.c[f'min_{field}']),
+                func.max(source.c[f'max_{field}'])
+            ]
+        rows = self._session.query(*columns).group_by(bucket).order_by(bucket).all()
+        return {
+            'bucket': seconds,
+            'fields': fields,
+            'series': [self._serialize_row(row, fields) for row in rows]
+        }
+
+    @classmethod
+    def _get_series_parser(cls):
+        parser = reqparse.RequestParser()
+        parser.add_argument('bucket', type=bucket_seconds, required=True, location='args')
+        parser.add_argument('fields', type=series_fields, location='args')
+        parser.add_argument('from', type=local_datetime, location='args')
+        parser.add_argument('to', type=local_datetime, location='args')
+        return parser
+
+    def _get_source(self, instance_id, fields, start, end):
+        """Returns subquery of timestamp, count and sum, min and max of fields of the raw measurements and of the
+        roll-ups of the instance in [start, end)"""
+        raw = [Measurement.timestamp, literal(1).label('count')]
+        rollup = [MeasurementRollup.timestamp, MeasurementRollup.measurement_count.label('count')]
+        for field in fields:
+            column = getattr(Measurement, field)
+            raw += [column.label(f'sum_{field}'), column.label(f'min_{field}'), column.label(f'max_{field}')]
+            total = getattr(MeasurementRollup, f'avg_{field}') * MeasurementRollup.measurement_count
+            rollup += [
+                total.label(f'sum_{field}'),
+                getattr(MeasurementRollup, f'min_{field}').label(f'min_{field}'),
+                getattr(MeasurementRollup, f'max_{field}').label(f'max_{field}')
+            ]
+        selects = []
+        for table, columns in ((Measurement, raw), (MeasurementRollup, rollup)):
+            statement = select(*columns).where(getattr(table, self.measurement_attribute) == instance_id)
+            if start:
+                statement = statement.where(table.timestamp >= start)
+            if end:
+                statement = statement.where(table.timestamp < end)
+            selects.append(statement)
+        return union_all(*selects).subquery()
+
+    @classmethod
+    def _serialize_row(cls, row, fields):
+        bucket, count, *aggregates = row
+        serialized = {
+            'timestamp': (_epoch + timedelta(seconds=int(bucket))).isoformat(),
+            'count': count
+        }
+        for index, field in enumerate(fields):
+            average, minimum, maximum = aggregates[3 * index:3 * index + 3]
+            serialized[field] = {
+                'avg': None if average is None else float(average),
+                'min': minimum,
+                'max': maximum
+            }
+        return serialized
+
+
+class EventSeriesEndpoint(MeasurementSeriesMixin, DatabaseMixin):
+    """Event measurements time series endpoint class"""
+    entity = Event
+    measurement_attribute = 'id_event'
+
+
+class SensorSeriesEndpoint(MeasurementSeriesMixin, DatabaseMixin):
+    """Sensor measurements time series endpoint class"""
+    entity = Sensor
+    measurement_attribute = 'id_sensor'
@@ -0,0 +1,72 @@
+import json
+
+from flask import Response, stream_with_context
+
+from config import STREAM_CHUNK_SIZE
+from .serializers import get_serializer
+
+
+STREAM_FORMATS = ('json', 'ndjson')
+
+_mimetypes = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _encode_chunks(query, serializer):
+    """Yields lists of up to STREAM_CHUNK_SIZE JSON encoded rows, reading query in chunks of the same size"""
+    serialize = get_serializer(serializer)
+    chunk = []
+    for instance in query.yield_per(STREAM_CHUNK_SIZE):
+        chunk.append(json.dumps(serialize(instance)))
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _encode_array(query, serializer):
+    """Yields JSON array of query rows"""
+    separator = ''
+    yield '['
+    for chunk in _encode_chunks(query, serializer):
+        yield separator + ', '.join(chunk)
+        separator = ', '
+    yield ']'
+
+
+def _encode_lines(query, serializer):
+    """Yields newline delimited JSON rows"""
+    for chunk in _encode_chunks(query, serializer):
+        yield '\n'.join(chunk) + '\n'
+
+
+def _response(generator, stream_format):
+    return Response(stream_with_context(generator), mimetype=_mimetypes[stream_format])
+
+
+def stream_list(query, serializer, stream_format):
+    """Returns response streaming every row of query as a JSON array or as newline delimited JSON"""
+    if stream_format == 'ndjson':
+        return _response(_encode_lines(query, serializer), stream_format)
+    return _response(_encode_array(query, serializer), stream_format)
+
+
+def stream_detail(head, key, query, serializer, stream_format):
+    """Returns response streaming head dict with rows of query nested under key. As newline delimited JSON, head is
+    the first line followed by one line per row."""
+    def generate_json():
+        encoded_head = json.dumps(head)[:-1]
+        yield encoded_head + (', ' if head else '') + json.dumps(key) + ': '
+        yield from _encode_array(query, serializer)
+        yield '}'
+
+    def generate_lines():
+        yield json.dumps(head) + '\n'
+        yield from _encode_lines(query, serializer)
+
+    if stream_format == 'ndjson':
+        return _response(generate_lines(), stream_format)
+    return _response(generate_json(), stream_format)
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+
+from config import SENSOR_CACHE_SIZE, SENSOR_CACHE_TTL, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL
+
+
+class TTLCache:
+    """Thread safe bounded cache with least recently used eviction and time to live expiration.
+
+    Every invalidation increments generation, so a value loaded before an invalidation is not stored by put."""
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns cached value for key or None if absent or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, generation=None):
+        """Stores value for key. Ignored if generation is given and cache was invalidated since then."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard_if(self, predicate):
+        """Removes every entry for which predicate(key, value) is true"""
+        with self._lock:
+            self.generation += 1
+            for key in [key for key, (value, _) in self._entries.items() if predicate(key, value)]:
+                del self._entries[key]
+
+    def validate(self, version):
+        """Removes all entries if version, such as versions of the tables values are read from, differs from the
+        version previously validated"""
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self.generation += 1
+                self._entries.clear()
+
+    def clear(self):
+        """Removes all entries"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """Returns dict of cache counters"""
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+sensor_context_cache = TTLCache(SENSOR_CACHE_SIZE, SENSOR_CACHE_TTL)
+
+# Keyed on entity tag, which changes with the versions of the resources a response depends on
+response_cache = TTLCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
@@ -1,10 +1,90 @@
 import os
 
 
-user = os.environ['POSTGRES_USER']
-password = os.environ['POSTGRES_PASSWORD']
-host = os.environ['POSTGRES_HOST']
-database = os.environ['POSTGRES_DB']
-port = os.environ['POSTGRES_PORT']
+if 'DATABASE_URI' in os.environ:
+    DATABASE_URI = os.environ['DATABASE_URI']
+else:
+    user = os.environ['POSTGRES_USER']
+    password = os.environ['POSTGRES_PASSWORD']
+    host = os.environ['POSTGRES_HOST']
+    database = os.environ['POSTGRES_DB']
+    port = os.environ['POSTGRES_PORT']
 
-DATABASE_URI = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}"
+    DATABASE_URI = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}"
+
+DEBUG = os.environ.get('FLASK_DEBUG', '0') == '1'
+
+# Connection pool of each process, see README for recommended values
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 10))
+DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 5))
+DATABASE_POOL_TIMEOUT = float(os.environ.get('DATABASE_POOL_TIMEOUT', 10))
+DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', 1800))
+DATABASE_POOL_PRE_PING = os.environ.get('DATABASE_POOL_PRE_PING', '1') == '1'
+# Milliseconds, 0 disables the timeout. Exports and maintenance are not subject to it.
+DATABASE_STATEMENT_TIMEOUT = int(os.environ.get('DATABASE_STATEMENT_TIMEOUT', 0))
+
+# Read replica serving GET requests, unset to read from the primary. Lag and check interval in seconds.
+REPLICA_DATABASE_URI = os.environ.get('REPLICA_DATABASE_URI')
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 1))
+
+MEASUREMENT_BATCH_LIMIT = int(os.environ.get('MEASUREMENT_BATCH_LIMIT', 5000))
+
+SENSOR_CACHE_SIZE = int(os.environ.get('SENSOR_CACHE_SIZE', 1024))
+SENSOR_CACHE_TTL = float(os.environ.get('SENSOR_CACHE_TTL', 60))
+
+LIST_DEFAULT_LIMIT = int(os.environ.get('LIST_DEFAULT_LIMIT', 1000))
+LIST_MAX_LIMIT = int(os.environ.get('LIST_MAX_LIMIT', 10000))
+
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 1000))
+
+RECALIBRATION_WORKER = os.environ.get('RECALIBRATION_WORKER', '1') == '1'
+RECALIBRATION_CHUNK_SIZE = int(os.environ.get('RECALIBRATION_CHUNK_SIZE', 5000))
+RECALIBRATION_POLL_INTERVAL = float(os.environ.get('RECALIBRATION_POLL_INTERVAL', 5))
+RECALIBRATION_STALE_TIMEOUT = float(os.environ.get('RECALIBRATION_STALE_TIMEOUT', 300))
+
+INGEST_MODE = os.environ.get('INGEST_MODE', 'sync')
+INGEST_QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE', 10000))
+INGEST_FLUSH_ROWS = int(os.environ.get('INGEST_FLUSH_ROWS', 500))
+INGEST_FLUSH_INTERVAL = float(os.environ.get('INGEST_FLUSH_INTERVAL', 200)) / 1000
+INGEST_SPOOL_DIRECTORY = os.environ.get('INGEST_SPOOL_DIRECTORY', 'spool')
+# Failures of a group of queued readings before failing readings are isolated and set aside
+INGEST_MAX_ATTEMPTS = int(os.environ.get('INGEST_MAX_ATTEMPTS', 3))
+# Binary frame listeners, port 0 disables a transport
+INGEST_LISTENER_HOST = os.environ.get('INGEST_LISTENER_HOST', '0.0.0.0')
+INGEST_UDP_PORT = int(os.environ.get('INGEST_UDP_PORT', 0))
+INGEST_TCP_PORT = int(os.environ.get('INGEST_TCP_PORT', 0))
+
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 5000))
+
+SUMMARY_SLOPE_HALF_LIFE = float(os.environ.get('SUMMARY_SLOPE_HALF_LIFE', 6))
+
+EVENT_SCHEDULER = os.environ.get('EVENT_SCHEDULER', '1') == '1'
+EVENT_SCHEDULER_INTERVAL = float(os.environ.get('EVENT_SCHEDULER_INTERVAL', 30))
+
+RETENTION_WORKER = os.environ.get('RETENTION_WORKER', '1') == '1'
+RETENTION_INTERVAL = float(os.environ.get('RETENTION_INTERVAL', 3600))
+# Raw measurements older than this many days are compacted into roll-ups, 0 keeps them forever
+MEASUREMENT_RETENTION_DAYS = int(os.environ.get('MEASUREMENT_RETENTION_DAYS', 0))
+ROLLUP_BUCKET = int(os.environ.get('ROLLUP_BUCKET', 3600))
+PARTITION_PREMAKE_MONTHS = int(os.environ.get('PARTITION_PREMAKE_MONTHS', 2))
+
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 300))
+
+# Live measurement streams, intervals in seconds
+STREAM_POLL_INTERVAL = float(os.environ.get('STREAM_POLL_INTERVAL', 1))
+STREAM_HEARTBEAT = float(os.environ.get('STREAM_HEARTBEAT', 15))
+STREAM_QUEUE_SIZE = int(os.environ.get('STREAM_QUEUE_SIZE', 1000))
+STREAM_GAP_TIMEOUT = float(os.environ.get('STREAM_GAP_TIMEOUT', 30))
+# Open streams per process. Each holds a request thread unless served by gevent, so by default a quarter of WEB_THREADS
+# may stream and the other threads are left to other requests.
+if os.environ.get('WEB_WORKER_CLASS', 'gthread') == 'gevent':
+    _default_stream_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 100)) * 3 // 4
+else:
+    _default_stream_connections = max(1, int(os.environ.get('WEB_THREADS', 8)) // 4)
+STREAM_MAX_CONNECTIONS = int(os.environ.get('STREAM_MAX_CONNECTIONS', _default_stream_connections))
+
+METRICS = os.environ.get('METRICS', '1') == '1'
+# Milliseconds, 0 disables the slow query log
+SLOW_QUERY_THRESHOLD = float(os.environ.get('SLOW_QUERY_THRESHOLD', 500))
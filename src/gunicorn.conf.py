@@ -0,0 +1,25 @@
+"""Gunicorn configuration of the production profile.
+
+Usage: gunicorn -c gunicorn.conf.py app:app
+"""
+import os
+
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_WORKERS', 2))
+# gthread serves each request in a thread of a fixed pool, gevent in a greenlet
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('WEB_THREADS', 8))
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 100))
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-') or None
+# The app is not preloaded, every worker creates its own engine and background workers after fork
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # psycopg2 blocks the event loop unless it waits on sockets through gevent
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
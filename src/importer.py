@@ -0,0 +1,195 @@
+"""Bulk import of historical measurements from CSV files.
+
+Each row holds a reading with the same columns as a measurement POST (sensor_mac_address, inclination, temperature,
+battery and timestamp, which is required here). Densities are computed with the calibration that governed each
+reading's timestamp and readings are attached to the SENSOR event of their sensor whose time window contains them.
+Readings of a sensor and timestamp already stored are skipped, so a file can be imported again.
+
+Usage: python importer.py <file.csv> [<file.csv> ...]
+"""
+import csv
+import io
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+import numpy
+
+from config import IMPORT_BATCH_SIZE
+from models import db, Sensor, Measurement, DensityCalibration, Event, EventType
+from ingest import ReadingError, parse_reading, create_sensor, insert_measurements
+from summary import update_summaries
+from versions import touch_rows
+
+
+IMPORT_COLUMNS = ('inclination', 'temperature', 'density', 'battery', 'timestamp', 'id_sensor', 'id_event')
+
+
+def read_readings(file):
+    """Parses CSV file of readings. Returns list of parsed readings and list of errors of rejected rows."""
+    readings = []
+    errors = []
+    for reader_line, row in enumerate(csv.DictReader(file), start=2):
+        try:
+            # DictReader puts the fields of a row beyond the header under a None key
+            if None in row:
+                raise ReadingError('row has more fields than the header')
+            reading = parse_reading({key: value for key, value in row.items() if value != ''})
+            if 'timestamp' not in reading:
+                raise ReadingError('timestamp is required')
+        except ReadingError as error:
+            errors.append({'line': reader_line, 'message': str(error)})
+            continue
+        readings.append(reading)
+    return readings, errors
+
+
+def calibrated_densities(timestamps, inclinations, calibrations):
+    """Vectorized Measurement.calculate_density. Applies to each reading the latest calibration with timestamp not
+    after the reading's timestamp, or the default calibration if there is none.
+
+    timestamps is a datetime64 array, inclinations a float array and calibrations a list of DensityCalibration ordered
+    by timestamp."""
+    calibration_timestamps = numpy.array([calibration.timestamp for calibration in calibrations],
+                                         dtype='datetime64[us]')
+    coefficients = numpy.array(
+        [DensityCalibration.DEFAULT_COEFFICIENT] + [calibration.coefficient for calibration in calibrations]
+    )
+    offsets = numpy.array([DensityCalibration.DEFAULT_OFFSET] + [calibration.offset for calibration in calibrations])
+    # Index 0 is the default calibration, index i the i-th calibration
+    index = numpy.searchsorted(calibration_timestamps, timestamps, side='right')
+    return Measurement.calculate_density(inclinations, coefficients[index], offsets[index])
+
+
+def assign_events(timestamps, events):
+    """Returns object array of id of the event whose [start, finish) window contains each timestamp, or None.
+    events is a list of non overlapping Event ordered by start."""
+    if not events:
+        return numpy.full(len(timestamps), None, dtype=object)
+    starts = numpy.array([event.start for event in events], dtype='datetime64[us]')
+    finishes = numpy.array([event.finish or datetime.max for event in events], dtype='datetime64[us]')
+    event_ids = numpy.array([event.id for event in events], dtype=object)
+    index = numpy.searchsorted(starts, timestamps, side='right') - 1
+    inside = (index >= 0) & (timestamps < finishes[index])
+    return numpy.where(inside, event_ids[index], None)
+
+
+def get_sensor_ids(session, mac_addresses):
+    """Returns dict of sensor id by mac address, creating missing sensors"""
+    sensors = session.query(Sensor.mac_address, Sensor.id).filter(Sensor.mac_address.in_(mac_addresses))
+    sensor_ids = dict(sensors)
+    for mac_address in mac_addresses:
+        if mac_address not in sensor_ids:
+            sensor_ids[mac_address] = create_sensor(session, mac_address)
+    return sensor_ids
+
+
+def build_columns(session, readings):
+    """Returns dict of measurement column arrays for parsed readings"""
+    by_sensor = defaultdict(list)
+    for reading in readings:
+        by_sensor[reading['sensor_mac_address']].append(reading)
+    sensor_ids = get_sensor_ids(session, list(by_sensor))
+    parts = []
+    for mac_address, sensor_readings in by_sensor.items():
+        id_sensor = sensor_ids[mac_address]
+        timestamps = numpy.array([reading['timestamp'] for reading in sensor_readings], dtype='datetime64[us]')
+        inclinations = numpy.array([reading['inclination'] for reading in sensor_readings])
+        calibrations = DensityCalibration.query.filter(DensityCalibration.id_sensor == id_sensor)\
+            .order_by(DensityCalibration.timestamp, DensityCalibration.id).all()
+        events = Event.query.filter(Event.id_sensor == id_sensor)\
+            .filter(Event.event_type == EventType.SENSOR)\
+            .order_by(Event.start).all()
+        parts.append({
+            'inclination': inclinations,
+            'temperature': numpy.array([reading['temperature'] for reading in sensor_readings]),
+            'density': calibrated_densities(timestamps, inclinations, calibrations),
+            'battery': numpy.rint([reading['battery'] for reading in sensor_readings]).astype(int),
+            'timestamp': timestamps,
+            'id_sensor': numpy.full(len(sensor_readings), id_sensor),
+            'id_event': assign_events(timestamps, events),
+        })
+    return {column: numpy.concatenate([part[column] for part in parts]) for column in IMPORT_COLUMNS}
+
+
+def _rows(columns):
+    """Yields tuples of python values of measurement column arrays"""
+    values = [
+        columns['inclination'].tolist(),
+        columns['temperature'].tolist(),
+        columns['density'].tolist(),
+        columns['battery'].tolist(),
+        columns['timestamp'].astype(datetime).tolist(),
+        columns['id_sensor'].tolist(),
+        columns['id_event'].tolist(),
+    ]
+    return zip(*values)
+
+
+def _copy_measurements(session, columns):
+    """Inserts measurement columns with PostgreSQL COPY FROM STDIN into a temporary table, then into measurement
+    skipping stored readings, in the session transaction. Returns list of column values of inserted measurements."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for row in _rows(columns):
+        writer.writerow(['' if value is None else value for value in row])
+    buffer.seek(0)
+    column_list = ', '.join(IMPORT_COLUMNS)
+    cursor = session.connection().connection.cursor()
+    cursor.execute(f"CREATE TEMPORARY TABLE measurement_import AS SELECT {column_list} FROM measurement WITH NO DATA")
+    cursor.copy_expert(f"COPY measurement_import ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+    cursor.execute(
+        f"INSERT INTO measurement ({column_list}) SELECT {column_list} FROM measurement_import "
+        f"ON CONFLICT (id_sensor, timestamp) DO NOTHING RETURNING timestamp, density, temperature, id_sensor, id_event"
+    )
+    inserted = [dict(zip(('timestamp', 'density', 'temperature', 'id_sensor', 'id_event'), row))
+                for row in cursor.fetchall()]
+    cursor.execute("DROP TABLE measurement_import")
+    return inserted
+
+
+def _insert_measurements(session, columns):
+    """Inserts measurement columns in batches of IMPORT_BATCH_SIZE rows skipping stored readings. Returns list of
+    column values of inserted measurements."""
+    rows = [dict(zip(IMPORT_COLUMNS, row)) for row in _rows(columns)]
+    inserted = []
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        inserted += insert_measurements(session, rows[start:start + IMPORT_BATCH_SIZE])
+    return inserted
+
+
+def import_readings(session, readings):
+    """Stores parsed historical readings in session transaction, updating the summaries of their events. Returns number
+    of stored measurements, readings already stored are not counted."""
+    if not readings:
+        return 0
+    columns = build_columns(session, readings)
+    if session.bind.dialect.name == 'postgresql':
+        inserted = _copy_measurements(session, columns)
+    else:
+        inserted = _insert_measurements(session, columns)
+    if inserted:
+        update_summaries(session, inserted, stored=True)
+        touch_rows(session, Measurement.__tablename__, inserted)
+    return len(inserted)
+
+
+def main():
+    from setup import create_app
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(2)
+    with create_app(workers=False).app_context():
+        for path in sys.argv[1:]:
+            with open(path, newline='') as file:
+                readings, errors = read_readings(file)
+            for error in errors:
+                print(f"{path}:{error['line']}: {error['message']}")
+            created = import_readings(db.session, readings)
+            db.session.commit()
+            print(f"{path}: imported {created} measurements, skipped {len(readings) - created} duplicates, "
+                  f"rejected {len(errors)} rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+import math
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import event, select, tuple_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from models import Measurement, Sensor, Event, EventType, DensityCalibration
+from timestamps import local_datetime
+from cache import sensor_context_cache
+from summary import update_summaries
+from versions import get_versions, touch, touch_rows
+from metrics import phase
+
+
+SensorContext = namedtuple('SensorContext', ['id_sensor', 'coefficient', 'offset', 'id_event'])
+
+# Tables sensor contexts are read from
+_CONTEXT_RESOURCES = (Sensor.__tablename__, DensityCalibration.__tablename__, Event.__tablename__)
+_CONTEXT_CHECKED = 'sensor_context_checked'
+
+# Rows per INSERT statement, or (sensor, timestamp) keys per lookup of stored measurements
+INSERT_CHUNK_SIZE = 1000
+
+
+class ReadingError(ValueError):
+    """Raised when a sensor reading is not valid"""
+
+
+def finite_float(value):
+    """Parses number, rejecting NaN and infinities"""
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f"{value} is not a finite number")
+    return value
+
+
+_reading_arguments = {
+    'sensor_mac_address': (Sensor.valid_mac_address, True),
+    'inclination': (finite_float, True),
+    'temperature': (finite_float, True),
+    'battery': (finite_float, True),
+    'timestamp': (local_datetime, False),
+}
+
+
+def parse_reading(reading):
+    """Validates a reading with the same rules as the measurement create parser. Returns dict of parsed attributes,
+    raises ReadingError if the reading is not valid."""
+    if not isinstance(reading, dict):
+        raise ReadingError('reading must be an object')
+    unknown = set(reading) - set(_reading_arguments)
+    if unknown:
+        raise ReadingError(f"Unknown arguments: {', '.join(sorted(unknown))}")
+    attributes = {}
+    for argument, (argument_type, required) in _reading_arguments.items():
+        value = reading.get(argument)
+        if value is None:
+            if required:
+                raise ReadingError(f'{argument} is required')
+            continue
+        try:
+            attributes[argument] = argument_type(value)
+        except (TypeError, ValueError) as error:
+            raise ReadingError(f'{argument}: {error}')
+    return attributes
+
+
+def create_sensor(session, mac_address):
+    """Returns id of sensor with given mac_address, creating it if needed. A sensor created concurrently by another
+    transaction is returned once it commits, instead of failing on the unique constraint."""
+    table = Sensor.__table__
+    if session.bind.dialect.name == 'postgresql':
+        statement = postgresql.insert(table).values(mac_address=mac_address)
+        # Updating the conflicting row makes RETURNING yield its id
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.mac_address], set_={'mac_address': statement.excluded.mac_address}
+        ).returning(table.c.id)
+        id_sensor = session.execute(statement).scalar()
+    else:
+        session.execute(table.insert().prefix_with('OR IGNORE').values(mac_address=mac_address))
+        id_sensor = session.execute(select(table.c.id).where(table.c.mac_address == mac_address)).scalar()
+    touch(session, Sensor.__tablename__)
+    return id_sensor
+
+
+def get_calibration(id_sensor):
+    """Gets latest calibration from sensor"""
+    calibration = DensityCalibration.query.filter(DensityCalibration.id_sensor == id_sensor)\
+        .order_by(DensityCalibration.timestamp.desc()).first()
+    if not calibration:
+        calibration = DensityCalibration(
+            coefficient=DensityCalibration.DEFAULT_COEFFICIENT,
+            offset=DensityCalibration.DEFAULT_OFFSET
+        )
+    return calibration
+
+
+def get_event(id_sensor):
+    """Gets open SENSOR event by sensor"""
+    return Event.query.filter(Event.event_type == EventType.SENSOR)\
+        .filter(Event.id_sensor == id_sensor)\
+        .filter(Event.finish.is_(None))\
+        .one_or_none()
+
+
+def _validate_sensor_contexts(session):
+    """Clears cached sensor contexts if a transaction of any process changed the tables they are read from since they
+    were cached. Checked once per transaction of session."""
+    if session.info.get(_CONTEXT_CHECKED):
+        return
+    versions = get_versions(session, _CONTEXT_RESOURCES)
+    sensor_context_cache.validate(tuple(versions[resource][0] for resource in _CONTEXT_RESOURCES))
+    session.info[_CONTEXT_CHECKED] = True
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _forget_checked(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_CONTEXT_CHECKED, None)
+
+
+def get_sensor_context(session, mac_address):
+    """Gets sensor, latest calibration and open event needed to store readings from given mac_address. Creates new
+    sensor if not found. Contexts of existing sensors are served from sensor_context_cache, cleared in every process
+    when one of them changes sensors, calibrations or events."""
+    _validate_sensor_contexts(session)
+    context = sensor_context_cache.get(mac_address)
+    if context is not None:
+        return context
+    generation = sensor_context_cache.generation
+    with phase('sensor'):
+        id_sensor = session.query(Sensor.id).filter_by(mac_address=mac_address).scalar()
+        created = id_sensor is None
+        if created:
+            id_sensor = create_sensor(session, mac_address)
+    with phase('calibration'):
+        calibration = get_calibration(id_sensor)
+    with phase('event'):
+        event = get_event(id_sensor)
+    context = SensorContext(
+        id_sensor=id_sensor,
+        coefficient=calibration.coefficient,
+        offset=calibration.offset,
+        id_event=event.id if event else None
+    )
+    if not created:
+        sensor_context_cache.put(mac_address, context, generation)
+    return context
+
+
+def invalidate_sensor_context(id_sensor=None):
+    """Removes cached context of sensor with given id, or every cached context if id_sensor is None"""
+    if id_sensor is None:
+        sensor_context_cache.clear()
+    else:
+        sensor_context_cache.discard_if(lambda mac_address, context: context.id_sensor == id_sensor)
+
+
+def build_measurement(context, attributes):
+    """Returns dict of measurement column values for parsed reading attributes and its sensor context"""
+    attributes = dict(attributes)
+    attributes.pop('sensor_mac_address', None)
+    if 'timestamp' not in attributes:
+        attributes['timestamp'] = datetime.now()
+    attributes['id_sensor'] = context.id_sensor
+    attributes['id_event'] = context.id_event
+    attributes['density'] = Measurement.calculate_density(
+        attributes['inclination'],
+        context.coefficient,
+        context.offset
+    )
+    return attributes
+
+
+def build_measurements(session, readings):
+    """Returns list of measurement column values for list of parsed readings. Sensor context is resolved only once
+    per distinct mac address."""
+    contexts = {}
+    measurements = []
+    for attributes in readings:
+        mac_address = attributes['sensor_mac_address']
+        if mac_address not in contexts:
+            contexts[mac_address] = get_sensor_context(session, mac_address)
+        measurements.append(build_measurement(contexts[mac_address], attributes))
+    return measurements
+
+
+def _key(measurement):
+    return measurement['id_sensor'], measurement['timestamp']
+
+
+def _select_by_key(session, columns, keys):
+    """Returns rows of columns of stored measurements whose (sensor, timestamp) is in keys"""
+    table = Measurement.__table__
+    key = tuple_(table.c.id_sensor, table.c.timestamp)
+    rows = []
+    for start in range(0, len(keys), INSERT_CHUNK_SIZE):
+        rows += session.execute(select(*columns).where(key.in_(keys[start:start + INSERT_CHUNK_SIZE]))).all()
+    return rows
+
+
+def insert_measurements(session, measurements):
+    """Inserts measurement column values, skipping readings of a sensor and timestamp already stored or repeated.
+    Returns list of column values of the inserted measurements, with their id."""
+    table = Measurement.__table__
+    key_columns = [table.c.id_sensor, table.c.timestamp]
+    unique = {}
+    for measurement in measurements:
+        unique.setdefault(_key(measurement), measurement)
+    measurements = list(unique.values())
+    if session.bind.dialect.name == 'postgresql':
+        inserted = []
+        for start in range(0, len(measurements), INSERT_CHUNK_SIZE):
+            statement = postgresql.insert(table).values(measurements[start:start + INSERT_CHUNK_SIZE])\
+                .on_conflict_do_nothing(index_elements=key_columns).returning(*table.c)
+            inserted += [dict(row._mapping) for row in session.execute(statement)]
+        return inserted
+    # Without RETURNING, stored readings are looked up first and inserted rows are read back. SQLite's single writer
+    # only lets other transactions commit readings before the first write of this one.
+    stored = {tuple(row) for row in _select_by_key(session, key_columns, [_key(row) for row in measurements])}
+    measurements = [measurement for measurement in measurements if _key(measurement) not in stored]
+    if not measurements:
+        return []
+    session.execute(table.insert().prefix_with('OR IGNORE'), measurements)
+    return [dict(row._mapping) for row in _select_by_key(session, [table], [_key(row) for row in measurements])]
+
+
+def store_measurements(session, readings):
+    """Inserts measurements of list of parsed readings in session transaction, skipping readings already stored, and
+    updates the summaries of their events. Returns list of column values of the inserted measurements."""
+    measurements = insert_measurements(session, build_measurements(session, readings))
+    if measurements:
+        update_summaries(session, measurements, stored=True)
+        touch_rows(session, Measurement.__tablename__, measurements)
+    return measurements
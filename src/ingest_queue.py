@@ -0,0 +1,338 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy.exc import SQLAlchemyError, DBAPIError, InterfaceError, OperationalError
+
+from config import INGEST_MODE, INGEST_QUEUE_SIZE, INGEST_FLUSH_ROWS, INGEST_FLUSH_INTERVAL, INGEST_SPOOL_DIRECTORY, \
+    INGEST_MAX_ATTEMPTS
+from models import db
+from ingest import store_measurements
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_INTERVAL = 1
+
+dead_letters = metrics.Counter('ingest_dead_letters_total', 'Queued readings set aside as they can not be stored')
+
+
+class QueueFull(Exception):
+    """Raised when a reading is added to a full ingest queue"""
+
+
+def _encode(reading):
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in reading.items()}
+
+
+def _decode(reading):
+    reading = dict(reading)
+    reading['timestamp'] = datetime.fromisoformat(reading['timestamp'])
+    return reading
+
+
+def is_transient(error):
+    """Returns whether error may not happen again, such as a lost connection, a deadlock or a timeout, rather than
+    being caused by the readings"""
+    return not isinstance(error, DBAPIError) or error.connection_invalidated \
+        or isinstance(error, (OperationalError, InterfaceError))
+
+
+class Spool:
+    """Append-only file of queued readings, so that they survive a restart. The sequence number of the last committed
+    reading is kept in a separate file, and readings after it are replayed on start.
+
+    Every process claims its own spool with an exclusive lock on <name>-<n>.lock, so several worker processes can share
+    a spool directory and a restarted process picks up a spool left behind. Spools no process claims, left by
+    processes which are gone for good after reducing the number of workers, are adopted by starting processes.
+    Readings which can not be stored are set aside in ingest-dead.ndjson."""
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        index = 0
+        while True:
+            lock = open(os.path.join(directory, f'ingest-{index}.lock'), 'w')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                lock.close()
+                index += 1
+        self._lock = lock
+        self.index = index
+        self.path = os.path.join(directory, f'ingest-{index}.ndjson')
+        self.committed_path = os.path.join(directory, f'ingest-{index}.committed')
+        self.dead_letter_path = os.path.join(directory, 'ingest-dead.ndjson')
+        self.appended = 0
+        self._file = open(self.path, 'a')
+
+    def pending(self):
+        """Returns list of (sequence, reading) spooled but not committed"""
+        return self._read_pending(self.path, self.committed_path)
+
+    def adopt_orphans(self, sequence):
+        """Moves pending readings of spools no process claims into this spool, numbered after sequence. Returns list of
+        their (sequence, reading)."""
+        adopted = []
+        for name in sorted(os.listdir(self.directory)):
+            index = name[len('ingest-'):-len('.lock')]
+            if not (name.startswith('ingest-') and name.endswith('.lock') and index.isdigit()) \
+                    or int(index) == self.index:
+                continue
+            lock = open(os.path.join(self.directory, name), 'w')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                continue
+            try:
+                path = os.path.join(self.directory, f'ingest-{index}.ndjson')
+                committed_path = os.path.join(self.directory, f'ingest-{index}.committed')
+                if not os.path.exists(path):
+                    continue
+                for _, reading in self._read_pending(path, committed_path):
+                    sequence += 1
+                    self.append(sequence, reading)
+                    adopted.append((sequence, reading))
+                # Adopted readings must be durable here before the orphan spool is deleted
+                os.fsync(self._file.fileno())
+                os.remove(path)
+                if os.path.exists(committed_path):
+                    os.remove(committed_path)
+            finally:
+                lock.close()
+        return adopted
+
+    def dead_letter(self, reading, error):
+        """Appends reading which can not be stored to the dead letter file, with the error"""
+        # Database errors without the statement and its parameters
+        message = str(getattr(error, 'orig', None) or error).strip()
+        line = json.dumps({'reading': _encode(reading), 'error': message, 'time': datetime.now().isoformat()})
+        with open(self.dead_letter_path, 'a') as file:
+            file.write(line + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    @classmethod
+    def _read_pending(cls, path, committed_path):
+        committed = 0
+        if os.path.exists(committed_path):
+            with open(committed_path) as file:
+                committed = int(file.read() or 0)
+        entries = []
+        with open(path) as file:
+            for line in file:
+                try:
+                    sequence, reading = json.loads(line)
+                except ValueError:
+                    # Last line may be incomplete after a crash
+                    continue
+                if sequence > committed:
+                    entries.append((sequence, _decode(reading)))
+        return entries
+
+    def append(self, sequence, reading):
+        self._file.write(json.dumps([sequence, _encode(reading)]) + '\n')
+        self._file.flush()
+        self.appended += 1
+
+    def commit(self, sequence):
+        """Records that every reading up to sequence is stored"""
+        self._replace(self.committed_path, str(sequence))
+
+    def compact(self, entries):
+        """Replaces spool content with given (sequence, reading) entries"""
+        self._file.close()
+        lines = [json.dumps([sequence, _encode(reading)]) + '\n' for sequence, reading in entries]
+        try:
+            self._replace(self.path, ''.join(lines))
+        finally:
+            # Readings keep being appended to the previous content if it could not be replaced
+            self._file = open(self.path, 'a')
+        self.appended = len(entries)
+
+    @classmethod
+    def _replace(cls, path, content):
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+
+
+class IngestQueue:
+    """Bounded in-process queue of parsed readings, stored in group commits of up to flush_rows readings, or of
+    whatever is queued once the oldest reading waited flush_interval seconds.
+
+    A group failing max_attempts times in a row for a reason other than the database being unavailable is stored in
+    halves, recursively, and readings failing alone are set aside as dead letters, so that they do not hold back the
+    queue."""
+    def __init__(self, maxsize, flush_rows, flush_interval, spool=None, max_attempts=INGEST_MAX_ATTEMPTS):
+        self.maxsize = maxsize
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.spool = spool
+        self.max_attempts = max_attempts
+        self._failures = 0
+        self._entries = deque()
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def restore(self):
+        """Queues readings left in spool by a previous process, and in spools of processes which are gone"""
+        with self._condition:
+            for sequence, reading in self.spool.pending():
+                self._entries.append((sequence, reading, time.monotonic()))
+                self._sequence = max(self._sequence, sequence)
+            restored = len(self._entries)
+            for sequence, reading in self.spool.adopt_orphans(self._sequence):
+                self._entries.append((sequence, reading, time.monotonic()))
+                self._sequence = sequence
+        if restored:
+            logger.info("Restored %s spooled readings from %s", restored, self.spool.path)
+        if len(self._entries) > restored:
+            logger.info("Adopted %s readings of orphan spools", len(self._entries) - restored)
+
+    def put(self, reading):
+        """Queues parsed reading. Raises QueueFull if queue holds maxsize readings."""
+        with self._condition:
+            if len(self._entries) >= self.maxsize:
+                raise QueueFull()
+            self._sequence += 1
+            if self.spool:
+                self.spool.append(self._sequence, reading)
+            self._entries.append((self._sequence, reading, time.monotonic()))
+            # The worker waits without timeout while the queue is empty
+            if len(self._entries) == 1 or len(self._entries) >= self.flush_rows:
+                self._condition.notify()
+
+    def _take(self):
+        """Waits until a group is due and removes it from queue"""
+        with self._condition:
+            while True:
+                if self._entries:
+                    remaining = self._entries[0][2] + self.flush_interval - time.monotonic()
+                    if len(self._entries) >= self.flush_rows or remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                else:
+                    self._condition.wait()
+            return [self._entries.popleft() for _ in range(min(self.flush_rows, len(self._entries)))]
+
+    def flush(self, session):
+        """Stores next due group of readings in a single transaction. Readings are queued again if it fails, or if the
+        spool can not be updated."""
+        entries = self._take()
+        metrics.ingest_queue_depth.observe(len(self._entries) + len(entries))
+        started = time.perf_counter()
+        try:
+            try:
+                self._store(session, entries)
+            except SQLAlchemyError as error:
+                self._failures += 1
+                if is_transient(error) or self._failures < self.max_attempts:
+                    raise
+                logger.warning("Storing %s queued readings failed %s times, isolating failing readings: %s",
+                               len(entries), self._failures, error)
+                self._isolate(session, entries, error)
+            self._failures = 0
+            stored = time.monotonic()
+            metrics.ingest_flush_duration.observe(time.perf_counter() - started)
+            for _, _, queued in entries:
+                metrics.ingest_latency.observe(stored - queued)
+            if self.spool:
+                self.spool.commit(entries[-1][0])
+                if self.spool.appended > self.maxsize:
+                    with self._condition:
+                        self.spool.compact([(sequence, reading) for sequence, reading, _ in self._entries])
+        except Exception:
+            # Readings already stored, by isolated groups or before the spool failed, are skipped as duplicates when
+            # retried
+            with self._condition:
+                self._entries.extendleft(reversed(entries))
+            raise
+
+    @classmethod
+    def _store(cls, session, entries):
+        try:
+            store_measurements(session, [reading for _, reading, _ in entries])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+    def _isolate(self, session, entries, error):
+        """Stores entries, which failed together with error, in halves recursively. A reading failing alone is moved
+        to the dead letters."""
+        if len(entries) == 1:
+            _, reading, _ = entries[0]
+            logger.error("Setting aside reading %s: %s", reading, error)
+            if self.spool:
+                self.spool.dead_letter(reading, error)
+            dead_letters.inc()
+            return
+        middle = len(entries) // 2
+        for half in (entries[:middle], entries[middle:]):
+            try:
+                self._store(session, half)
+            except SQLAlchemyError as half_error:
+                if is_transient(half_error):
+                    raise
+                self._isolate(session, half, half_error)
+
+
+class IngestWorker(threading.Thread):
+    """Thread flushing ingest queue"""
+    def __init__(self, app, queue):
+        super().__init__(name='ingest-worker', daemon=True)
+        self.app = app
+        self.queue = queue
+
+    def run(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    self.queue.flush(db.session)
+                except Exception:
+                    logger.exception("Unable to store queued readings, retrying in %s s", RETRY_INTERVAL)
+                    time.sleep(RETRY_INTERVAL)
+                finally:
+                    db.session.remove()
+
+
+ingest_queue = None
+
+metrics.Gauge('ingest_queue_readings', 'Readings waiting in the ingest queue', (),
+              lambda: [((), len(ingest_queue) if ingest_queue is not None else 0)])
+
+
+def start(app):
+    """Creates ingest queue, restores spooled readings and starts its worker, if ingest mode is async"""
+    global ingest_queue
+    if INGEST_MODE != 'async' or ingest_queue is not None:
+        return
+    spool = Spool(INGEST_SPOOL_DIRECTORY) if INGEST_SPOOL_DIRECTORY else None
+    ingest_queue = IngestQueue(INGEST_QUEUE_SIZE, INGEST_FLUSH_ROWS, INGEST_FLUSH_INTERVAL, spool)
+    if spool:
+        ingest_queue.restore()
+    IngestWorker(app, ingest_queue).start()
+
+
+def is_enabled():
+    """Returns whether readings are queued instead of stored in the request"""
+    return ingest_queue is not None
+
+
+def enqueue(reading):
+    """Queues parsed reading. Raises QueueFull if the queue is full."""
+    ingest_queue.put(reading)
@@ -0,0 +1,105 @@
+"""Set-based attachment of measurements to SENSOR events and closing of TIMED events.
+
+Measurements of a sensor taken during one of its SENSOR events belong to it. Creating an event attaches the sensor's
+orphan measurements and roll-ups inside its window with one UPDATE per table, and finishing it detaches those taken
+from the finish time on, whatever their number. TIMED events last duration minutes from their start; a scheduler
+thread finishes them every EVENT_SCHEDULER_INTERVAL seconds once their time has passed.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import EVENT_SCHEDULER, EVENT_SCHEDULER_INTERVAL
+from models import db, Event, EventType, Measurement, MeasurementRollup
+from summary import rebuild_summary
+from versions import touch
+
+
+logger = logging.getLogger(__name__)
+
+
+def _update_measurements(session, event, conditions, id_event):
+    """Sets event of measurements and roll-ups of event's sensor matching conditions, a function of the table. Returns
+    number of updated rows."""
+    updated = 0
+    for table in (Measurement, MeasurementRollup):
+        rows = session.query(table).filter(*conditions(table))\
+            .update({'id_event': id_event}, synchronize_session=False)
+        if rows:
+            touch(session, (table.__tablename__, 'id_sensor', event.id_sensor),
+                  (table.__tablename__, 'id_event', event.id))
+        updated += rows
+    return updated
+
+
+def attach_measurements(session, event):
+    """Attaches orphan measurements and roll-ups of event's sensor taken after its start, and before its finish if any,
+    and recomputes its summary. The event must be flushed."""
+    def conditions(table):
+        window = [table.id_event.is_(None), table.id_sensor == event.id_sensor, table.timestamp > event.start]
+        if event.finish is not None:
+            window.append(table.timestamp < event.finish)
+        return window
+
+    if _update_measurements(session, event, conditions, event.id):
+        rebuild_summary(session, event.id)
+
+
+def detach_measurements(session, event):
+    """Detaches measurements and roll-ups of event taken from its finish on and recomputes its summary"""
+    def conditions(table):
+        return [table.id_event == event.id, table.timestamp >= event.finish]
+
+    if _update_measurements(session, event, conditions, None):
+        rebuild_summary(session, event.id)
+
+
+def finish_event(session, event, finish):
+    """Sets finish of event, detaching the measurements of its sensor taken from then on"""
+    event.finish = finish
+    if event.id_sensor:
+        detach_measurements(session, event)
+
+
+def close_timed_events(session, now=None):
+    """Finishes TIMED events whose duration has passed, at start + duration. Returns number of finished events."""
+    now = now or datetime.now()
+    events = Event.query.filter(Event.event_type == EventType.TIMED)\
+        .filter(Event.finish.is_(None))\
+        .filter(Event.start <= now)\
+        .with_for_update(skip_locked=True).all()
+    closed = 0
+    for event in events:
+        finish = event.start + timedelta(minutes=event.duration or 0)
+        if finish <= now:
+            finish_event(session, event, finish)
+            closed += 1
+    session.commit()
+    return closed
+
+
+class EventScheduler(threading.Thread):
+    """Thread finishing due TIMED events every EVENT_SCHEDULER_INTERVAL seconds"""
+    def __init__(self, app):
+        super().__init__(name='event-scheduler', daemon=True)
+        self.app = app
+
+    def run(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    closed = close_timed_events(db.session)
+                    if closed:
+                        logger.info("Finished %s timed events", closed)
+                except Exception:
+                    logger.exception("Event scheduler failed")
+                finally:
+                    db.session.remove()
+            time.sleep(EVENT_SCHEDULER_INTERVAL)
+
+
+def start_worker(app):
+    """Starts event scheduler thread for app, unless disabled by configuration"""
+    if EVENT_SCHEDULER:
+        EventScheduler(app).start()
@@ -0,0 +1,191 @@
+"""Ingest of compact binary readings sent by sensors as UDP datagrams or over persistent TCP connections.
+
+A frame is 20 bytes in network byte order: MAC address (6 bytes), inclination and temperature (32-bit floats), battery
+(unsigned 16-bit) and timestamp (unsigned 32-bit seconds since epoch, 0 for the time of arrival). A datagram holds one
+or more frames, a TCP connection a stream of frames. Frames received together are decoded in bulk and stored like
+measurement POSTs, through the ingest queue in async ingest mode. Every frame is counted by result in
+ingest_frames_total: stored (or queued), duplicate (already stored), invalid (failed validation or rejected by the
+database), malformed (truncated) or dropped (queue full or storage failure).
+"""
+import logging
+import socket
+import socketserver
+import struct
+import threading
+from datetime import datetime
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import INGEST_LISTENER_HOST, INGEST_UDP_PORT, INGEST_TCP_PORT
+from models import db
+from ingest import ReadingError, parse_reading, store_measurements
+import ingest_queue
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+FRAME = struct.Struct('!6sffHI')
+# Datagrams drained from the socket before storing them together
+MAX_DATAGRAMS = 256
+MAX_DATAGRAM_SIZE = 65507
+
+frames = metrics.Counter('ingest_frames_total', 'Binary reading frames by transport and result',
+                         ('transport', 'result'))
+
+
+def decode_frame(mac_address, inclination, temperature, battery, timestamp):
+    """Returns parsed reading of unpacked frame fields, validated like a measurement POST. Raises ReadingError if it is
+    not valid."""
+    reading = {
+        'sensor_mac_address': ':'.join(f'{byte:02X}' for byte in mac_address),
+        'inclination': inclination,
+        'temperature': temperature,
+        'battery': battery,
+    }
+    if timestamp:
+        reading['timestamp'] = datetime.fromtimestamp(timestamp).isoformat()
+    return parse_reading(reading)
+
+
+def decode_frames(data):
+    """Decodes concatenated frames. Returns list of parsed readings, number of invalid frames and number of trailing
+    bytes not forming a whole frame."""
+    whole = len(data) - len(data) % FRAME.size
+    readings = []
+    invalid = 0
+    for fields in FRAME.iter_unpack(memoryview(data)[:whole]):
+        try:
+            readings.append(decode_frame(*fields))
+        except ReadingError:
+            invalid += 1
+    return readings, invalid, len(data) - whole
+
+
+def _store_group(transport, readings):
+    """Stores readings in a single transaction. When the database rejects them, stores them in halves recursively, so
+    that a reading it rejects does not drop the frames received with it. Returns numbers of stored, duplicate and
+    rejected readings."""
+    try:
+        stored = len(store_measurements(db.session, readings))
+        db.session.commit()
+        return stored, len(readings) - stored, 0
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        if ingest_queue.is_transient(error):
+            logger.exception("Unable to store %s readings received by %s", len(readings), transport)
+            return 0, 0, 0
+        if len(readings) == 1:
+            logger.error("Rejected reading %s received by %s: %s", readings[0], transport, error)
+            return 0, 0, 1
+    middle = len(readings) // 2
+    counts = zip(_store_group(transport, readings[:middle]), _store_group(transport, readings[middle:]))
+    return tuple(first + second for first, second in counts)
+
+
+def store_readings(app, transport, readings):
+    """Stores parsed readings, queued in async ingest mode or in as few transactions as possible otherwise, and counts
+    them"""
+    if not readings:
+        return
+    stored = duplicates = rejected = 0
+    if ingest_queue.is_enabled():
+        for reading in readings:
+            reading.setdefault('timestamp', datetime.now())
+            try:
+                ingest_queue.enqueue(reading)
+            except ingest_queue.QueueFull:
+                break
+            stored += 1
+    else:
+        with app.app_context():
+            try:
+                stored, duplicates, rejected = _store_group(transport, readings)
+            finally:
+                db.session.remove()
+    frames.inc(transport, 'stored', amount=stored)
+    if duplicates:
+        frames.inc(transport, 'duplicate', amount=duplicates)
+    if rejected:
+        frames.inc(transport, 'invalid', amount=rejected)
+    if stored + duplicates + rejected < len(readings):
+        frames.inc(transport, 'dropped', amount=len(readings) - stored - duplicates - rejected)
+
+
+def receive(app, transport, data):
+    """Decodes and stores frames received together. Returns number of trailing bytes not forming a whole frame."""
+    readings, invalid, remainder = decode_frames(data)
+    if invalid:
+        frames.inc(transport, 'invalid', amount=invalid)
+    store_readings(app, transport, readings)
+    return remainder
+
+
+def _bind(sock, address):
+    # Every server worker process binds the same port, the kernel spreads datagrams and connections between them
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(address)
+
+
+class UdpListener(threading.Thread):
+    """Thread receiving datagrams of frames, storing those waiting together"""
+    def __init__(self, app, address):
+        super().__init__(name='udp-listener', daemon=True)
+        self.app = app
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        _bind(self.socket, address)
+
+    def run(self):
+        while True:
+            datagrams = [self.socket.recv(MAX_DATAGRAM_SIZE)]
+            try:
+                while len(datagrams) < MAX_DATAGRAMS:
+                    datagrams.append(self.socket.recv(MAX_DATAGRAM_SIZE, socket.MSG_DONTWAIT))
+            except BlockingIOError:
+                pass
+            malformed = sum(len(datagram) % FRAME.size != 0 for datagram in datagrams)
+            if malformed:
+                frames.inc('udp', 'malformed', amount=malformed)
+            try:
+                # Frames of a datagram with trailing bytes are still decoded, only the truncated frame is dropped
+                payload = b''.join(datagram[:len(datagram) - len(datagram) % FRAME.size] for datagram in datagrams)
+                receive(self.app, 'udp', payload)
+            except Exception:
+                logger.exception("UDP listener failed")
+
+
+class _TcpHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        buffer = b''
+        while True:
+            data = self.request.recv(MAX_DATAGRAM_SIZE)
+            if not data:
+                break
+            buffer += data
+            remainder = receive(self.server.app, 'tcp', buffer)
+            buffer = buffer[len(buffer) - remainder:]
+        if buffer:
+            frames.inc('tcp', 'malformed')
+
+
+class _TcpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self, app, address):
+        self.app = app
+        super().__init__(address, _TcpHandler)
+
+    def server_bind(self):
+        _bind(self.socket, self.server_address)
+        self.server_address = self.socket.getsockname()
+
+
+def start(app):
+    """Starts UDP and TCP listeners on their configured ports. Listeners of ports set to 0 are not started."""
+    if INGEST_UDP_PORT:
+        UdpListener(app, (INGEST_LISTENER_HOST, INGEST_UDP_PORT)).start()
+    if INGEST_TCP_PORT:
+        server = _TcpServer(app, (INGEST_LISTENER_HOST, INGEST_TCP_PORT))
+        threading.Thread(target=server.serve_forever, name='tcp-listener', daemon=True).start()
@@ -0,0 +1,222 @@
+"""In-process publish/subscribe of committed measurements and finished recalibrations, feeding live streams.
+
+A single poller thread per process reads the measurements committed since its previous poll, by any process, and fans
+them out to the subscriptions of their event and sensor. It only queries measurements when the version of the table
+changed, and commits of this process wake it up at once, so idle subscriptions cost no queries. Ids skipped by a poll,
+which may belong to a transaction committing later, are looked up again until STREAM_GAP_TIMEOUT seconds passed.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from sqlalchemy import or_, select
+
+from config import STREAM_CHUNK_SIZE, STREAM_POLL_INTERVAL, STREAM_QUEUE_SIZE, STREAM_GAP_TIMEOUT, \
+    STREAM_MAX_CONNECTIONS
+from models import db, Event, Measurement, RecalibrationJob, RecalibrationStatus
+from versions import get_versions, on_commit
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+MAX_GAPS = 10000
+
+_watched_resources = (Measurement.__tablename__, RecalibrationJob.__tablename__)
+
+
+class Subscription:
+    """Bounded queue of (kind, row) messages of a topic. A subscriber too slow to keep up is marked overflowed and
+    should disconnect, to resume from its last received message. Measurements after last_id are published to it, the
+    subscriber reads those up to it from the database."""
+    def __init__(self, topic, maxsize, last_id):
+        self.topic = topic
+        self.maxsize = maxsize
+        self.last_id = last_id
+        self.overflowed = False
+        self._messages = deque()
+        self._available = threading.Event()
+
+    def put(self, message):
+        if len(self._messages) >= self.maxsize:
+            self.overflowed = True
+        else:
+            self._messages.append(message)
+        self._available.set()
+
+    def get(self, timeout):
+        """Returns list of queued messages, waiting up to timeout seconds for one. Empty if none arrived."""
+        if not self._messages:
+            self._available.wait(timeout)
+        self._available.clear()
+        messages = []
+        while self._messages:
+            messages.append(self._messages.popleft())
+        return messages
+
+
+class Broker:
+    """Subscriptions by topic, a (kind, id) tuple such as ('event', 1)"""
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        self._active = threading.Condition(self._lock)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def subscribe(self, topic, last_id, maxsize=STREAM_QUEUE_SIZE):
+        subscription = Subscription(topic, maxsize, last_id)
+        with self._lock:
+            self._subscriptions[topic].add(subscription)
+            self._active.notify_all()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.topic)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.topic]
+
+    def publish(self, topic, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(topic, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+    def first_id(self):
+        """Returns lowest last measurement id of subscriptions, None if there is none"""
+        with self._lock:
+            return min((subscription.last_id for subscriptions in self._subscriptions.values()
+                        for subscription in subscriptions), default=None)
+
+    def wait_for_subscriptions(self):
+        """Blocks while there is no subscription. Returns whether it blocked."""
+        with self._lock:
+            if self._subscriptions:
+                return False
+            while not self._subscriptions:
+                self._active.wait()
+            return True
+
+
+broker = Broker()
+# Open streams of this process, each one holding a request thread or greenlet
+streams = threading.BoundedSemaphore(STREAM_MAX_CONNECTIONS)
+
+metrics.Gauge('live_subscriptions', 'Subscriptions to live measurement streams', (), lambda: [((), len(broker))])
+
+
+class Poller(threading.Thread):
+    """Thread publishing measurements and recalibrations committed by any process"""
+    def __init__(self, app):
+        super().__init__(name='live-poller', daemon=True)
+        self.app = app
+        self.versions = None
+        self.last_id = None
+        self.last_finished = None
+        # Ids skipped by a poll by time they were first missed
+        self.gaps = {}
+        self.wakeup = threading.Event()
+
+    def notify(self, resources):
+        """Wakes poller up if a committed transaction wrote to a watched table"""
+        if not resources.isdisjoint(_watched_resources):
+            self.wakeup.set()
+
+    def run(self):
+        while True:
+            if broker.wait_for_subscriptions():
+                # Nobody received what was committed meanwhile, new subscribers start from their last_id
+                self.versions = None
+                self.gaps = {}
+            with self.app.app_context():
+                try:
+                    self.poll(db.session)
+                except Exception:
+                    logger.exception("Live poller failed")
+                finally:
+                    db.session.remove()
+            self.wakeup.wait(STREAM_POLL_INTERVAL)
+            self.wakeup.clear()
+
+    def poll(self, session):
+        versions = get_versions(session, _watched_resources)
+        if self.versions is None:
+            # Subscribers replay history from the database up to the id they subscribed at, which may be before this
+            # poll, so what was committed after it is published at once
+            self.last_id = broker.first_id()
+            if self.last_id is None:
+                self.last_id = session.query(db.func.max(Measurement.id)).scalar() or 0
+            self.last_finished = session.query(db.func.max(RecalibrationJob.finished)).scalar()
+            self.publish_measurements(session)
+        else:
+            if versions[Measurement.__tablename__] != self.versions[Measurement.__tablename__]:
+                self.publish_measurements(session)
+            if versions[RecalibrationJob.__tablename__] != self.versions[RecalibrationJob.__tablename__]:
+                self.publish_recalibrations(session)
+        self.versions = versions
+
+    def publish_measurements(self, session):
+        """Publishes measurements found in skipped ids and those after the last published id, in pages of
+        STREAM_CHUNK_SIZE rows"""
+        table = Measurement.__table__
+        now = time.monotonic()
+        if self.gaps:
+            self.publish_rows(session.execute(
+                select(table).where(table.c.id.in_(list(self.gaps))).order_by(table.c.id)
+            ).all(), now)
+        while True:
+            rows = session.execute(
+                select(table).where(table.c.id > self.last_id).order_by(table.c.id).limit(STREAM_CHUNK_SIZE)
+            ).all()
+            self.publish_rows(rows, now)
+            if len(rows) < STREAM_CHUNK_SIZE:
+                break
+        expired = now - STREAM_GAP_TIMEOUT
+        self.gaps = {missing: missed for missing, missed in self.gaps.items() if missed > expired}
+        if len(self.gaps) > MAX_GAPS:
+            self.gaps = dict(sorted(self.gaps.items())[-MAX_GAPS:])
+
+    def publish_rows(self, rows, now):
+        for row in rows:
+            self.gaps.pop(row.id, None)
+            if row.id > self.last_id:
+                self.gaps.update((missing, now) for missing in range(self.last_id + 1, row.id))
+                self.last_id = row.id
+            if row.id_event is not None:
+                broker.publish(('event', row.id_event), ('measurement', row))
+            broker.publish(('sensor', row.id_sensor), ('measurement', row))
+
+    def publish_recalibrations(self, session):
+        table = RecalibrationJob.__table__
+        statement = select(table).where(table.c.status == RecalibrationStatus.FINISHED)
+        if self.last_finished is not None:
+            statement = statement.where(table.c.finished > self.last_finished)
+        for job in session.execute(statement.order_by(table.c.finished)).all():
+            self.last_finished = job.finished
+            broker.publish(('sensor', job.id_sensor), ('recalibration', job))
+            events = session.query(Event.id).filter(Event.id_sensor == job.id_sensor)
+            if job.window_end is not None:
+                events = events.filter(Event.start < job.window_end)
+            if job.window_start is not None:
+                events = events.filter(or_(Event.finish.is_(None), Event.finish > job.window_start))
+            for id_event, in events:
+                broker.publish(('event', id_event), ('recalibration', job))
+
+
+poller = None
+
+
+def start(app):
+    """Starts live poller of app. It stays idle until something subscribes."""
+    global poller
+    if poller is not None:
+        return
+    poller = Poller(app)
+    on_commit(poller.notify)
+    poller.start()
@@ -0,0 +1,246 @@
+"""Request, SQL and ingest instrumentation, exposed in Prometheus text format at /metrics.
+
+Every SQL statement is timed with engine events and attributed to the request running it, so that each request records
+its wall time, query count and SQL time by endpoint and method. Parts of a request, such as sensor lookups, summary
+updates, commit and marshalling, are timed as phases. Statements slower than SLOW_QUERY_THRESHOLD milliseconds are
+logged. Metrics are kept in memory by each process; with several server workers, each worker reports its own.
+"""
+import abc
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import METRICS, SLOW_QUERY_THRESHOLD
+from cache import sensor_context_cache, response_cache
+from models import db
+
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+DEPTH_BUCKETS = (0, 10, 50, 100, 500, 1000, 5000, 10000)
+
+registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Metric(abc.ABC):
+    """Metric with values by tuple of label values, registered to be rendered at /metrics"""
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def render(self):
+        """Returns list of lines of metric in text format"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for name, labels, values, value in self.samples():
+            lines.append(f'{name}{_format_labels(labels, values)} {value}')
+        return lines
+
+    @abc.abstractmethod
+    def samples(self):
+        """Yields (sample name, label names, label values, value)"""
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, self.labels, labels, value
+
+
+class Gauge(Metric):
+    """Metric read when rendered from collect, a function returning a list of (label values, value). Counters kept
+    elsewhere are exposed as gauges of type counter."""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), collect=None, type=None):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+        if type is not None:
+            self.type = type
+
+    def samples(self):
+        for labels, value in self.collect():
+            yield self.name, self.labels, labels, value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # Counts are kept by bucket and only accumulated when rendered
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(counts)) for labels, counts in self._values.items()]
+        bucket_labels = self.labels + ('le',)
+        for labels, counts in values:
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                yield f'{self.name}_bucket', bucket_labels, labels + (bound,), total
+            yield f'{self.name}_sum', self.labels, labels, counts[-1]
+            yield f'{self.name}_count', self.labels, labels, total
+
+
+def render():
+    """Returns every registered metric in Prometheus text format"""
+    lines = []
+    for metric in registry:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+requests = Counter('http_requests_total', 'Requests by endpoint, method and status', ('endpoint', 'method', 'status'))
+request_duration = Histogram('http_request_duration_seconds', 'Wall time of requests until the response is returned',
+                             ('endpoint', 'method'))
+request_queries = Histogram('http_request_sql_queries', 'SQL statements run by requests', ('endpoint', 'method'),
+                            COUNT_BUCKETS)
+request_sql_duration = Histogram('http_request_sql_duration_seconds', 'Total SQL time of requests',
+                                 ('endpoint', 'method'))
+phase_duration = Histogram('phase_duration_seconds', 'Wall time of parts of requests and background work',
+                           ('endpoint', 'method', 'phase'))
+query_duration = Histogram('sql_query_duration_seconds', 'Time of SQL statements by statement type', ('statement',))
+slow_queries = Counter('sql_slow_queries_total', 'SQL statements slower than the slow query threshold')
+ingest_latency = Histogram('ingest_latency_seconds', 'Time from queueing a reading to committing it')
+ingest_queue_depth = Histogram('ingest_queue_depth', 'Readings in the ingest queue when a group is flushed', (),
+                               DEPTH_BUCKETS)
+ingest_flush_duration = Histogram('ingest_flush_duration_seconds', 'Time of storing and committing a group of readings')
+
+
+def _cache_stats():
+    return {'sensor_context': sensor_context_cache.stats(), 'response': response_cache.stats()}
+
+
+Gauge('cache_entries', 'Entries of in-memory caches', ('cache',),
+      lambda: [((name,), stats['size']) for name, stats in _cache_stats().items()])
+Gauge('cache_hits_total', 'Hits of in-memory caches', ('cache',),
+      lambda: [((name,), stats['hits']) for name, stats in _cache_stats().items()], type='counter')
+Gauge('cache_misses_total', 'Misses of in-memory caches', ('cache',),
+      lambda: [((name,), stats['misses']) for name, stats in _cache_stats().items()], type='counter')
+
+
+def _pool_stats():
+    pool = db.engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return []
+    return [(('checked_out',), pool.checkedout()), (('idle',), pool.checkedin()), (('overflow',), pool.overflow())]
+
+
+Gauge('db_pool_connections', 'Connections of the database pool of this process', ('state',), _pool_stats)
+
+
+def _get_labels():
+    """Returns endpoint and method labels of the current request"""
+    if has_request_context():
+        return request.endpoint or 'unmatched', request.method
+    return 'background', ''
+
+
+@contextmanager
+def phase(name):
+    """Times the enclosed block as a phase of the current request, or of background work outside requests"""
+    if not METRICS:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phase_duration.observe(time.perf_counter() - started, *_get_labels(), name)
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - connection.info['query_start'].pop()
+    query_duration.observe(duration, statement.lstrip().split(None, 1)[0].upper())
+    if has_request_context() and 'metrics' in g:
+        g.metrics['queries'] += 1
+        g.metrics['sql_time'] += duration
+    if SLOW_QUERY_THRESHOLD and duration * 1000 >= SLOW_QUERY_THRESHOLD:
+        slow_queries.inc()
+        logger.warning("Slow query (%.1f ms) in %s %s: %s", duration * 1000, *_get_labels(),
+                       ' '.join(statement.split())[:1000])
+
+
+def _handle_error(context):
+    if context.connection is not None and context.connection.info.get('query_start'):
+        context.connection.info['query_start'].pop()
+
+
+def _before_request():
+    g.metrics = {'started': time.perf_counter(), 'queries': 0, 'sql_time': 0.0}
+
+
+def _after_request(response):
+    if 'metrics' in g:
+        endpoint, method = _get_labels()
+        requests.inc(endpoint, method, response.status_code)
+        request_duration.observe(time.perf_counter() - g.metrics['started'], endpoint, method)
+        request_queries.observe(g.metrics['queries'], endpoint, method)
+        request_sql_duration.observe(g.metrics['sql_time'], endpoint, method)
+    return response
+
+
+_engine_events = [
+    ('before_cursor_execute', _before_cursor_execute),
+    ('after_cursor_execute', _after_cursor_execute),
+    ('handle_error', _handle_error),
+]
+
+
+def init_app(app):
+    """Installs request hooks on app and SQL statement timing on every engine, unless disabled by configuration"""
+    if not METRICS:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    for name, listener in _engine_events:
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
@@ -0,0 +1,122 @@
+"""Applies pending versioned migrations from the migrations directory to the configured database.
+
+Migrations are SQL files named <version>_<name>.sql, applied in version order and recorded in schema_migrations. Each
+file runs in its own transaction, unless its first line is the no-transaction marker, in which case its statements
+run one by one in autocommit mode (required by CREATE INDEX CONCURRENTLY).
+
+SQL migrations target PostgreSQL. Other databases, such as SQLite used for local testing, are created from the models
+and every migration is recorded as applied.
+
+Usage: python migrate.py [--list]
+"""
+import argparse
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+
+from config import DATABASE_URI
+from models import db
+
+
+MIGRATIONS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+NO_TRANSACTION_MARKER = '-- migrate: no-transaction'
+ADVISORY_LOCK_KEY = 0x6d696772
+
+Migration = namedtuple('Migration', ['version', 'name', 'path'])
+
+
+def get_migrations():
+    """Returns list of migrations found in migrations directory, ordered by version"""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIRECTORY):
+        match = re.fullmatch(r'(\d+)_(\w+)\.sql', filename)
+        if match:
+            migrations.append(Migration(match.group(1), match.group(2), os.path.join(MIGRATIONS_DIRECTORY, filename)))
+    return sorted(migrations)
+
+
+def get_applied_versions(connection):
+    """Returns set of versions recorded in schema_migrations, creating the table if needed"""
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version VARCHAR(16) PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    return {row.version for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def _record(connection, migration):
+    connection.execute(
+        text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+        {'version': migration.version, 'name': migration.name, 'applied_at': datetime.now()}
+    )
+
+
+def _split_statements(sql):
+    """Splits SQL script on semicolons ending a line. Only used for no-transaction migrations, which must not contain
+    procedural blocks."""
+    statements = re.split(r';\s*$', sql, flags=re.MULTILINE)
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def apply_migration(engine, migration):
+    """Applies single migration and records it"""
+    with open(migration.path) as file:
+        sql = file.read()
+    if sql.startswith(NO_TRANSACTION_MARKER):
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            for statement in _split_statements(sql):
+                connection.exec_driver_sql(statement)
+        with engine.begin() as connection:
+            _record(connection, migration)
+    else:
+        with engine.begin() as connection:
+            connection.exec_driver_sql(sql, execution_options={'no_parameters': True})
+            _record(connection, migration)
+
+
+def migrate(engine):
+    """Applies every pending migration. Returns list of applied migrations."""
+    migrations = get_migrations()
+    if engine.dialect.name != 'postgresql':
+        with engine.begin() as connection:
+            db.metadata.create_all(connection)
+            applied = get_applied_versions(connection)
+            pending = [migration for migration in migrations if migration.version not in applied]
+            for migration in pending:
+                _record(connection, migration)
+        return pending
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as lock:
+        # Serializes concurrent application startups running migrations against the same database
+        lock.execute(text("SELECT pg_advisory_lock(:key)"), {'key': ADVISORY_LOCK_KEY})
+        try:
+            with engine.begin() as connection:
+                applied = get_applied_versions(connection)
+            pending = [migration for migration in migrations if migration.version not in applied]
+            for migration in pending:
+                apply_migration(engine, migration)
+        finally:
+            lock.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': ADVISORY_LOCK_KEY})
+    return pending
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--list', action='store_true', help='list migrations and whether they are applied')
+    arguments = parser.parse_args()
+    engine = create_engine(DATABASE_URI)
+    if arguments.list:
+        with engine.begin() as connection:
+            applied = get_applied_versions(connection)
+        for migration in get_migrations():
+            status = 'applied' if migration.version in applied else 'pending'
+            print(f"{migration.version} {migration.name}: {status}")
+        return
+    for migration in migrate(engine):
+        print(f"Applied {migration.version} {migration.name}")
+
+
+if __name__ == '__main__':
+    main()
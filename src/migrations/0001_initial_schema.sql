@@ -0,0 +1,48 @@
+-- Schema previously created by db.create_all() at application startup
+
+DO $$ BEGIN
+    CREATE TYPE eventtype AS ENUM ('NORMAL', 'SENSOR', 'TIMED');
+EXCEPTION
+    WHEN duplicate_object THEN NULL;
+END $$;
+
+CREATE TABLE IF NOT EXISTS process (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sensor (
+    id SERIAL PRIMARY KEY,
+    mac_address TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS event (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    start TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    finish TIMESTAMP WITHOUT TIME ZONE,
+    event_type eventtype NOT NULL,
+    id_process INTEGER NOT NULL REFERENCES process (id) MATCH FULL ON DELETE RESTRICT,
+    duration INTEGER,
+    id_sensor INTEGER REFERENCES sensor (id) MATCH FULL ON DELETE RESTRICT
+);
+
+CREATE TABLE IF NOT EXISTS measurement (
+    id SERIAL PRIMARY KEY,
+    inclination FLOAT NOT NULL,
+    temperature FLOAT NOT NULL,
+    density FLOAT NOT NULL,
+    battery INTEGER NOT NULL,
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    id_sensor INTEGER REFERENCES sensor (id) MATCH FULL ON DELETE CASCADE,
+    id_event INTEGER REFERENCES event (id) MATCH FULL ON DELETE RESTRICT
+);
+
+CREATE TABLE IF NOT EXISTS density_calibration (
+    id SERIAL PRIMARY KEY,
+    coefficient FLOAT NOT NULL,
+    "offset" FLOAT NOT NULL,
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    id_sensor INTEGER REFERENCES sensor (id) MATCH FULL ON DELETE CASCADE
+);
@@ -0,0 +1,26 @@
+-- migrate: no-transaction
+-- Indexes for ingest and list access paths, built concurrently so existing tables stay writable
+
+-- Measurements of a sensor in a time range
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_measurement_sensor_timestamp
+    ON measurement (id_sensor, timestamp);
+
+-- Measurements not attached to an event, claimed when a SENSOR event is created
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_measurement_orphan_sensor_timestamp
+    ON measurement (id_sensor, timestamp) WHERE id_event IS NULL;
+
+-- Measurements of an event ordered by time
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_measurement_event_timestamp
+    ON measurement (id_event, timestamp);
+
+-- Latest calibration of a sensor
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_density_calibration_sensor_timestamp
+    ON density_calibration (id_sensor, timestamp);
+
+-- Open event of a sensor
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_event_open_sensor
+    ON event (id_sensor, event_type) WHERE finish IS NULL;
+
+-- Events of a process
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_event_process
+    ON event (id_process);
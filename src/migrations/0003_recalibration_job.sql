@@ -0,0 +1,23 @@
+-- Background recalibration jobs
+
+DO $$ BEGIN
+    CREATE TYPE recalibrationstatus AS ENUM ('PENDING', 'RUNNING', 'FINISHED', 'FAILED');
+EXCEPTION
+    WHEN duplicate_object THEN NULL;
+END $$;
+
+CREATE TABLE recalibration_job (
+    id SERIAL PRIMARY KEY,
+    id_sensor INTEGER NOT NULL REFERENCES sensor (id) MATCH FULL ON DELETE CASCADE,
+    window_start TIMESTAMP WITHOUT TIME ZONE,
+    window_end TIMESTAMP WITHOUT TIME ZONE,
+    status recalibrationstatus NOT NULL,
+    updated_rows INTEGER NOT NULL,
+    error TEXT,
+    created TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    started TIMESTAMP WITHOUT TIME ZONE,
+    finished TIMESTAMP WITHOUT TIME ZONE,
+    heartbeat TIMESTAMP WITHOUT TIME ZONE
+);
+
+CREATE INDEX ix_recalibration_job_status_created ON recalibration_job (status, created);
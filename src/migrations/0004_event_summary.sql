@@ -0,0 +1,96 @@
+-- Incrementally maintained per-event measurement summaries
+
+CREATE TABLE event_summary (
+    id_event INTEGER PRIMARY KEY REFERENCES event (id) MATCH FULL ON DELETE CASCADE,
+    measurement_count INTEGER NOT NULL,
+    first_timestamp TIMESTAMP WITHOUT TIME ZONE,
+    last_timestamp TIMESTAMP WITHOUT TIME ZONE,
+    first_density FLOAT,
+    last_density FLOAT,
+    min_density FLOAT,
+    max_density FLOAT,
+    sum_density FLOAT NOT NULL,
+    first_temperature FLOAT,
+    last_temperature FLOAT,
+    min_temperature FLOAT,
+    max_temperature FLOAT,
+    sum_temperature FLOAT NOT NULL,
+    slope_reference TIMESTAMP WITHOUT TIME ZONE,
+    slope_weight FLOAT NOT NULL,
+    slope_x FLOAT NOT NULL,
+    slope_y FLOAT NOT NULL,
+    slope_xx FLOAT NOT NULL,
+    slope_xy FLOAT NOT NULL
+);
+
+-- Backfill existing events. Slope sums use the default SUMMARY_SLOPE_HALF_LIFE of 6 hours, x being hours relative to
+-- the last measurement; weights below 2^-500 are taken as zero.
+WITH weighted AS (
+    SELECT
+        measurement.id_event,
+        measurement.density,
+        x,
+        CASE WHEN x > -3000 THEN power(2::float, x / 6) ELSE 0 END AS weight
+    FROM measurement
+    JOIN (
+        SELECT id_event, max(timestamp) AS last_timestamp
+        FROM measurement
+        WHERE id_event IS NOT NULL
+        GROUP BY id_event
+    ) AS latest ON latest.id_event = measurement.id_event,
+    LATERAL (SELECT extract(epoch FROM measurement.timestamp - latest.last_timestamp)::float / 3600 AS x) AS hours
+)
+INSERT INTO event_summary
+SELECT
+    event.id,
+    coalesce(stats.measurement_count, 0),
+    stats.first_timestamp,
+    stats.last_timestamp,
+    stats.first_density,
+    stats.last_density,
+    stats.min_density,
+    stats.max_density,
+    coalesce(stats.sum_density, 0),
+    stats.first_temperature,
+    stats.last_temperature,
+    stats.min_temperature,
+    stats.max_temperature,
+    coalesce(stats.sum_temperature, 0),
+    stats.last_timestamp,
+    coalesce(slope.slope_weight, 0),
+    coalesce(slope.slope_x, 0),
+    coalesce(slope.slope_y, 0),
+    coalesce(slope.slope_xx, 0),
+    coalesce(slope.slope_xy, 0)
+FROM event
+LEFT JOIN (
+    SELECT
+        id_event,
+        count(*) AS measurement_count,
+        min(timestamp) AS first_timestamp,
+        max(timestamp) AS last_timestamp,
+        (array_agg(density ORDER BY timestamp, id))[1] AS first_density,
+        (array_agg(density ORDER BY timestamp DESC, id DESC))[1] AS last_density,
+        min(density) AS min_density,
+        max(density) AS max_density,
+        sum(density) AS sum_density,
+        (array_agg(temperature ORDER BY timestamp, id))[1] AS first_temperature,
+        (array_agg(temperature ORDER BY timestamp DESC, id DESC))[1] AS last_temperature,
+        min(temperature) AS min_temperature,
+        max(temperature) AS max_temperature,
+        sum(temperature) AS sum_temperature
+    FROM measurement
+    WHERE id_event IS NOT NULL
+    GROUP BY id_event
+) AS stats ON stats.id_event = event.id
+LEFT JOIN (
+    SELECT
+        id_event,
+        sum(weight) AS slope_weight,
+        sum(weight * x) AS slope_x,
+        sum(weight * density) AS slope_y,
+        sum(weight * x * x) AS slope_xx,
+        sum(weight * x * density) AS slope_xy
+    FROM weighted
+    GROUP BY id_event
+) AS slope ON slope.id_event = event.id;
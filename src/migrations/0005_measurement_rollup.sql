@@ -0,0 +1,24 @@
+-- Downsampled measurements replacing raw measurements older than the retention age
+
+CREATE TABLE measurement_rollup (
+    id SERIAL PRIMARY KEY,
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    measurement_count INTEGER NOT NULL,
+    avg_inclination FLOAT NOT NULL,
+    min_inclination FLOAT NOT NULL,
+    max_inclination FLOAT NOT NULL,
+    avg_temperature FLOAT NOT NULL,
+    min_temperature FLOAT NOT NULL,
+    max_temperature FLOAT NOT NULL,
+    avg_density FLOAT NOT NULL,
+    min_density FLOAT NOT NULL,
+    max_density FLOAT NOT NULL,
+    avg_battery FLOAT NOT NULL,
+    min_battery INTEGER NOT NULL,
+    max_battery INTEGER NOT NULL,
+    id_sensor INTEGER REFERENCES sensor (id) MATCH FULL ON DELETE CASCADE,
+    id_event INTEGER REFERENCES event (id) MATCH FULL ON DELETE RESTRICT
+);
+
+CREATE INDEX ix_measurement_rollup_sensor_timestamp ON measurement_rollup (id_sensor, timestamp);
+CREATE INDEX ix_measurement_rollup_event_timestamp ON measurement_rollup (id_event, timestamp);
@@ -0,0 +1,55 @@
+-- Partitions measurement by month of timestamp. Existing rows are copied into the partitioned table within this
+-- migration's transaction, which holds an exclusive lock on measurement until it finishes.
+
+ALTER TABLE measurement RENAME TO measurement_unpartitioned;
+ALTER TABLE measurement_unpartitioned RENAME CONSTRAINT measurement_pkey TO measurement_unpartitioned_pkey;
+ALTER INDEX IF EXISTS ix_measurement_sensor_timestamp RENAME TO ix_measurement_unpartitioned_sensor_timestamp;
+ALTER INDEX IF EXISTS ix_measurement_orphan_sensor_timestamp
+    RENAME TO ix_measurement_unpartitioned_orphan_sensor_timestamp;
+ALTER INDEX IF EXISTS ix_measurement_event_timestamp RENAME TO ix_measurement_unpartitioned_event_timestamp;
+
+-- The partition key must be part of the primary key
+CREATE TABLE measurement (
+    id INTEGER NOT NULL DEFAULT nextval('measurement_id_seq'),
+    inclination FLOAT NOT NULL,
+    temperature FLOAT NOT NULL,
+    density FLOAT NOT NULL,
+    battery INTEGER NOT NULL,
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    id_sensor INTEGER REFERENCES sensor (id) MATCH FULL ON DELETE CASCADE,
+    id_event INTEGER REFERENCES event (id) MATCH FULL ON DELETE RESTRICT,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+ALTER SEQUENCE measurement_id_seq OWNED BY measurement.id;
+
+CREATE INDEX ix_measurement_sensor_timestamp ON measurement (id_sensor, timestamp);
+CREATE INDEX ix_measurement_orphan_sensor_timestamp ON measurement (id_sensor, timestamp) WHERE id_event IS NULL;
+CREATE INDEX ix_measurement_event_timestamp ON measurement (id_event, timestamp);
+
+-- Holds rows of months without partition until the retention worker creates it
+CREATE TABLE measurement_default PARTITION OF measurement DEFAULT;
+
+-- One partition per month holding measurements, and for the current and the next two months
+DO $$
+DECLARE
+    month TIMESTAMP;
+BEGIN
+    FOR month IN
+        SELECT DISTINCT date_trunc('month', timestamp) FROM measurement_unpartitioned
+        UNION
+        SELECT date_trunc('month', now()::timestamp) + interval '1 month' * ahead FROM generate_series(0, 2) AS ahead
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF measurement FOR VALUES FROM (%L) TO (%L)',
+            to_char(month, '"measurement_y"YYYY"m"MM'),
+            month,
+            month + interval '1 month'
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO measurement (id, inclination, temperature, density, battery, timestamp, id_sensor, id_event)
+SELECT id, inclination, temperature, density, battery, timestamp, id_sensor, id_event FROM measurement_unpartitioned;
+
+DROP TABLE measurement_unpartitioned;
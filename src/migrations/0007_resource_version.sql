@@ -0,0 +1,14 @@
+-- Per-table change counters validating cached responses
+
+CREATE TABLE resource_version (
+    resource TEXT PRIMARY KEY,
+    version BIGINT NOT NULL,
+    modified TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+
+INSERT INTO resource_version (resource, version, modified)
+SELECT resource, 1, timezone('UTC', now())
+FROM unnest(ARRAY[
+    'process', 'event', 'sensor', 'measurement', 'measurement_rollup', 'event_summary', 'density_calibration',
+    'recalibration_job'
+]) AS resource;
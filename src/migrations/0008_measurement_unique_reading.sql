@@ -0,0 +1,22 @@
+-- Makes (id_sensor, timestamp) unique, so that readings retried by sensors are inserted with ON CONFLICT DO NOTHING.
+-- Duplicates stored so far are deleted, keeping the first stored reading, and summaries of their events are deleted
+-- to be rebuilt from the remaining measurements when the next measurement of the event arrives.
+
+CREATE TEMPORARY TABLE duplicate_measurement ON COMMIT DROP AS
+SELECT DISTINCT later.id, later.timestamp, later.id_event
+FROM measurement later
+JOIN measurement earlier
+    ON earlier.id_sensor = later.id_sensor AND earlier.timestamp = later.timestamp AND earlier.id < later.id;
+
+DELETE FROM measurement
+USING duplicate_measurement
+WHERE measurement.id = duplicate_measurement.id AND measurement.timestamp = duplicate_measurement.timestamp;
+
+DELETE FROM event_summary WHERE id_event IN (SELECT id_event FROM duplicate_measurement);
+
+UPDATE resource_version SET version = version + 1, modified = timezone('UTC', now())
+WHERE resource IN ('measurement', 'event_summary') AND EXISTS (SELECT 1 FROM duplicate_measurement);
+
+-- The unique index includes the partition key, so it is created on every partition
+DROP INDEX ix_measurement_sensor_timestamp;
+CREATE UNIQUE INDEX ix_measurement_sensor_timestamp ON measurement (id_sensor, timestamp);
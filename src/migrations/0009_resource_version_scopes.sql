@@ -0,0 +1,7 @@
+-- Versions of tables written by every reading are kept per event and sensor, so that concurrent ingest transactions
+-- do not update the same row. The row of a whole table has an empty scope.
+
+ALTER TABLE resource_version ADD COLUMN scope TEXT NOT NULL DEFAULT '';
+ALTER TABLE resource_version ADD COLUMN scope_id BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE resource_version DROP CONSTRAINT resource_version_pkey;
+ALTER TABLE resource_version ADD PRIMARY KEY (resource, scope, scope_id);
@@ -0,0 +1,64 @@
+-- Mac addresses are stored in upper case separated by colons, whatever form the sensor sent. Sensors stored before
+-- under other spellings of the same address are merged into the one created first: their rows are moved to it,
+-- readings of a timestamp it already has are deleted, as in 0008, and only the latest of its open SENSOR events stays
+-- open, the others finishing when the next one started.
+
+CREATE TEMPORARY TABLE sensor_merge ON COMMIT DROP AS
+SELECT sensor.id AS id_from, canonical.id AS id_to
+FROM sensor
+JOIN (
+    SELECT upper(replace(mac_address, '-', ':')) AS mac_address, min(id) AS id FROM sensor GROUP BY 1
+) canonical ON canonical.mac_address = upper(replace(sensor.mac_address, '-', ':'))
+WHERE sensor.id <> canonical.id;
+
+CREATE TEMPORARY TABLE duplicate_measurement ON COMMIT DROP AS
+SELECT id, timestamp, id_event
+FROM (
+    SELECT measurement.id, measurement.timestamp, measurement.id_event, row_number() OVER (
+        PARTITION BY coalesce(sensor_merge.id_to, measurement.id_sensor), measurement.timestamp
+        ORDER BY sensor_merge.id_to IS NOT NULL, measurement.id
+    ) AS position
+    FROM measurement
+    LEFT JOIN sensor_merge ON sensor_merge.id_from = measurement.id_sensor
+    WHERE measurement.id_sensor IN (SELECT id_from FROM sensor_merge UNION SELECT id_to FROM sensor_merge)
+) ranked
+WHERE position > 1;
+
+DELETE FROM measurement
+USING duplicate_measurement
+WHERE measurement.id = duplicate_measurement.id AND measurement.timestamp = duplicate_measurement.timestamp;
+
+DELETE FROM event_summary WHERE id_event IN (SELECT id_event FROM duplicate_measurement);
+
+UPDATE measurement SET id_sensor = sensor_merge.id_to
+FROM sensor_merge WHERE measurement.id_sensor = sensor_merge.id_from;
+
+UPDATE measurement_rollup SET id_sensor = sensor_merge.id_to
+FROM sensor_merge WHERE measurement_rollup.id_sensor = sensor_merge.id_from;
+
+UPDATE density_calibration SET id_sensor = sensor_merge.id_to
+FROM sensor_merge WHERE density_calibration.id_sensor = sensor_merge.id_from;
+
+UPDATE recalibration_job SET id_sensor = sensor_merge.id_to
+FROM sensor_merge WHERE recalibration_job.id_sensor = sensor_merge.id_from;
+
+UPDATE event SET id_sensor = sensor_merge.id_to
+FROM sensor_merge WHERE event.id_sensor = sensor_merge.id_from;
+
+UPDATE event SET finish = open_event.next_start
+FROM (
+    SELECT id, lead(start) OVER (PARTITION BY id_sensor ORDER BY start, id) AS next_start
+    FROM event
+    WHERE event_type = 'SENSOR' AND finish IS NULL AND id_sensor IN (SELECT id_to FROM sensor_merge)
+) open_event
+WHERE event.id = open_event.id AND open_event.next_start IS NOT NULL;
+
+DELETE FROM sensor WHERE id IN (SELECT id_from FROM sensor_merge);
+
+UPDATE sensor SET mac_address = upper(replace(mac_address, '-', ':'))
+WHERE mac_address <> upper(replace(mac_address, '-', ':'));
+
+UPDATE resource_version SET version = version + 1, modified = timezone('UTC', now())
+WHERE scope = '' AND resource IN (
+    'sensor', 'event', 'measurement', 'measurement_rollup', 'event_summary', 'density_calibration', 'recalibration_job'
+);
@@ -2,6 +2,7 @@ import re
 from enum import Enum
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 
 
 db = SQLAlchemy()
@@ -46,21 +47,38 @@ class Event(db.Model):
     process = db.relationship('Process', backref=db.backref('events', cascade='all, delete'))
     sensor = db.relationship('Sensor', backref=db.backref('events', cascade='all, delete'))
 
+    __table_args__ = (
+        db.Index('ix_event_open_sensor', 'id_sensor', 'event_type',
+                 postgresql_where=finish.is_(None), sqlite_where=finish.is_(None)),
+        db.Index('ix_event_process', 'id_process'),
+    )
+
 
 class Sensor(db.Model):
     __tablename__ = 'sensor'
     id = db.Column(db.Integer, primary_key=True)
     mac_address = db.Column(db.Text, nullable=False, unique=True)
 
+    @staticmethod
+    def normalize_mac_address(value):
+        """Returns mac address in canonical form, upper case digits separated by colons"""
+        return value.upper().replace('-', ':')
+
     @staticmethod
     def valid_mac_address(value):
-        """Validates mac_address field"""
+        """Validates mac_address field, returning it in canonical form"""
         if not re.fullmatch(r"^([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})$", value):
             raise ValueError(f"{value} is not a valid mac address")
-        return value
+        return Sensor.normalize_mac_address(value)
+
+    @validates('mac_address')
+    def _normalize_mac_address(self, key, value):
+        return self.normalize_mac_address(value)
 
 
 class Measurement(db.Model):
+    # On PostgreSQL the table is partitioned by month of timestamp, so its primary key is (id, timestamp). A sensor
+    # stores a single reading by timestamp, so that retried readings are not stored twice.
     __tablename__ = 'measurement'
     id = db.Column(db.Integer, primary_key=True)
     inclination = db.Column(db.Float, nullable=False)
@@ -80,14 +98,123 @@ class Measurement(db.Model):
     sensor = db.relationship('Sensor', backref=db.backref('measurements', cascade='all, delete'))
     event = db.relationship('Event', backref=db.backref('measurements', cascade='all, delete'))
 
+    __table_args__ = (
+        db.Index('ix_measurement_sensor_timestamp', 'id_sensor', 'timestamp', unique=True),
+        db.Index('ix_measurement_orphan_sensor_timestamp', 'id_sensor', 'timestamp',
+                 postgresql_where=id_event.is_(None), sqlite_where=id_event.is_(None)),
+        db.Index('ix_measurement_event_timestamp', 'id_event', 'timestamp'),
+    )
+
     @classmethod
     def calculate_density(cls, inclination: float, coefficient, offset):
         """Calculate density from inclination and calibration"""
         return coefficient * inclination + offset
 
 
+class MeasurementRollup(db.Model):
+    """Measurements of a sensor and event downsampled into a time bucket starting at timestamp, replacing raw
+    measurements older than the retention age"""
+    __tablename__ = 'measurement_rollup'
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    measurement_count = db.Column(db.Integer, nullable=False)
+    avg_inclination = db.Column(db.Float, nullable=False)
+    min_inclination = db.Column(db.Float, nullable=False)
+    max_inclination = db.Column(db.Float, nullable=False)
+    avg_temperature = db.Column(db.Float, nullable=False)
+    min_temperature = db.Column(db.Float, nullable=False)
+    max_temperature = db.Column(db.Float, nullable=False)
+    avg_density = db.Column(db.Float, nullable=False)
+    min_density = db.Column(db.Float, nullable=False)
+    max_density = db.Column(db.Float, nullable=False)
+    avg_battery = db.Column(db.Float, nullable=False)
+    min_battery = db.Column(db.Integer, nullable=False)
+    max_battery = db.Column(db.Integer, nullable=False)
+    id_sensor = db.Column(
+        db.Integer,
+        db.ForeignKey('sensor.id', ondelete='CASCADE', match='FULL')
+    )
+    id_event = db.Column(
+        db.Integer,
+        db.ForeignKey('event.id', ondelete='RESTRICT', match='FULL')
+    )
+
+    sensor = db.relationship('Sensor', backref=db.backref('rollups', cascade='all, delete'))
+    event = db.relationship('Event', backref=db.backref('rollups', cascade='all, delete'))
+
+    __table_args__ = (
+        db.Index('ix_measurement_rollup_sensor_timestamp', 'id_sensor', 'timestamp'),
+        db.Index('ix_measurement_rollup_event_timestamp', 'id_event', 'timestamp'),
+    )
+
+
+class EventSummary(db.Model):
+    """Running aggregates of the measurements of an event, updated as measurements are attached to it. Slope sums are
+    exponentially weighted regression sums of density over hours relative to slope_reference."""
+    __tablename__ = 'event_summary'
+    id_event = db.Column(
+        db.Integer,
+        db.ForeignKey('event.id', ondelete='CASCADE', match='FULL'),
+        primary_key=True
+    )
+    measurement_count = db.Column(db.Integer, nullable=False, default=0)
+    first_timestamp = db.Column(db.DateTime)
+    last_timestamp = db.Column(db.DateTime)
+    first_density = db.Column(db.Float)
+    last_density = db.Column(db.Float)
+    min_density = db.Column(db.Float)
+    max_density = db.Column(db.Float)
+    sum_density = db.Column(db.Float, nullable=False, default=0)
+    first_temperature = db.Column(db.Float)
+    last_temperature = db.Column(db.Float)
+    min_temperature = db.Column(db.Float)
+    max_temperature = db.Column(db.Float)
+    sum_temperature = db.Column(db.Float, nullable=False, default=0)
+    slope_reference = db.Column(db.DateTime)
+    slope_weight = db.Column(db.Float, nullable=False, default=0)
+    slope_x = db.Column(db.Float, nullable=False, default=0)
+    slope_y = db.Column(db.Float, nullable=False, default=0)
+    slope_xx = db.Column(db.Float, nullable=False, default=0)
+    slope_xy = db.Column(db.Float, nullable=False, default=0)
+
+    event = db.relationship('Event', backref=db.backref('summary', uselist=False, cascade='all, delete'))
+
+    @property
+    def avg_density(self):
+        return self.sum_density / self.measurement_count if self.measurement_count else None
+
+    @property
+    def avg_temperature(self):
+        return self.sum_temperature / self.measurement_count if self.measurement_count else None
+
+    @property
+    def apparent_attenuation(self):
+        """Percentage of original gravity points fermented"""
+        if self.first_density is None or self.first_density <= 1:
+            return None
+        return (self.first_density - self.last_density) / (self.first_density - 1) * 100
+
+    @property
+    def abv(self):
+        """Estimated alcohol by volume percentage"""
+        if self.first_density is None:
+            return None
+        return (self.first_density - self.last_density) * 131.25
+
+    @property
+    def density_slope(self):
+        """Weighted least squares slope of density, per hour. None if there is not enough spread in time."""
+        denominator = self.slope_weight * self.slope_xx - self.slope_x ** 2
+        if not self.slope_weight or denominator <= 1e-9 * self.slope_weight ** 2:
+            return None
+        return (self.slope_weight * self.slope_xy - self.slope_x * self.slope_y) / denominator
+
+
 class DensityCalibration(db.Model):
     __tablename__ = 'density_calibration'
+    DEFAULT_COEFFICIENT = 0.0017
+    DEFAULT_OFFSET = 0.9592
+
     id = db.Column(db.Integer, primary_key=True)
     coefficient = db.Column(db.Float, nullable=False)
     offset = db.Column(db.Float, nullable=False)
@@ -97,3 +224,54 @@ class DensityCalibration(db.Model):
         db.ForeignKey('sensor.id', ondelete='CASCADE', match='FULL')
     )
     sensor = db.relationship('Sensor', backref=db.backref('calibrations', cascade='all, delete'))
+
+    __table_args__ = (
+        db.Index('ix_density_calibration_sensor_timestamp', 'id_sensor', 'timestamp'),
+    )
+
+
+class RecalibrationStatus(Enum):
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    FINISHED = 'FINISHED'
+    FAILED = 'FAILED'
+
+    def __str__(self):
+        """String representation of Enum"""
+        return str(self.value)
+
+
+class RecalibrationJob(db.Model):
+    __tablename__ = 'recalibration_job'
+    id = db.Column(db.Integer, primary_key=True)
+    id_sensor = db.Column(
+        db.Integer,
+        db.ForeignKey('sensor.id', ondelete='CASCADE', match='FULL'),
+        nullable=False
+    )
+    window_start = db.Column(db.DateTime)
+    window_end = db.Column(db.DateTime)
+    status = db.Column(db.Enum(RecalibrationStatus), nullable=False, default=RecalibrationStatus.PENDING)
+    updated_rows = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created = db.Column(db.DateTime, nullable=False)
+    started = db.Column(db.DateTime)
+    finished = db.Column(db.DateTime)
+    heartbeat = db.Column(db.DateTime)
+
+    sensor = db.relationship('Sensor', backref=db.backref('recalibration_jobs', cascade='all, delete'))
+
+    __table_args__ = (
+        db.Index('ix_recalibration_job_status_created', 'status', 'created'),
+    )
+
+
+class ResourceVersion(db.Model):
+    """Counter of changes of a table, or of the rows of a table with column scope equal to scope_id, bumped by every
+    transaction writing to them. Used to validate cached responses."""
+    __tablename__ = 'resource_version'
+    resource = db.Column(db.Text, primary_key=True)
+    scope = db.Column(db.Text, primary_key=True, default='')
+    scope_id = db.Column(db.BigInteger, primary_key=True, default=0)
+    version = db.Column(db.BigInteger, nullable=False)
+    modified = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,188 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, tuple_
+
+from config import RECALIBRATION_WORKER, RECALIBRATION_CHUNK_SIZE, RECALIBRATION_POLL_INTERVAL, \
+    RECALIBRATION_STALE_TIMEOUT
+from models import db, Measurement, MeasurementRollup, DensityCalibration, RecalibrationJob, RecalibrationStatus
+from summary import rebuild_sensor_summaries
+from versions import touch
+
+
+logger = logging.getLogger(__name__)
+
+_wakeup = threading.Event()
+
+
+def calibration_windows(id_sensor, window_start=None, window_end=None):
+    """Returns list of (start, end, coefficient, offset) tuples of the calibration timeline of sensor, clipped to
+    [window_start, window_end). Each calibration governs measurements from its timestamp up to the next calibration,
+    measurements before the first calibration use the default calibration. None start or end means unbounded."""
+    calibrations = DensityCalibration.query.filter(DensityCalibration.id_sensor == id_sensor)\
+        .order_by(DensityCalibration.timestamp, DensityCalibration.id).all()
+    timeline = [(None, DensityCalibration.DEFAULT_COEFFICIENT, DensityCalibration.DEFAULT_OFFSET)]
+    timeline += [(calibration.timestamp, calibration.coefficient, calibration.offset) for calibration in calibrations]
+    windows = []
+    for index, (start, coefficient, offset) in enumerate(timeline):
+        end = timeline[index + 1][0] if index + 1 < len(timeline) else None
+        if window_start is not None and (start is None or start < window_start):
+            start = window_start
+        if window_end is not None and (end is None or end > window_end):
+            end = window_end
+        if start is not None and end is not None and start >= end:
+            continue
+        windows.append((start, end, coefficient, offset))
+    return windows
+
+
+def _touch_sensor_rows(session, table, id_sensor, query):
+    """Records that the transaction writes rows of query, of table and sensor, in the version scopes of their sensor
+    and events"""
+    events = query.with_entities(table.id_event).filter(table.id_event.isnot(None)).distinct()
+    touch(session, (table.__tablename__, 'id_sensor', id_sensor),
+          *[(table.__tablename__, 'id_event', id_event) for id_event, in events])
+
+
+def recalibrate_window(session, job, start, end, coefficient, offset, chunk_size=RECALIBRATION_CHUNK_SIZE):
+    """Recomputes density of job's sensor measurements with timestamp in [start, end), in chunks of chunk_size rows
+    ordered by timestamp. Each chunk is committed with the job progress."""
+    window = [Measurement.id_sensor == job.id_sensor]
+    if start is not None:
+        window.append(Measurement.timestamp >= start)
+    if end is not None:
+        window.append(Measurement.timestamp < end)
+    position = tuple_(Measurement.timestamp, Measurement.id)
+    last = None
+    while True:
+        remaining = session.query(Measurement.timestamp, Measurement.id).filter(*window)
+        if last is not None:
+            remaining = remaining.filter(position > tuple_(*last))
+        chunk_last = remaining.order_by(Measurement.timestamp, Measurement.id)\
+            .offset(chunk_size - 1).limit(1).first()
+        chunk = session.query(Measurement).filter(*window)
+        if last is not None:
+            chunk = chunk.filter(position > tuple_(*last))
+        if chunk_last is not None:
+            chunk = chunk.filter(position <= tuple_(*chunk_last))
+        _touch_sensor_rows(session, Measurement, job.id_sensor, chunk)
+        job.updated_rows += chunk.update(
+            {'density': Measurement.calculate_density(Measurement.inclination, coefficient, offset)},
+            synchronize_session=False
+        )
+        job.heartbeat = datetime.now()
+        session.commit()
+        if chunk_last is None:
+            return
+        last = tuple(chunk_last)
+
+
+def recalibrate_rollups(session, job, start, end, coefficient, offset):
+    """Recomputes density of job's sensor roll-ups with timestamp in [start, end). Density being linear in inclination,
+    it is computed from the inclination aggregates."""
+    window = [MeasurementRollup.id_sensor == job.id_sensor]
+    if start is not None:
+        window.append(MeasurementRollup.timestamp >= start)
+    if end is not None:
+        window.append(MeasurementRollup.timestamp < end)
+    lowest, highest = MeasurementRollup.min_inclination, MeasurementRollup.max_inclination
+    if coefficient < 0:
+        lowest, highest = highest, lowest
+    rollups = session.query(MeasurementRollup).filter(*window)
+    _touch_sensor_rows(session, MeasurementRollup, job.id_sensor, rollups)
+    rollups.update({
+        'avg_density': Measurement.calculate_density(MeasurementRollup.avg_inclination, coefficient, offset),
+        'min_density': Measurement.calculate_density(lowest, coefficient, offset),
+        'max_density': Measurement.calculate_density(highest, coefficient, offset),
+    }, synchronize_session=False)
+    session.commit()
+
+
+def schedule(session, id_sensor, window_start=None, window_end=None):
+    """Adds pending job recalibrating sensor measurements in [window_start, window_end) to session. Without window,
+    the whole history of the sensor is recalibrated. Call notify after commit to start it immediately."""
+    job = RecalibrationJob(
+        id_sensor=id_sensor,
+        window_start=window_start,
+        window_end=window_end,
+        status=RecalibrationStatus.PENDING,
+        updated_rows=0,
+        created=datetime.now()
+    )
+    session.add(job)
+    return job
+
+
+def notify():
+    """Wakes recalibration worker up"""
+    _wakeup.set()
+
+
+def claim_job(session):
+    """Marks oldest pending job, or running job whose worker stopped sending heartbeats, as running and returns it.
+    Returns None if there is no such job."""
+    stale = datetime.now() - timedelta(seconds=RECALIBRATION_STALE_TIMEOUT)
+    job = RecalibrationJob.query.filter(or_(
+        RecalibrationJob.status == RecalibrationStatus.PENDING,
+        and_(RecalibrationJob.status == RecalibrationStatus.RUNNING, RecalibrationJob.heartbeat < stale)
+    )).order_by(RecalibrationJob.created).with_for_update(skip_locked=True).first()
+    if job:
+        job.status = RecalibrationStatus.RUNNING
+        job.started = job.heartbeat = datetime.now()
+        job.updated_rows = 0
+        session.commit()
+    return job
+
+
+def run_job(session, job):
+    """Recalibrates every calibration window of job, then recomputes the summaries of the affected events"""
+    try:
+        for start, end, coefficient, offset in calibration_windows(job.id_sensor, job.window_start, job.window_end):
+            recalibrate_rollups(session, job, start, end, coefficient, offset)
+            recalibrate_window(session, job, start, end, coefficient, offset)
+        rebuild_sensor_summaries(session, job.id_sensor, job.window_start, job.window_end)
+        job.status = RecalibrationStatus.FINISHED
+    except Exception as error:
+        # Any failure ends the job, otherwise it would stay RUNNING until another worker reclaims it as stale and fails
+        # the same way
+        logger.exception("Recalibration job %s failed", job.id)
+        session.rollback()
+        job.status = RecalibrationStatus.FAILED
+        job.error = str(error)
+    job.finished = datetime.now()
+    session.commit()
+
+
+class RecalibrationWorker(threading.Thread):
+    """Thread running pending recalibration jobs. Jobs are claimed from the database, so several processes may each
+    run a worker."""
+    def __init__(self, app):
+        super().__init__(name='recalibration-worker', daemon=True)
+        self.app = app
+
+    def run(self):
+        while True:
+            _wakeup.wait(RECALIBRATION_POLL_INTERVAL)
+            _wakeup.clear()
+            with self.app.app_context():
+                try:
+                    self.run_pending_jobs()
+                except Exception:
+                    logger.exception("Recalibration worker failed")
+                finally:
+                    db.session.remove()
+
+    @classmethod
+    def run_pending_jobs(cls):
+        job = claim_job(db.session)
+        while job:
+            logger.info("Running recalibration job %s of sensor %s", job.id, job.id_sensor)
+            run_job(db.session, job)
+            job = claim_job(db.session)
+
+
+def start_worker(app):
+    """Starts recalibration worker thread for app, unless disabled by configuration"""
+    if RECALIBRATION_WORKER:
+        RecalibrationWorker(app).start()
@@ -0,0 +1,119 @@
+"""Routing of GET request reads to a read replica of the database.
+
+With REPLICA_DATABASE_URI set, the replica gets its own engine and connection pool, as a Flask-SQLAlchemy bind, and
+GetMixin reads through a session bound to it. Requests that wrote, in their current transaction or in one they already
+committed, keep reading from the primary so that they see their own writes. The replication lag of the replica is
+checked at most every REPLICA_CHECK_INTERVAL seconds by each process; while it exceeds REPLICA_MAX_LAG seconds, or the
+replica can not be reached, reads go to the primary too.
+"""
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_request_context
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import REPLICA_DATABASE_URI, REPLICA_MAX_LAG, REPLICA_CHECK_INTERVAL
+from models import db
+from versions import is_written, on_commit
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+BIND_KEY = 'replica'
+
+# Seconds behind the primary, 0 when it is not a standby or replayed everything it received. NULL when the standby is
+# not streaming from the primary, as it can not know what it missed then.
+LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN NOT EXISTS (SELECT FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+reads = metrics.Counter('replica_reads_total', 'GET requests by database they read from', ('database',))
+
+
+class _LagMonitor:
+    """Whether the replica is current enough to read from, checked at most every REPLICA_CHECK_INTERVAL seconds"""
+    def __init__(self):
+        self.current = True
+        self.checked = None
+        self.lock = threading.Lock()
+
+    def is_current(self, engine):
+        now = time.monotonic()
+        if self.checked is not None and now - self.checked < REPLICA_CHECK_INTERVAL:
+            return self.current
+        # A single request checks, the others use the last result meanwhile
+        if not self.lock.acquire(blocking=False):
+            return self.current
+        try:
+            self.current = self._check(engine)
+            self.checked = time.monotonic()
+        finally:
+            self.lock.release()
+        return self.current
+
+    @classmethod
+    def _check(cls, engine):
+        if engine.dialect.name != 'postgresql':
+            return True
+        try:
+            with engine.connect() as connection:
+                lag = connection.execute(LAG_QUERY).scalar()
+        except SQLAlchemyError as error:
+            logger.warning("Reading from primary, replica is unavailable: %s", error)
+            return False
+        if lag is None:
+            logger.warning("Reading from primary, replica is not streaming from it")
+            return False
+        if lag > REPLICA_MAX_LAG:
+            logger.warning("Reading from primary, replica lags %.1f s", lag)
+            return False
+        return True
+
+
+_lag_monitor = _LagMonitor()
+
+
+def _mark_written(resources):
+    """Keeps reads of a request on the primary once it committed a write"""
+    if has_request_context():
+        g.replica_wrote = True
+
+
+on_commit(_mark_written)
+
+
+def init_app(app):
+    """Configures replica bind of app, before db.init_app, unless no replica is configured"""
+    if not REPLICA_DATABASE_URI:
+        return
+    app.config['SQLALCHEMY_BINDS'] = {BIND_KEY: REPLICA_DATABASE_URI}
+    app.extensions['replica_session'] = None
+
+    @app.teardown_appcontext
+    def remove_session(exception):
+        if app.extensions['replica_session'] is not None:
+            app.extensions['replica_session'].remove()
+
+
+def get_read_session(session):
+    """Returns session GET request reads should use: a session of the replica, or given primary session if there is no
+    replica, the request wrote or the replica lags"""
+    app = current_app
+    if 'replica_session' not in app.extensions or g.get('replica_wrote') or is_written(session):
+        reads.inc('primary')
+        return session
+    engine = db.get_engine(app, bind=BIND_KEY)
+    if not _lag_monitor.is_current(engine):
+        reads.inc('primary')
+        return session
+    if app.extensions['replica_session'] is None:
+        # Without binds, Flask-SQLAlchemy would bind every table to the primary
+        app.extensions['replica_session'] = db.create_scoped_session({'bind': engine, 'binds': {}})
+    reads.inc('replica')
+    return app.extensions['replica_session']
@@ -0,0 +1,228 @@
+"""Partition maintenance and retention of raw measurements.
+
+On PostgreSQL measurement is partitioned by month of timestamp. Partitions are created PARTITION_PREMAKE_MONTHS months
+ahead, rows that landed in the default partition before their month's partition existed are moved into it when it is
+created. When MEASUREMENT_RETENTION_DAYS is set, raw measurements of the months older than the retention age are
+compacted into measurement_rollup, in buckets of ROLLUP_BUCKET seconds, and their partitions are dropped. Other
+databases are not partitioned and their old measurements are compacted and deleted.
+
+Usage: python retention.py
+"""
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, cast, delete, func, select, text
+
+from config import DATABASE_URI, RETENTION_WORKER, RETENTION_INTERVAL, MEASUREMENT_RETENTION_DAYS, ROLLUP_BUCKET, \
+    PARTITION_PREMAKE_MONTHS
+from models import db, Measurement, MeasurementRollup
+from versions import bump
+
+
+logger = logging.getLogger(__name__)
+
+ADVISORY_LOCK_KEY = 0x726f6c6c
+DEFAULT_PARTITION = 'measurement_default'
+
+
+def epoch_bucket(dialect_name, column, seconds):
+    """Returns SQL expression of the start of the bucket of given width containing timestamp column, in seconds since
+    epoch"""
+    if dialect_name == 'postgresql':
+        epoch = func.extract('epoch', column)
+        return cast(func.floor(epoch / seconds) * seconds, db.BigInteger)
+    epoch = cast(func.strftime('%s', column), db.Integer)
+    return epoch / seconds * seconds
+
+
+def _bucket_timestamp(dialect_name, column, seconds):
+    """Returns SQL expression of the start of the bucket containing timestamp column, as a timestamp"""
+    bucket = epoch_bucket(dialect_name, column, seconds)
+    if dialect_name == 'postgresql':
+        return func.timezone('UTC', func.to_timestamp(bucket))
+    # Same text format as SQLAlchemy stores SQLite datetimes, so that they compare correctly
+    return func.strftime('%Y-%m-%d %H:%M:%S.000000', bucket, 'unixepoch')
+
+
+def month_start(timestamp):
+    return datetime(timestamp.year, timestamp.month, 1)
+
+
+def next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'measurement_y{month.year}m{month.month:02d}'
+
+
+def get_partitions(connection):
+    """Returns dict of monthly partitions of measurement by month"""
+    rows = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = 'measurement'::regclass"
+    ))
+    partitions = {}
+    for name, in rows:
+        match = re.fullmatch(r'measurement_y(\d{4})m(\d{2})', name)
+        if match:
+            partitions[datetime(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def _disable_statement_timeout(connection):
+    """Lifts DATABASE_STATEMENT_TIMEOUT for the rest of the transaction, maintenance statements may run long"""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("SET LOCAL statement_timeout = 0"))
+
+
+def create_partition(connection, month):
+    """Creates partition of measurement for month, moving rows of the month out of the default partition"""
+    name = partition_name(month)
+    bounds = {'start': month, 'end': next_month(month)}
+    _disable_statement_timeout(connection)
+    # Readings of the month inserted after the move would make the attach fail, inserts wait until it commits
+    connection.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN SHARE ROW EXCLUSIVE MODE"))
+    connection.execute(text(f"CREATE TABLE {name} (LIKE measurement INCLUDING DEFAULTS)"))
+    connection.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), bounds)
+    connection.execute(text(f"ALTER TABLE measurement ATTACH PARTITION {name} FOR VALUES FROM (:start) TO (:end)"),
+                       bounds)
+
+
+def ensure_partitions(engine, now):
+    """Creates missing partitions from the current month up to PARTITION_PREMAKE_MONTHS months ahead"""
+    with engine.begin() as connection:
+        existing = get_partitions(connection)
+    month = month_start(now)
+    for _ in range(PARTITION_PREMAKE_MONTHS + 1):
+        if month not in existing:
+            with engine.begin() as connection:
+                create_partition(connection, month)
+            logger.info("Created partition %s", partition_name(month))
+        month = next_month(month)
+
+
+def _rollup(connection, table, *conditions):
+    """Inserts roll-ups of measurements of table matching conditions. Returns number of rolled up measurements."""
+    bucket = _bucket_timestamp(connection.dialect.name, table.c.timestamp, ROLLUP_BUCKET)
+    columns = [bucket, func.count()]
+    for field in ('inclination', 'temperature', 'density', 'battery'):
+        columns += [func.avg(table.c[field]), func.min(table.c[field]), func.max(table.c[field])]
+    columns += [table.c.id_sensor, table.c.id_event]
+    rollup = MeasurementRollup.__table__
+    statement = select(*columns).where(*conditions).group_by(bucket, table.c.id_sensor, table.c.id_event)
+    connection.execute(rollup.insert().from_select([
+        'timestamp', 'measurement_count',
+        'avg_inclination', 'min_inclination', 'max_inclination',
+        'avg_temperature', 'min_temperature', 'max_temperature',
+        'avg_density', 'min_density', 'max_density',
+        'avg_battery', 'min_battery', 'max_battery',
+        'id_sensor', 'id_event',
+    ], statement))
+    return connection.execute(select(func.count()).select_from(table).where(*conditions)).scalar()
+
+
+def _lock_for_compaction(connection, name):
+    """Makes readings inserted into table name wait until the end of the transaction, so that none is deleted without
+    being rolled up. Reads are not blocked. SQLite transactions are serialized once they write."""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(f"LOCK TABLE {name} IN EXCLUSIVE MODE"))
+
+
+def compact(engine, cutoff):
+    """Replaces raw measurements with timestamp before cutoff by roll-ups. On PostgreSQL cutoff must be the start of a
+    month, partitions before it are rolled up and dropped. Returns number of compacted measurements."""
+    table = Measurement.__table__
+    compacted = 0
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as connection:
+            partitions = get_partitions(connection)
+        for month, name in sorted(partitions.items()):
+            if next_month(month) > cutoff:
+                continue
+            with engine.begin() as connection:
+                _disable_statement_timeout(connection)
+                _lock_for_compaction(connection, name)
+                columns = [db.Column(column.name, column.type) for column in table.columns]
+                partition = db.Table(name, db.MetaData(), *columns)
+                count = _rollup(connection, partition)
+                connection.execute(text(f"DROP TABLE {name}"))
+                bump(connection, [Measurement.__tablename__, MeasurementRollup.__tablename__])
+            logger.info("Compacted %s measurements of partition %s", count, name)
+            compacted += count
+    # Rows outside monthly partitions, or every row on other databases
+    with engine.begin() as connection:
+        _disable_statement_timeout(connection)
+        # Only the default partition holds rows before cutoff once older partitions are dropped
+        _lock_for_compaction(connection, DEFAULT_PARTITION)
+        count = _rollup(connection, table, table.c.timestamp < cutoff)
+        connection.execute(delete(table).where(table.c.timestamp < cutoff))
+        if count:
+            bump(connection, [Measurement.__tablename__, MeasurementRollup.__tablename__])
+    compacted += count
+    return compacted
+
+
+def run_maintenance(engine, now=None):
+    """Creates upcoming partitions and compacts measurements older than the retention age"""
+    now = now or datetime.now()
+    if engine.dialect.name == 'postgresql':
+        ensure_partitions(engine, now)
+    if MEASUREMENT_RETENTION_DAYS:
+        compacted = compact(engine, month_start(now - timedelta(days=MEASUREMENT_RETENTION_DAYS)))
+        if compacted:
+            logger.info("Compacted %s measurements older than %s days", compacted, MEASUREMENT_RETENTION_DAYS)
+
+
+def run_exclusive(engine):
+    """Runs maintenance unless another process is running it. Returns whether it ran."""
+    if engine.dialect.name != 'postgresql':
+        run_maintenance(engine)
+        return True
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as lock:
+        if not lock.execute(text("SELECT pg_try_advisory_lock(:key)"), {'key': ADVISORY_LOCK_KEY}).scalar():
+            return False
+        try:
+            run_maintenance(engine)
+        finally:
+            lock.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': ADVISORY_LOCK_KEY})
+    return True
+
+
+class RetentionWorker(threading.Thread):
+    """Thread running partition maintenance and retention every RETENTION_INTERVAL seconds"""
+    def __init__(self, app):
+        super().__init__(name='retention-worker', daemon=True)
+        self.app = app
+
+    def run(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    run_exclusive(db.engine)
+                except Exception:
+                    logger.exception("Retention worker failed")
+            time.sleep(RETENTION_INTERVAL)
+
+
+def start_worker(app):
+    """Starts retention worker thread for app, unless disabled by configuration"""
+    if RETENTION_WORKER:
+        RetentionWorker(app).start()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    if not run_exclusive(create_engine(DATABASE_URI)):
+        print("Maintenance is already running")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,17 +2,54 @@ from flask import Flask
 from flask_cors import CORS
 
 from models import db
-from config import DATABASE_URI
+from config import DATABASE_URI, DEBUG, DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW, DATABASE_POOL_TIMEOUT, \
+    DATABASE_POOL_RECYCLE, DATABASE_POOL_PRE_PING, DATABASE_STATEMENT_TIMEOUT
+import recalibration
+import ingest_queue
+import listener
+import retention
+import lifecycle
+import metrics
+import live
+import replica
 
 
-def create_app():
+def get_engine_options():
+    """Returns SQLAlchemy engine options of connection pool configuration"""
+    if DATABASE_URI.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': DATABASE_POOL_SIZE,
+        'max_overflow': DATABASE_MAX_OVERFLOW,
+        'pool_timeout': DATABASE_POOL_TIMEOUT,
+        'pool_recycle': DATABASE_POOL_RECYCLE,
+        'pool_pre_ping': DATABASE_POOL_PRE_PING,
+    }
+    if DATABASE_STATEMENT_TIMEOUT:
+        options['connect_args'] = {'options': f'-c statement_timeout={DATABASE_STATEMENT_TIMEOUT}'}
+    return options
+
+
+def create_app(workers=True):
+    """Creates app. Sessions are scoped to the app context of each request, background workers push their own. Scripts
+    using the app only to reach the database pass workers=False, so that they do not start background workers nor bind
+    the ingest listener ports."""
     app = Flask(__name__)
-    CORS(app, resources={r"/*": {"origins": "*"}})
-    app.config['DEBUG'] = True
+    CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-Next-Cursor", "X-Recalibration-Job", "ETag"])
+    app.config['DEBUG'] = DEBUG
     app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URI
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = get_engine_options()
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['CORS_HEADERS'] = 'Content-Type'
-    app.app_context().push()
+    replica.init_app(app)
     db.init_app(app)
-    db.create_all()
+    metrics.init_app(app)
+    if not workers:
+        return app
+    recalibration.start_worker(app)
+    ingest_queue.start(app)
+    listener.start(app)
+    retention.start_worker(app)
+    lifecycle.start_worker(app)
+    live.start(app)
     return app
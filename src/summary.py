@@ -0,0 +1,175 @@
+"""Incrementally maintained per-event measurement summaries.
+
+Every event has an EventSummary row, updated in the same transaction as the measurements attached to it, so reading
+the current state of a fermentation does not scan its measurements. The fermentation rate is the slope of an
+exponentially weighted least squares fit of density over time, where a measurement's weight halves every
+SUMMARY_SLOPE_HALF_LIFE hours, so that it follows the recent trend and drops to zero when fermentation stalls.
+"""
+from collections import defaultdict
+
+from config import SUMMARY_SLOPE_HALF_LIFE
+from models import Measurement, MeasurementRollup, EventSummary
+from metrics import phase
+
+
+def _hours(delta):
+    return delta.total_seconds() / 3600
+
+
+def reset(summary):
+    """Sets summary as the summary of no measurement"""
+    summary.measurement_count = 0
+    summary.sum_density = summary.sum_temperature = 0
+    summary.first_timestamp = summary.last_timestamp = None
+    summary.first_density = summary.last_density = summary.min_density = summary.max_density = None
+    summary.first_temperature = summary.last_temperature = summary.min_temperature = summary.max_temperature = None
+    summary.slope_reference = None
+    summary.slope_weight = summary.slope_x = summary.slope_y = summary.slope_xx = summary.slope_xy = 0
+    return summary
+
+
+def fold(summary, timestamp, density, temperature):
+    """Adds a measurement to summary. Measurements may be folded in any timestamp order."""
+    summary.measurement_count += 1
+    summary.sum_density += density
+    summary.sum_temperature += temperature
+    if summary.first_timestamp is None or timestamp < summary.first_timestamp:
+        summary.first_timestamp = timestamp
+        summary.first_density = density
+        summary.first_temperature = temperature
+    if summary.last_timestamp is None or timestamp >= summary.last_timestamp:
+        summary.last_timestamp = timestamp
+        summary.last_density = density
+        summary.last_temperature = temperature
+    summary.min_density = density if summary.min_density is None else min(summary.min_density, density)
+    summary.max_density = density if summary.max_density is None else max(summary.max_density, density)
+    summary.min_temperature = temperature if summary.min_temperature is None \
+        else min(summary.min_temperature, temperature)
+    summary.max_temperature = temperature if summary.max_temperature is None \
+        else max(summary.max_temperature, temperature)
+    return _fold_slope(summary, timestamp, density, 1)
+
+
+def fold_rollup(summary, rollup):
+    """Adds roll-up of measurements to summary, as its count of measurements taken at the bucket start"""
+    count = rollup.measurement_count
+    summary.measurement_count += count
+    summary.sum_density += rollup.avg_density * count
+    summary.sum_temperature += rollup.avg_temperature * count
+    if summary.first_timestamp is None or rollup.timestamp < summary.first_timestamp:
+        summary.first_timestamp = rollup.timestamp
+        summary.first_density = rollup.avg_density
+        summary.first_temperature = rollup.avg_temperature
+    if summary.last_timestamp is None or rollup.timestamp >= summary.last_timestamp:
+        summary.last_timestamp = rollup.timestamp
+        summary.last_density = rollup.avg_density
+        summary.last_temperature = rollup.avg_temperature
+    summary.min_density = rollup.min_density if summary.min_density is None \
+        else min(summary.min_density, rollup.min_density)
+    summary.max_density = rollup.max_density if summary.max_density is None \
+        else max(summary.max_density, rollup.max_density)
+    summary.min_temperature = rollup.min_temperature if summary.min_temperature is None \
+        else min(summary.min_temperature, rollup.min_temperature)
+    summary.max_temperature = rollup.max_temperature if summary.max_temperature is None \
+        else max(summary.max_temperature, rollup.max_temperature)
+    return _fold_slope(summary, rollup.timestamp, rollup.avg_density, count)
+
+
+def _fold_slope(summary, timestamp, density, count):
+    """Adds count measurements of density at timestamp to regression sums"""
+    # Regression sums are relative to the latest timestamp, moving it forward shifts and decays previous sums
+    if summary.slope_reference is None:
+        summary.slope_reference = timestamp
+    x = _hours(timestamp - summary.slope_reference)
+    if x > 0:
+        decay = 2 ** (-x / SUMMARY_SLOPE_HALF_LIFE)
+        weight, sum_x = summary.slope_weight, summary.slope_x
+        summary.slope_xx = (summary.slope_xx - 2 * x * sum_x + x * x * weight) * decay
+        summary.slope_xy = (summary.slope_xy - x * summary.slope_y) * decay
+        summary.slope_x = (sum_x - x * weight) * decay
+        summary.slope_y *= decay
+        summary.slope_weight = weight * decay
+        summary.slope_reference = timestamp
+        x = 0
+    weight = count * 2 ** (x / SUMMARY_SLOPE_HALF_LIFE)
+    summary.slope_weight += weight
+    summary.slope_x += weight * x
+    summary.slope_y += weight * density
+    summary.slope_xx += weight * x * x
+    summary.slope_xy += weight * x * density
+    return summary
+
+
+def new_summary(measurements=()):
+    """Returns new summary of measurement objects"""
+    summary = reset(EventSummary())
+    for measurement in measurements:
+        fold(summary, measurement.timestamp, measurement.density, measurement.temperature)
+    return summary
+
+
+def _lock_summaries(session, event_ids):
+    """Returns dict of summaries of given events by event id, locked until the end of the transaction. Locks are taken
+    in event id order, so that concurrent transactions do not deadlock."""
+    summaries = EventSummary.query.filter(EventSummary.id_event.in_(event_ids))\
+        .order_by(EventSummary.id_event).with_for_update().all()
+    return {summary.id_event: summary for summary in summaries}
+
+
+def _fold_stored(session, summary):
+    """Folds every stored roll-up and measurement of summary's event, in timestamp order"""
+    rollups = MeasurementRollup.query.filter(MeasurementRollup.id_event == summary.id_event)\
+        .order_by(MeasurementRollup.timestamp, MeasurementRollup.id)
+    for rollup in rollups.yield_per(1000):
+        fold_rollup(summary, rollup)
+    measurements = session.query(Measurement.timestamp, Measurement.density, Measurement.temperature)\
+        .filter(Measurement.id_event == summary.id_event)\
+        .order_by(Measurement.timestamp, Measurement.id)
+    for timestamp, density, temperature in measurements.yield_per(1000):
+        fold(summary, timestamp, density, temperature)
+    return summary
+
+
+def update_summaries(session, measurements, stored=False):
+    """Folds measurements, given as dicts of column values, into the summaries of their events. Must be called before
+    the measurements are inserted, or after inserting them with stored set."""
+    by_event = defaultdict(list)
+    for measurement in measurements:
+        if measurement.get('id_event') is not None:
+            by_event[measurement['id_event']].append(measurement)
+    if not by_event:
+        return
+    with phase('summary'):
+        summaries = _lock_summaries(session, sorted(by_event))
+        for id_event, event_measurements in by_event.items():
+            summary = summaries.get(id_event)
+            if summary is None:
+                summary = _fold_stored(session, reset(EventSummary(id_event=id_event)))
+                session.add(summary)
+                if stored:
+                    continue
+            for measurement in event_measurements:
+                fold(summary, measurement['timestamp'], measurement['density'], measurement['temperature'])
+
+
+def rebuild_summary(session, id_event):
+    """Recomputes summary of event from its stored roll-ups and measurements"""
+    summary = _lock_summaries(session, [id_event]).get(id_event)
+    if summary is None:
+        summary = EventSummary(id_event=id_event)
+        session.add(summary)
+    return _fold_stored(session, reset(summary))
+
+
+def rebuild_sensor_summaries(session, id_sensor, window_start=None, window_end=None):
+    """Recomputes summaries of events with measurements or roll-ups of sensor in [window_start, window_end)"""
+    event_ids = set()
+    for table in (Measurement, MeasurementRollup):
+        events = session.query(table.id_event).filter(table.id_sensor == id_sensor).filter(table.id_event.isnot(None))
+        if window_start is not None:
+            events = events.filter(table.timestamp >= window_start)
+        if window_end is not None:
+            events = events.filter(table.timestamp < window_end)
+        event_ids.update(id_event for id_event, in events.distinct())
+    for id_event in sorted(event_ids):
+        rebuild_summary(session, id_event)
@@ -0,0 +1,19 @@
+"""Timestamps of processes, events, measurements and calibrations are naive datetimes in the server's local time, as
+set by datetime.now() when they are not given. Timestamps received with a UTC offset are converted to it, so that they
+compare correctly with stored ones; timestamps without an offset are taken as local time.
+
+Versions of resources are the exception, they are kept in UTC to be compared with HTTP dates.
+"""
+from flask_restful import inputs
+
+
+def to_local(value):
+    """Returns datetime as naive local time. Naive datetimes are returned unchanged."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone().replace(tzinfo=None)
+
+
+def local_datetime(value):
+    """Parses ISO 8601 datetime as naive local time"""
+    return to_local(inputs.datetime_from_iso8601(value))
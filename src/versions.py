@@ -0,0 +1,157 @@
+"""Per-resource version counters backing conditional GET and the response cache.
+
+Every transaction writing to a table bumps the table's row of resource_version right before it commits, so a version
+read by a request is never older than the data it reads afterwards. Tables written through the ORM unit of work are
+tracked automatically, bulk statements bypassing it must call touch. Callbacks registered with on_commit are told which
+tables each committed transaction wrote.
+
+Tables written by every reading are versioned by scope instead, per value of the columns in SCOPES, so that concurrent
+ingest transactions of different sensors do not update the same row, and responses of an event only change with the
+rows of that event. The version of such a table is the sum of the versions of its first scope column and of its own row,
+bumped by writes which do not know the scope of the rows they change.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, event, func, inspect, literal, or_, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import ResourceVersion
+
+
+_TOUCHED = 'touched_resources'
+_COMMITTED = 'committed_resources'
+
+# Columns versioning rows of a table separately. Every row has a value of the first one.
+SCOPES = {
+    'measurement': ('id_sensor', 'id_event'),
+    'measurement_rollup': ('id_sensor', 'id_event'),
+    'event_summary': ('id_event',),
+}
+
+_commit_callbacks = []
+
+
+def touch(session, *resources):
+    """Records that the current transaction of session writes to given resources: table names, or (table, column,
+    value) tuples of the rows of a scoped table with column equal to value"""
+    session.info.setdefault(_TOUCHED, set()).update(resources)
+
+
+def touch_rows(session, table, rows):
+    """Records that the current transaction of session writes given rows of table, mappings holding its scope columns"""
+    columns = SCOPES.get(table)
+    if not columns:
+        touch(session, table)
+        return
+    touch(session, *{(table, column, row[column]) for row in rows for column in columns if row[column] is not None})
+
+
+def is_written(session):
+    """Returns whether the current transaction of session writes to a table, whether flushed or not"""
+    return bool(session.info.get(_TOUCHED) or session.new or session.dirty or session.deleted)
+
+
+def get_table(resource):
+    """Returns table name of resource"""
+    return resource if isinstance(resource, str) else resource[0]
+
+
+def _get_key(resource):
+    """Returns primary key of the resource_version row of resource"""
+    return (resource, '', 0) if isinstance(resource, str) else resource
+
+
+def bump(connection, resources):
+    """Increments versions of given resources using connection"""
+    table = ResourceVersion.__table__
+    insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.resource, table.c.scope, table.c.scope_id],
+        set_={'version': table.c.version + 1, 'modified': statement.excluded.modified}
+    )
+    modified = datetime.utcnow()
+    # Sorted so that concurrent transactions lock version rows in the same order
+    connection.execute(statement, [
+        {'resource': resource, 'scope': scope, 'scope_id': scope_id, 'version': 1, 'modified': modified}
+        for resource, scope, scope_id in sorted(set(map(_get_key, resources)))
+    ])
+
+
+def on_commit(callback):
+    """Registers callback called with the set of tables written by every transaction committed in this process. It
+    runs inside commit, so it must return quickly."""
+    _commit_callbacks.append(callback)
+
+
+def _version_condition(resource):
+    """Returns condition selecting the resource_version rows summed into the version of resource"""
+    table = ResourceVersion.__table__
+    name, scope, scope_id = _get_key(resource)
+    if scope:
+        scoped = and_(table.c.scope == scope, table.c.scope_id == scope_id)
+    elif name in SCOPES:
+        scoped = table.c.scope == SCOPES[name][0]
+    else:
+        return and_(table.c.resource == name, table.c.scope == '')
+    return and_(table.c.resource == name, or_(table.c.scope == '', scoped))
+
+
+def get_versions(session, resources):
+    """Returns dict of (version, modified) by resource. Resources never written have version 0 and no modified time."""
+    resources = list(dict.fromkeys(resources))
+    if not resources:
+        return {}
+    table = ResourceVersion.__table__
+    statement = union_all(*[
+        select(literal(index), func.sum(table.c.version), func.max(table.c.modified))
+        .where(_version_condition(resource))
+        for index, resource in enumerate(resources)
+    ])
+    versions = {}
+    for index, version, modified in session.execute(statement):
+        versions[resources[index]] = (int(version or 0), modified)
+    return versions
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    resources = set()
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        table = instance.__table__.name
+        columns = SCOPES.get(table)
+        if not columns:
+            resources.add(table)
+            continue
+        state = inspect(instance)
+        for column in columns:
+            # Rows moved to another scope change both
+            values = state.attrs[column].history.sum() or [getattr(instance, column)]
+            resources.update((table, column, value) for value in values if value is not None)
+    if resources:
+        touch(session, *resources)
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_touched(session):
+    # Pending changes are flushed here, otherwise they would only be flushed after this hook
+    session.flush()
+    resources = session.info.pop(_TOUCHED, None)
+    if resources:
+        bump(session.connection(), resources)
+        session.info[_COMMITTED] = {get_table(resource) for resource in resources}
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_committed(session):
+    resources = session.info.pop(_COMMITTED, None)
+    if resources:
+        for callback in _commit_callbacks:
+            callback(resources)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_touched(session):
+    session.info.pop(_TOUCHED, None)
+    session.info.pop(_COMMITTED, None)
@@ -0,0 +1,47 @@
+"""Test configuration. Tests run against a SQLite database created from the models in a temporary directory. Settings
+are read from the environment when modules are imported, so they are set here first.
+"""
+import os
+import sys
+import tempfile
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SOURCE_DIRECTORY)
+
+DATABASE_DIRECTORY = tempfile.mkdtemp(prefix='cervejeiro-tests-')
+os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(DATABASE_DIRECTORY, 'test.sqlite')}"
+
+import pytest  # noqa: E402
+from flask_restful import Api  # noqa: E402
+
+from models import db  # noqa: E402
+from cache import sensor_context_cache, response_cache  # noqa: E402
+from setup import create_app  # noqa: E402
+from api import add_resources  # noqa: E402
+import migrate  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    """App serving the API, without background workers"""
+    app = create_app(workers=False)
+    add_resources(Api(app))
+    return app
+
+
+@pytest.fixture
+def session(app):
+    """Session of an empty database, in an app context"""
+    with app.app_context():
+        db.drop_all()
+        migrate.migrate(db.engine)
+        # Versions start over with the tables, so cached entries could be taken as current
+        sensor_context_cache.clear()
+        response_cache.clear()
+        yield db.session
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app, session):
+    return app.test_client()
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from models import Event, EventSummary, MeasurementRollup
+from ingest import create_sensor, parse_reading, store_measurements
+from test_ingest import add_event, reading
+
+
+def add_rollup(session, id_sensor, id_event):
+    session.add(MeasurementRollup(
+        timestamp=datetime(2030, 1, 1, 12), measurement_count=10, id_sensor=id_sensor, id_event=id_event,
+        avg_inclination=60, min_inclination=55, max_inclination=65, avg_temperature=19, min_temperature=18,
+        max_temperature=20, avg_density=1.05, min_density=1.04, max_density=1.06, avg_battery=3900, min_battery=3890,
+        max_battery=3910))
+
+
+def test_missing_summary_is_rebuilt_from_rollups_and_measurements_and_saved(session, client):
+    id_sensor = create_sensor(session, 'AA:BB:CC:DD:EE:FF')
+    id_event = add_event(session, id_sensor)
+    add_rollup(session, id_sensor, id_event)
+    store_measurements(session, [parse_reading(reading('2030-01-02T00:00:00'))])
+    session.get(Event, id_event).finish = datetime(2030, 1, 3)
+    session.commit()
+    expected = client.get(f'/events/{id_event}/summary').get_json()
+    session.query(EventSummary).delete()
+    session.commit()
+
+    response = client.get(f'/events/{id_event}/summary')
+    assert response.status_code == 200
+    assert response.get_json() == expected
+    assert response.get_json()['measurement_count'] == 11
+    assert session.query(EventSummary).count() == 1
+
+
+def test_process_summaries_include_events_without_summary(session, client):
+    id_sensor = create_sensor(session, 'AA:BB:CC:DD:EE:FF')
+    id_event = add_event(session, id_sensor)
+    add_rollup(session, id_sensor, id_event)
+    session.query(EventSummary).delete()
+    session.commit()
+
+    summaries = client.get('/processes/1/summaries').get_json()
+    assert [(summary['id_event'], summary['measurement_count']) for summary in summaries] == [(id_event, 10)]
+    assert session.query(EventSummary).count() == 1
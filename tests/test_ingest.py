@@ -0,0 +1,116 @@
+import io
+import json
+from datetime import datetime
+
+from models import Sensor, Measurement, Event, EventType, Process
+from ingest import create_sensor, insert_measurements, parse_reading, store_measurements
+from importer import import_readings, read_readings
+
+
+def reading(timestamp, mac_address='aa:bb:cc:dd:ee:ff', inclination=10):
+    return {'sensor_mac_address': mac_address, 'inclination': inclination, 'temperature': 20, 'battery': 3900,
+            'timestamp': timestamp}
+
+
+def add_event(session, id_sensor):
+    session.add(Process(id=1, name='IPA'))
+    event = Event(name='Fermentation', start=datetime(2030, 1, 1), event_type=EventType.SENSOR, id_process=1,
+                  id_sensor=id_sensor)
+    session.add(event)
+    session.commit()
+    return event.id
+
+
+def test_create_sensor_returns_existing_sensor(session):
+    id_sensor = create_sensor(session, 'AA:BB:CC:DD:EE:FF')
+    assert create_sensor(session, 'AA:BB:CC:DD:EE:FF') == id_sensor
+    session.commit()
+    assert session.query(Sensor).count() == 1
+
+
+def test_insert_measurements_skips_stored_and_repeated_readings(session):
+    id_sensor = create_sensor(session, 'AA:BB:CC:DD:EE:FF')
+
+    def measurement(timestamp, inclination):
+        return {'inclination': inclination, 'temperature': 20, 'density': 1, 'battery': 3900, 'timestamp': timestamp,
+                'id_sensor': id_sensor, 'id_event': None}
+
+    first = insert_measurements(session, [measurement(datetime(2030, 1, 1), 10)])
+    inserted = insert_measurements(session, [
+        measurement(datetime(2030, 1, 1), 11),
+        measurement(datetime(2030, 1, 2), 12),
+        measurement(datetime(2030, 1, 2), 13),
+    ])
+    session.commit()
+    assert [row['inclination'] for row in first] == [10]
+    assert [(row['timestamp'], row['inclination']) for row in inserted] == [(datetime(2030, 1, 2), 12)]
+    assert inserted[0]['id'] is not None
+    assert session.query(Measurement).count() == 2
+
+
+def test_store_measurements_folds_only_inserted_readings_into_summary(session):
+    id_event = add_event(session, create_sensor(session, 'AA:BB:CC:DD:EE:FF'))
+    readings = [parse_reading(reading(f'2030-01-02T00:0{minute}:00')) for minute in range(3)]
+    assert len(store_measurements(session, readings)) == 3
+    session.commit()
+    assert len(store_measurements(session, readings[1:] + [parse_reading(reading('2030-01-02T00:05:00'))])) == 1
+    session.commit()
+    summary = session.get(Event, id_event).summary
+    assert summary.measurement_count == 4
+    assert session.query(Measurement).filter(Measurement.id_event == id_event).count() == 4
+
+
+def test_post_of_stored_reading_returns_stored_measurement(client):
+    created = client.post('/measurements/', json=reading('2030-01-01T00:00:00'))
+    retried = client.post('/measurements/', json=reading('2030-01-01T00:00:00', mac_address='AA-BB-CC-DD-EE-FF',
+                                                         inclination=11))
+    assert created.status_code == 201
+    assert retried.status_code == 200
+    assert retried.json == created.json
+    assert len(client.get('/measurements/').json) == 1
+    assert [sensor['mac_address'] for sensor in client.get('/sensors/').json] == ['AA:BB:CC:DD:EE:FF']
+
+
+def test_post_of_reading_with_non_finite_value_is_rejected(client):
+    for value in ('NaN', 'Infinity', '-Infinity'):
+        body = json.dumps(reading('2030-01-01T00:00:00')).replace('"temperature": 20', f'"temperature": {value}')
+        response = client.post('/measurements/', data=body, content_type='application/json')
+        assert response.status_code == 400
+    assert client.get('/measurements/').json == []
+
+
+def test_batch_counts_duplicates(client):
+    client.post('/measurements/', json=reading('2030-01-01T00:00:00'))
+    response = client.post('/measurements/batch', json=[
+        reading('2030-01-01T00:00:00'),
+        reading('2030-01-01T00:01:00'),
+        reading('2030-01-01T00:01:00'),
+        reading('2030-01-01T00:02:00', mac_address='11:22:33:44:55:66'),
+    ])
+    assert response.status_code == 201
+    assert response.json == {'created': 2, 'duplicates': 2, 'errors': []}
+
+
+def test_import_skips_stored_readings(session):
+    csv = "sensor_mac_address,inclination,temperature,battery,timestamp\n" \
+          "aa:bb:cc:dd:ee:ff,10,20,3900,2030-01-01T00:00:00\n" \
+          "AA:BB:CC:DD:EE:FF,10,20,3900,2030-01-01T00:00:00\n" \
+          "aa:bb:cc:dd:ee:ff,10,20,3900,2030-01-01T01:00:00\n"
+    readings, errors = read_readings(io.StringIO(csv))
+    assert errors == []
+    assert import_readings(session, readings) == 2
+    session.commit()
+    assert import_readings(session, readings) == 0
+    session.commit()
+    assert session.query(Measurement).count() == 2
+    assert session.query(Sensor).count() == 1
+
+
+def test_import_rejects_rows_with_more_fields_than_header(client):
+    csv = "sensor_mac_address,inclination,temperature,battery,timestamp\n" \
+          "aa:bb:cc:dd:ee:ff,10,20,3900,2030-01-01T00:00:00,extra\n" \
+          "aa:bb:cc:dd:ee:ff,10,20,3900,2030-01-01T01:00:00\n"
+    response = client.post('/measurements/import', data=csv, content_type='text/csv')
+    assert response.status_code == 201
+    assert response.json == {'created': 1, 'duplicates': 0,
+                             'errors': [{'line': 2, 'message': 'row has more fields than the header'}]}
@@ -0,0 +1,63 @@
+import pytest
+
+from models import Measurement
+from ingest import parse_reading
+from ingest_queue import IngestQueue, Spool
+
+
+def reading(second):
+    return parse_reading({'sensor_mac_address': 'aa:bb:cc:dd:ee:ff', 'inclination': 10, 'temperature': 20,
+                          'battery': 3900, 'timestamp': f'2030-01-01T00:00:{second:02d}'})
+
+
+def failing(*args, **kwargs):
+    raise OSError('disk full')
+
+
+def test_group_is_queued_again_when_spool_can_not_be_committed(session, tmp_path, monkeypatch):
+    queue = IngestQueue(maxsize=10, flush_rows=2, flush_interval=0, spool=Spool(str(tmp_path)))
+    queue.put(reading(1))
+    queue.put(reading(2))
+    with monkeypatch.context() as patch:
+        patch.setattr(queue.spool, 'commit', failing)
+        with pytest.raises(OSError):
+            queue.flush(session)
+    assert len(queue) == 2
+    queue.flush(session)
+    assert len(queue) == 0
+    assert session.query(Measurement).count() == 2
+    assert queue.spool.pending() == []
+
+
+def test_spool_stays_writable_when_compaction_fails(session, tmp_path, monkeypatch):
+    queue = IngestQueue(maxsize=1, flush_rows=1, flush_interval=0, spool=Spool(str(tmp_path)))
+    queue.put(reading(1))
+    queue.spool.appended = 2
+    replace = Spool._replace
+
+    def replace_committed(path, content):
+        if path != queue.spool.committed_path:
+            failing()
+        replace(path, content)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(Spool, '_replace', staticmethod(replace_committed))
+        with pytest.raises(OSError):
+            queue.flush(session)
+    assert len(queue) == 1
+    queue.flush(session)
+    queue.put(reading(2))
+    assert [entry['timestamp'].second for _, entry in queue.spool.pending()] == [2]
+    assert session.query(Measurement).count() == 1
+
+
+def test_group_is_queued_again_when_storing_fails(session, monkeypatch):
+    queue = IngestQueue(maxsize=10, flush_rows=10, flush_interval=0)
+    queue.put(reading(1))
+    with monkeypatch.context() as patch:
+        patch.setattr(IngestQueue, '_store', failing)
+        with pytest.raises(OSError):
+            queue.flush(session)
+    assert len(queue) == 1
+    queue.flush(session)
+    assert session.query(Measurement).count() == 1
@@ -0,0 +1,64 @@
+import math
+from datetime import datetime
+
+import pytest
+
+from ingest import ReadingError
+from listener import FRAME, decode_frame, decode_frames
+from models import Sensor
+
+
+MAC_ADDRESS = bytes.fromhex('aabbccddeeff')
+
+
+def test_decode_frame():
+    timestamp = int(datetime(2030, 1, 1, 12, 30).timestamp())
+    reading = decode_frame(*FRAME.unpack(FRAME.pack(MAC_ADDRESS, 60.5, 19.25, 3900, timestamp)))
+    assert reading == {
+        'sensor_mac_address': 'AA:BB:CC:DD:EE:FF',
+        'inclination': 60.5,
+        'temperature': 19.25,
+        'battery': 3900.0,
+        'timestamp': datetime(2030, 1, 1, 12, 30),
+    }
+
+
+def test_decode_frame_without_timestamp():
+    reading = decode_frame(MAC_ADDRESS, 60.5, 19.25, 3900, 0)
+    assert 'timestamp' not in reading
+
+
+@pytest.mark.parametrize('inclination, temperature', [
+    (math.nan, 20),
+    (10, math.inf),
+    (-math.inf, 20),
+])
+def test_decode_frame_rejects_non_finite_values(inclination, temperature):
+    with pytest.raises(ReadingError):
+        decode_frame(MAC_ADDRESS, inclination, temperature, 3900, 0)
+
+
+def test_decode_frames():
+    data = FRAME.pack(MAC_ADDRESS, 10, 20, 3900, 0) \
+        + FRAME.pack(MAC_ADDRESS, math.nan, 20, 3900, 0) \
+        + FRAME.pack(bytes.fromhex('0102030405a6'), 11, 21, 4000, 0)
+    readings, invalid, remainder = decode_frames(data + b'\x01\x02\x03')
+    assert [reading['sensor_mac_address'] for reading in readings] == ['AA:BB:CC:DD:EE:FF', '01:02:03:04:05:A6']
+    assert invalid == 1
+    assert remainder == 3
+
+
+def test_decode_frames_of_partial_frame():
+    assert decode_frames(FRAME.pack(MAC_ADDRESS, 10, 20, 3900, 0)[:10]) == ([], 0, 10)
+
+
+@pytest.mark.parametrize('mac_address', ['aa:bb:cc:dd:ee:ff', 'AA-BB-CC-DD-EE-FF', 'aA:bB:cC:dD:eE:fF'])
+def test_mac_addresses_are_normalized(mac_address):
+    assert Sensor.valid_mac_address(mac_address) == 'AA:BB:CC:DD:EE:FF'
+    assert Sensor(mac_address=mac_address).mac_address == 'AA:BB:CC:DD:EE:FF'
+
+
+@pytest.mark.parametrize('mac_address', ['aa:bb:cc:dd:ee', 'aa:bb:cc:dd:ee:fg', 'aabbccddeeff'])
+def test_invalid_mac_addresses_are_rejected(mac_address):
+    with pytest.raises(ValueError):
+        Sensor.valid_mac_address(mac_address)
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+from models import db, Measurement
+from ingest import create_sensor, parse_reading, store_measurements
+from live import Broker, Poller
+import live
+from test_ingest import reading
+
+
+def test_poller_publishes_measurements_committed_after_subscription_started(app, session, monkeypatch):
+    monkeypatch.setattr(live, 'broker', Broker())
+    create_sensor(session, 'AA:BB:CC:DD:EE:FF')
+    store_measurements(session, [parse_reading(reading('2030-01-01T00:00:00'))])
+    session.commit()
+    # Stream replays up to last_id, then a measurement is committed before the idle poller takes its baseline
+    last_id = session.query(db.func.max(Measurement.id)).scalar()
+    subscription = live.broker.subscribe(('sensor', 1), last_id)
+    store_measurements(session, [parse_reading(reading('2030-01-01T00:01:00'))])
+    session.commit()
+
+    Poller(app).poll(session)
+    messages = subscription.get(0)
+    assert [(kind, row.timestamp) for kind, row in messages] == [('measurement', datetime(2030, 1, 1, 0, 1))]
@@ -0,0 +1,115 @@
+from datetime import datetime
+
+import pytest
+from flask_restful import fields, marshal
+
+from models import Process, Event, EventType, Sensor, DensityCalibration, Measurement, RecalibrationJob, \
+    RecalibrationStatus
+from summary import new_summary
+from api.serializers import get_serializer, serialize
+from api import density_calibration_endpoint, event_endpoint, event_summary_endpoint, measurement_endpoint, \
+    process_endpoint, recalibration_job_endpoint, sensor_endpoint
+
+
+def build_process():
+    """Returns transient process with an event of a sensor with measurements and calibrations"""
+    sensor = Sensor(id=1, mac_address='AA:BB:CC:DD:EE:FF')
+    sensor.calibrations = [
+        DensityCalibration(id=1, coefficient=0.0017, offset=0.95, timestamp=datetime(2024, 1, 1), id_sensor=1),
+    ]
+    event = Event(id=1, name='Fermentation', start=datetime(2024, 1, 2, 8, 30), finish=None, duration=0,
+                  event_type=EventType.SENSOR, id_process=1, id_sensor=1)
+    event.measurements = [
+        Measurement(id=1, inclination=60.5, temperature=19.25, density=1.05, battery=3900,
+                    timestamp=datetime(2024, 1, 2, 9, 0, 0, 123456), id_sensor=1, id_event=1),
+        Measurement(id=2, inclination=58, temperature=19, density=1.04, battery=3899,
+                    timestamp=datetime(2024, 1, 2, 9, 15), id_sensor=1, id_event=1),
+    ]
+    process = Process(id=1, name='IPA', description=None)
+    process.events = [event]
+    return process, event, sensor
+
+
+SERIALIZERS = {
+    'process': process_endpoint.instance_serializer,
+    'process_detailed': process_endpoint.detailed_serializer,
+    'event': event_endpoint.instance_serializer,
+    'event_detailed': event_endpoint.detailed_serializer,
+    'sensor': sensor_endpoint.instance_serializer,
+    'sensor_detailed': sensor_endpoint.detailed_serializer,
+    'measurement': measurement_endpoint.instance_serializer,
+    'calibration': density_calibration_endpoint.instance_serializer,
+}
+
+
+def get_instance(name):
+    process, event, sensor = build_process()
+    instances = {
+        'process': process,
+        'event': event,
+        'sensor': sensor,
+        'measurement': event.measurements[0],
+        'calibration': sensor.calibrations[0],
+    }
+    return instances[name.split('_')[0]]
+
+
+@pytest.mark.parametrize('name', sorted(SERIALIZERS))
+def test_endpoint_serializers_equal_marshal(name):
+    instance = get_instance(name)
+    assert serialize(instance, SERIALIZERS[name]) == marshal(instance, SERIALIZERS[name])
+
+
+@pytest.mark.parametrize('name', sorted(SERIALIZERS))
+def test_lists_equal_marshal(name):
+    instances = [get_instance(name), get_instance(name)]
+    assert serialize(instances, SERIALIZERS[name]) == marshal(instances, SERIALIZERS[name])
+
+
+def test_missing_values_equal_marshal():
+    event = Event(id=2, name='Empty', start=datetime(2024, 1, 1), event_type=EventType.NORMAL, id_process=1)
+    serializer = event_endpoint.detailed_serializer
+    assert serialize(event, serializer) == marshal(event, serializer)
+    assert serialize({}, serializer) == marshal({}, serializer)
+
+
+def test_summary_equals_marshal():
+    _, event, _ = build_process()
+    summary = new_summary(event.measurements)
+    summary.id_event = event.id
+    serializer = event_summary_endpoint.instance_serializer
+    assert serialize(summary, serializer) == marshal(summary, serializer)
+
+
+def test_recalibration_job_equals_marshal():
+    job = RecalibrationJob(id=1, id_sensor=1, window_start=datetime(2024, 1, 1), window_end=None,
+                           status=RecalibrationStatus.FAILED, updated_rows=10, error='failed',
+                           created=datetime(2024, 1, 1, 12), started=None, finished=None)
+    serializer = recalibration_job_endpoint.instance_serializer
+    assert serialize(job, serializer) == marshal(job, serializer)
+
+
+def test_dicts_equal_marshal():
+    measurement = {'id': 1, 'inclination': 10, 'temperature': '20.5', 'density': None, 'battery': 3.7,
+                   'timestamp': datetime(2024, 1, 1), 'id_sensor': None}
+    serializer = measurement_endpoint.instance_serializer
+    assert serialize(measurement, serializer) == marshal(measurement, serializer)
+
+
+def test_fields_without_compiled_formatter_equal_marshal():
+    serializer = {
+        'id': fields.Integer,
+        'start': fields.DateTime(dt_format='rfc822'),
+        'label': fields.FormattedString('{name} #{id}'),
+        'sensor': fields.String(attribute='sensor.mac_address'),
+        'process': {'name': fields.String(attribute='name'), 'type': fields.String(attribute='event_type')},
+        'names': fields.List(fields.String, attribute='tags'),
+    }
+    event = {'id': 1, 'name': 'IPA', 'start': datetime(2024, 1, 1), 'sensor': {'mac_address': 'AA:BB:CC:DD:EE:FF'},
+             'event_type': 'SENSOR', 'tags': ['a', 'b']}
+    assert serialize(event, serializer) == marshal(event, serializer)
+
+
+def test_compiled_serializers_are_reused():
+    serializer = measurement_endpoint.instance_serializer
+    assert get_serializer(serializer) is get_serializer(dict(serializer))